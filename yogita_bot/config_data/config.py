@@ -2,8 +2,8 @@ import os
 from dotenv import load_dotenv, find_dotenv
 
 
-# Настройки базы данных
-DB_PATH = os.path.join(os.path.dirname(__file__), '..', 'database.db')
+# Настройки базы данных (DB_PATH - другой файл, например копия для замеров tools/bench.py)
+DB_PATH = os.getenv('DB_PATH', os.path.join(os.path.dirname(__file__), '..', 'database.db'))
 
 # Настройки логирования
 LOG_PATH = os.path.join(os.path.dirname(__file__), '..', 'bot.log')
@@ -12,10 +12,11 @@ BACKUP_COUNT = 3  # Количество резервных копий лого
 
 TARGET_URL = "https://yogita.ru"
 
-if not find_dotenv():
-    exit("Переменные окружения не загружены, так как отсутствует файл .env")
-else:
+# Без файла .env переменные берутся из окружения процесса (BOT_TOKEN обязателен)
+if find_dotenv():
     load_dotenv()
+elif os.getenv('BOT_TOKEN') is None:
+    exit("Переменные окружения не загружены, так как отсутствует файл .env")
 
 
 BOT_TOKEN = os.getenv('BOT_TOKEN')
@@ -25,6 +26,80 @@ if BOT_TOKEN is None:
 
 ADMIN_CHAT_ID = os.getenv('ADMIN_CHAT_ID')  # ID админа для уведомлений
 
+# Другой сервер Bot API вместо https://api.telegram.org: локальный telegram-bot-api
+# или тестовый сервер tools/fake_api.py (нагрузочные проверки без сети), например http://127.0.0.1:8081
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')
+
+# Настройки соединений SQLite (у каждого потока свое соединение с этими параметрами)
+DB_JOURNAL_MODE = os.getenv('DB_JOURNAL_MODE', 'wal')  # wal - чтение не ждет записи заявок
+DB_SYNCHRONOUS = os.getenv('DB_SYNCHRONOUS', 'normal')  # normal - без fsync на каждую транзакцию в WAL
+DB_CACHE_SIZE = int(os.getenv('DB_CACHE_SIZE', -64000))  # Кэш страниц: < 0 - в KB (64 MB), > 0 - в страницах
+DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', 256 * 1024 * 1024))  # Чтение через mmap, байт (0 - выключено)
+DB_BUSY_TIMEOUT = float(os.getenv('DB_BUSY_TIMEOUT', 5))  # Секунд ожидания блокировки записи
+
+# Учет запросов к DB (models.db): медленные запросы и N+1 в пределах одного обновления
+DB_SLOW_QUERY_MS = float(os.getenv('DB_SLOW_QUERY_MS', 100))  # Запрос дольше - предупреждение в логе (0 - без предупреждений)
+DB_REPEAT_LIMIT = int(os.getenv('DB_REPEAT_LIMIT', 0))  # Один вид запроса больше N раз за обновление - предупреждение N+1 (0 - не проверять; для отладки и замеров)
+
+# Уровни логирования и фоновая запись лога (utils/logs.py; файл и ротация - LOG_PATH, MAX_LOG_SIZE выше)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')  # Уровень корневого логгера
+LOG_LEVELS = os.getenv('LOG_LEVELS', '')  # Уровни модулей, например 'models=WARNING,handlers=DEBUG'
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))  # Записей в очереди записи (при переполнении новые отбрасываются)
+LOG_DEBUG_RATE = int(os.getenv('LOG_DEBUG_RATE', 10))  # DEBUG-записей в секунду с одного места в коде
+LOG_DEBUG_SAMPLE = int(os.getenv('LOG_DEBUG_SAMPLE', 100))  # Сверх LOG_DEBUG_RATE пишется каждая N-я (0 - ни одной)
+
+# Режим запуска: polling - опрос getUpdates, webhook - прием обновлений HTTP-сервером,
+# async - опрос и отправка через AsyncTeleBot (asyncio),
+# sharded - супервизор раздает обновления нескольким процессам по chat_id
+RUN_MODE = os.getenv('RUN_MODE', 'polling')
+
+# Настройки webhook
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # Публичный адрес для setWebhook (пусто - не регистрировать)
+WEBHOOK_HOST = os.getenv('WEBHOOK_HOST', '127.0.0.1')  # Только локальные запросы (за обратным прокси); 0.0.0.0 - прием напрямую
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', 8443))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', '/webhook')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')  # Сверяется с X-Telegram-Bot-Api-Secret-Token (обязателен при WEBHOOK_URL)
+WEBHOOK_SSL_CERT = os.getenv('WEBHOOK_SSL_CERT')  # Сертификат и ключ, если HTTPS без прокси
+WEBHOOK_SSL_KEY = os.getenv('WEBHOOK_SSL_KEY')
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', 4))  # Потоки обработки обновлений
+WEBHOOK_QUEUE_SIZE = int(os.getenv('WEBHOOK_QUEUE_SIZE', 1000))  # Максимум обновлений в очереди
+
+# Настройки режима async
+ASYNC_WORKERS = int(os.getenv('ASYNC_WORKERS', 8))  # Потоки для синхронных обработчиков и запросов к DB
+
+# Настройки режима sharded (источник обновлений - webhook при заданном WEBHOOK_URL, иначе getUpdates)
+SHARD_WORKERS = int(os.getenv('SHARD_WORKERS', os.cpu_count() or 2))  # Процессы-обработчики
+SHARD_QUEUE_SIZE = int(os.getenv('SHARD_QUEUE_SIZE', 5000))  # Максимум обновлений в очередях процессов
+
+# Очередь исходящих сообщений (лимиты Telegram); в режиме async не используется
+OUTBOUND_QUEUE = os.getenv('OUTBOUND_QUEUE', '1') == '1'  # 0 - отправка напрямую из обработчиков
+OUTBOUND_GLOBAL_RATE = float(os.getenv('OUTBOUND_GLOBAL_RATE', 30))  # Сообщений в секунду на бота
+OUTBOUND_CHAT_RATE = float(os.getenv('OUTBOUND_CHAT_RATE', 1))  # Сообщений в секунду на чат
+OUTBOUND_CHAT_BURST = int(os.getenv('OUTBOUND_CHAT_BURST', 3))  # Сообщений в чат подряд без ожидания
+OUTBOUND_WORKERS = int(os.getenv('OUTBOUND_WORKERS', 4))  # Потоки отправки
+
+# Уведомления администратору о заявках: фоновая отправка с повторами
+ADMIN_OUTBOX_INTERVAL = float(os.getenv('ADMIN_OUTBOX_INTERVAL', 5.0))  # Секунд между проверками очереди
+ADMIN_OUTBOX_MAX_BACKOFF = int(os.getenv('ADMIN_OUTBOX_MAX_BACKOFF', 3600))  # Максимальная пауза между повторами
+
+# Хранилище состояний диалогов: sqlite - таблица BotState (переживает перезапуск), memory - только в памяти
+STATE_STORAGE = os.getenv('STATE_STORAGE', 'sqlite')
+STATE_FLUSH_INTERVAL = float(os.getenv('STATE_FLUSH_INTERVAL', 1.0))  # Секунд между записями в DB
+STATE_FLUSH_BATCH = int(os.getenv('STATE_FLUSH_BATCH', 200))  # Изменений, после которых запись идет сразу
+STATE_CACHE_SIZE = int(os.getenv('STATE_CACHE_SIZE', 10000))  # Состояний в памяти
+
+# Реестр пользователей: профилей в памяти (повторный /start без записи в DB)
+USER_CACHE_SIZE = int(os.getenv('USER_CACHE_SIZE', 10000))
+
+# Журнал визитов (таблица Date): пакетная запись в фоне
+VISIT_FLUSH_INTERVAL = float(os.getenv('VISIT_FLUSH_INTERVAL', 5.0))  # Секунд между записями в DB
+VISIT_FLUSH_BATCH = int(os.getenv('VISIT_FLUSH_BATCH', 500))  # Визитов, после которых запись идет сразу
+
+# Метрики обработчиков: HTTP-страница в формате Prometheus (/metrics) и сводка в логе
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 0))  # 0 - страница метрик выключена
+METRICS_LOG_INTERVAL = float(os.getenv('METRICS_LOG_INTERVAL', 300))  # Секунд между сводками (0 - без сводок)
+
 DATE_FORMAT = "%d.%m.%Y %H:%M:%S"
 
 
@@ -67,6 +142,7 @@ DEFAULT_COMMANDS = (
     ("help", "Помощь"),
 )
 
-CANCEL = ['Отмена', 'отмена', 'ОТМЕНА', 'cancel', 'Cancel', 'CANCEL', '/cancel']
+# Множества - проверка "text in CANCEL" не перебирает список (сравнение с text.lower())
+CANCEL = frozenset({'Отмена', 'отмена', 'ОТМЕНА', 'cancel', 'Cancel', 'CANCEL', '/cancel'})
 
-COMMANDS = ['/menu', '/start', 'Назад', 'Назад в меню']
+COMMANDS = frozenset({'/menu', '/start', 'Назад', 'Назад в меню'})
@@ -1,11 +1,25 @@
-from telebot.types import Message, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
+from telebot.types import Message
 
 from loader import bot
-from models import (User, Date, Orders, Menu, Price, PriceDetail, Contacts,
-                    Events, Mentors, Retreats, Reviews, Programs, FAQ)
-
-from peewee import DoesNotExist
-import re
+from models import (db, User, Orders, Menu, Price, Contacts,
+                    Events, Mentors, Retreats, Reviews, FAQ)
+from utils.catalog import get_catalog, reload_catalog, MenuRow, FAQRow
+from utils.dispatch import text_in
+from keyboards.reply import (create_keyboard, main_menu_keyboard, faq_keyboard, program_keyboard,
+                             section_order_keyboard, REMOVE_KEYBOARD, ORDER_PHONE_KEYBOARD,
+                             PROGRAM_ORDER_PHONE_KEYBOARD, CANCEL_KEYBOARD, COMMENT_KEYBOARD,
+                             SERVICE_KEYBOARD, FAQ_ANSWER_KEYBOARD)
+from utils.render_cache import render_cache, RenderedResponse
+from utils.admin_outbox import admin_outbox
+from utils.media import send_cached_photo
+from utils.phone import is_valid_phone, normalize_phone, customer_orders
+from utils.users import user_registry
+from utils.visits import visit_log
+from utils.routes import (resolve_route, ROUTE_ORDER, ROUTE_MAIN_MENU, ROUTE_BACK, ROUTE_FAQ,
+                          ROUTE_PROGRAM_ORDER, ROUTE_PROGRAM, ROUTE_MENU)
+
+from peewee import DoesNotExist, IntegrityError
+import hashlib
 
 from states.custom_states import States
 from config_data.config import MENU_STRUCTURE, MAIN_MENU_ITEMS, ADMIN_CHAT_ID, CANCEL, COMMANDS, DEFAULT_COMMANDS
@@ -17,6 +31,11 @@ import logging
 logger = logging.getLogger(__name__)
 
 
+INVALID_PHONE_TEXT = ("ВЫ НЕ ЗАВЕРШИЛИ ПРОЦЕСС ЗАЯВКИ или ввели некорректный номер.\n"
+                      "Введите номер в формате +7/8 и 10 цифр или 9XXXXXXXXX.\n"
+                      "ЕСЛИ ПЕРЕДУМАЛИ, выберите команду /cancel или напишите «ОТМЕНА»")
+
+
 # =======================================================================
 # ====================== ОБРАБОТЧИКИ СООБЩЕНИЙ ==========================
 # =======================================================================
@@ -28,43 +47,19 @@ def start(message: Message) -> None:
     Функция отправляет приветственное сообщение
     """
     user_id = message.from_user.id
-    username = message.from_user.username
     first_name = message.from_user.first_name
-    last_name = message.from_user.last_name
-
-    try:
-        user = User.get(User.user_id == user_id)
-
-        user.username = username
-        user.first_name = first_name
-        user.last_name = last_name
-        user.save()    # Обновляет информацию в DB
 
+    # Сохраняет профиль в DB, только если пользователь новый или профиль изменился
+    if not user_registry.touch(message.from_user):
         bot.reply_to(message, f"Рад вас снова видеть, {first_name}!")
         logger.info(f"Перезапуск бота пользователем {user_id} ({first_name})")
 
-        # Запись повторного визита
-        Date.create(
-            user=user,
-            title="Повторный визит",
-            description="Пользователь снова запустил бота",
-            due_date=datetime.now().replace(microsecond=0)
-        )
+        # Запись повторного визита (сохраняется в DB пакетом в фоне)
+        visit_log.record(user_id, "Повторный визит", "Пользователь снова запустил бота")
 
-    except DoesNotExist:
-        user = User.create(
-            user_id=user_id,
-            username=username,
-            first_name=first_name,
-            last_name=last_name,
-        )
+    else:
         # Запись времени первого визита
-        Date.create(
-            user=user,
-            title="Первичный визит",
-            description="Новый пользователь запустил бота",
-            due_date=datetime.now()
-        )
+        visit_log.record(user_id, "Первичный визит", "Новый пользователь запустил бота", due_date=datetime.now())
         bot.reply_to(message, f"Добро пожаловать, {first_name}!")
         logger.info(f"Запуск бота новым пользователем: {user_id} ({first_name})")
 
@@ -84,23 +79,12 @@ def show_main_menu(message: Message) -> None:
     Показывает главное меню с основными разделами из базы данных
     """
     try:
-        # Получение основных пунктов меню из database.db
-        main_menu_items = Menu.select().where(
-            Menu.menu_id.in_(MAIN_MENU_ITEMS)
-        ).order_by(Menu.menu_id)
-
-        button_titles = [item.menu_title for item in main_menu_items]
-
         # Проверяем есть ли активное состояние заявки, чтобы можно было её отменить
         current_state = bot.get_state(message.from_user.id, message.chat.id)
-        if current_state and current_state.startswith('States:order'):
-            # Есть активная заявка - показываем ОТМЕНУ
-            button_titles.append('Отмена')
-        else:
-            # Нет активной заявки - показываем ЗАПИСЬ
-            button_titles.append('Записаться на занятие')
+        order_in_progress = bool(current_state and current_state.startswith('States:order'))
 
-        markup = create_keyboard(button_titles, add_back_button=False)
+        # Есть активная заявка - показываем ОТМЕНУ, иначе - ЗАПИСЬ
+        markup = main_menu_keyboard(order_in_progress)
 
         bot.send_message(
             message.chat.id,
@@ -122,12 +106,10 @@ def handle_submenu_selection(message: Message) -> None:
         handle_back_navigation(message)
         return
 
-    try:
-        faq_item = FAQ.get(FAQ.question == message.text)
+    faq_item = get_catalog().faq_by_question.get(message.text)
+    if faq_item:
         display_faq_answer(message, faq_item)
         return
-    except DoesNotExist:
-        pass
 
     # Обычная обработка для подстраховки
     handle_menu_selection(message)
@@ -135,7 +117,7 @@ def handle_submenu_selection(message: Message) -> None:
 
 # -------------------- ОБРАБОТЧИКИ ЗАЯВКИ -----------------------
 
-@bot.message_handler(func=lambda message: message.text == 'Записаться на занятие')
+@bot.message_handler(func=text_in('Записаться на занятие'))
 def handle_order_button(message: Message) -> None:
     """
     Обрабатывает нажатие кнопки "Записаться на занятие"
@@ -143,7 +125,7 @@ def handle_order_button(message: Message) -> None:
     start_order(message)
 
 
-@bot.message_handler(func=lambda message: message.text.lower() in CANCEL, state='*')
+@bot.message_handler(func=text_in(*CANCEL, ignore_case=True), state='*')
 def handle_cancel_anywhere(message: Message):
     """
     Обрабатывает отмену из любого состояния
@@ -162,35 +144,19 @@ def start_order(message: Message) -> None:
     Начинает процесс записи на занятие (общая запись)
     """
     try:
-        # Проверяем, есть ли пользователь в базе
-        user_id = message.from_user.id
-        try:
-            user = User.get(User.user_id == user_id)
-        except DoesNotExist:
-            # Если пользователя нет, создаем временную запись
-            user = User.create(
-                user_id=user_id,
-                username=message.from_user.username,
-                first_name=message.from_user.first_name,
-                last_name=message.from_user.last_name
-            )
+        # Сохраняем пользователя в базе (если новый или профиль изменился)
+        user_registry.touch(message.from_user)
 
         with bot.retrieve_data(message.from_user.id, message.chat.id) as data:
             data['selected_program'] = 'Программа не выбрана'
 
         # Запрос номера телефона
-        markup = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-        markup.add(
-            KeyboardButton("Отправить: Я согласн(а) на обработку данных", request_contact=True),
-            KeyboardButton("Отмена")
-        )
-
         bot.send_message(
             message.chat.id,
             "ЗАЯВКА на ОБРАТНЫЙ ЗВОНОК\n\n"
             "ВНИМАНИЕ! Введя номер телефона, вы соглашаетесь на обработку персональных данных."
             "\nВведите ваш номер телефона:",
-            reply_markup=markup,
+            reply_markup=ORDER_PHONE_KEYBOARD,
             parse_mode='Markdown'
         )
 
@@ -211,15 +177,13 @@ def get_phone_contact(message: Message) -> None:
             phone = message.contact.phone_number
             with bot.retrieve_data(message.from_user.id, message.chat.id) as data:
                 data['phone'] = phone
+                data['phone_message_id'] = message.message_id  # Сессия заявки (ключ повторов)
 
             # Запрос имени
-            markup = ReplyKeyboardMarkup(resize_keyboard=True)
-            markup.add(KeyboardButton("Отмена"))
-
             bot.send_message(
                 message.chat.id,
                 "Введите ваше имя:",
-                reply_markup=markup
+                reply_markup=CANCEL_KEYBOARD
             )
 
             bot.set_state(message.from_user.id, States.order_name, message.chat.id)
@@ -244,44 +208,22 @@ def get_phone_text(message: Message) -> None:
     phone = message.text.strip()
 
     # Валидация номера
-    def validate_phone(phone):
-        e_num_text = ("ВЫ НЕ ЗАВЕРШИЛИ ПРОЦЕСС ЗАЯВКИ или ввели некорректный номер.\n"
-                      "Введите номер в формате +7900 ... или 8900... от 10 цифр.\n"
-                      "ЕСЛИ ПЕРЕДУМАЛИ, выберите команду /cancel или напишите «ОТМЕНА»")
-
-        # Проверка на допустимые символы
-        if not re.match(r'^[\d\s()+.-]+$', phone):
-            return False, e_num_text
-
-        # Убирает все нецифровые символы для проверки длины
-        digits_only = re.sub(r'[^\d]', '', phone)
-
-        # Проверка длины и начала номера
-        if len(digits_only) < 10 or len(digits_only) > 11 or not digits_only.startswith(('7', '8')):
-            return False, e_num_text
-
-        return True, phone
-
-    is_valid, result = validate_phone(phone)
-
-    if not is_valid:
+    if not is_valid_phone(phone):
         bot.send_message(
             message.chat.id,
-            f"{result}\n\n"
+            f"{INVALID_PHONE_TEXT}\n\n"
         )
         return
 
     with bot.retrieve_data(message.from_user.id, message.chat.id) as data:
         data['phone'] = phone
+        data['phone_message_id'] = message.message_id  # Сессия заявки (ключ повторов)
 
     # Запрос имени
-    markup = ReplyKeyboardMarkup(resize_keyboard=True)
-    markup.add(KeyboardButton("Отмена"))
-
     bot.send_message(
         message.chat.id,
         "\nВведите ваше имя:",
-        reply_markup=markup
+        reply_markup=CANCEL_KEYBOARD
     )
 
     bot.set_state(message.from_user.id, States.order_name, message.chat.id)
@@ -310,33 +252,20 @@ def get_name(message: Message) -> None:
 
     if selected_program and selected_program != 'Программа не выбрана':
         # Переход к комментарию, если программа определена автоматически
-        markup = ReplyKeyboardMarkup(resize_keyboard=True)
-        markup.add(KeyboardButton("Пропустить"), KeyboardButton("Отмена"))
-
         bot.send_message(
             message.chat.id,
             f"Запись на программу: {selected_program}\n\n"
             "Можете добавить комментарий или нажмите 'Пропустить':",
-            reply_markup=markup
+            reply_markup=COMMENT_KEYBOARD
         )
 
         bot.set_state(message.from_user.id, States.order_comment, message.chat.id)
     else:
         # Если программа не выбрана (запись из главного меню), тогда выбираем услугу
-        markup = ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
-        markup.add(
-            KeyboardButton("Групповое занятие"),
-            KeyboardButton("Персональное занятие"),
-            KeyboardButton("Занятие у Топ Мастера"),
-            KeyboardButton("Мероприятие или Ретрит"),
-            KeyboardButton("Другое"),
-            KeyboardButton("Отмена")
-        )
-
         bot.send_message(
             message.chat.id,
             "\nВыберите тип занятия:",
-            reply_markup=markup
+            reply_markup=SERVICE_KEYBOARD
         )
 
         bot.set_state(message.from_user.id, States.order_service, message.chat.id)
@@ -357,13 +286,10 @@ def get_service_type(message: Message) -> None:
         data['service_type'] = service_type
 
     # Запрос комментария
-    markup = ReplyKeyboardMarkup(resize_keyboard=True)
-    markup.add(KeyboardButton("Пропустить"), KeyboardButton("Отмена"))
-
     bot.send_message(
         message.chat.id,
         "Можете добавить комментарий или нажмите 'Пропустить':",
-        reply_markup=markup
+        reply_markup=COMMENT_KEYBOARD
     )
 
     bot.set_state(message.from_user.id, States.order_comment, message.chat.id)
@@ -386,19 +312,35 @@ def get_comment_and_save(message: Message) -> None:
             # Получаем выбранную программу (если есть)
             selected_program = data.get('selected_program', 'Программа не выбрана')
 
-            order = Orders.create(
-                user=user,
-                phone=data['phone'],
-                name=data['name'],
-                service_type=selected_program,  # Сохраняем название программы
-                comment=comment,
-                created_date=datetime.now().replace(microsecond=0)
+            # Состояние, сохраненное до появления phone_message_id, - сессия по текущему сообщению
+            session_key = order_session_key(
+                message.chat.id, user.user_id, data.get('phone_message_id', message.message_id)
             )
 
-            logger.info(
-                f"Создана заявка №{order.order_id} на программу '{selected_program}' от пользователя {user.user_id}")
-
-            forward_order_to_admin(order)  # Пересылка заявки администратору
+            try:
+                # Заявка и уведомление администратору сохраняются одной транзакцией
+                with db.atomic():
+                    order = Orders.create(
+                        user=user,
+                        phone=data['phone'],
+                        phone_normalized=normalize_phone(data['phone']),
+                        name=data['name'],
+                        service_type=selected_program,  # Сохраняем название программы
+                        comment=comment,
+                        created_date=datetime.now().replace(microsecond=0),
+                        session_key=session_key
+                    )
+                    forward_order_to_admin(order)  # Уведомление администратору (отправляется в фоне)
+
+            except IntegrityError:
+                # Двойное нажатие или повтор: заявка этой сессии уже сохранена, уведомление уже в очереди
+                order = Orders.get(Orders.session_key == session_key)
+                logger.info(f"Повторная отправка заявки №{order.order_id} от пользователя {user.user_id}")
+
+            else:
+                admin_outbox.notify()
+                logger.info(
+                    f"Создана заявка №{order.order_id} на программу '{selected_program}' от пользователя {user.user_id}")
 
             # Подтверждение для пользователя
             confirmation_parts = [
@@ -417,7 +359,7 @@ def get_comment_and_save(message: Message) -> None:
             bot.send_message(
                 message.chat.id,
                 "\n".join(confirmation_parts),
-                reply_markup=ReplyKeyboardRemove()
+                reply_markup=REMOVE_KEYBOARD
             )
 
             # Очищаем выбранную программу
@@ -432,14 +374,14 @@ def get_comment_and_save(message: Message) -> None:
         bot.send_message(
             message.chat.id,
             "Произошла ошибка при сохранении заявки. Попробуйте позже.",
-            reply_markup=ReplyKeyboardRemove()
+            reply_markup=REMOVE_KEYBOARD
         )
         bot.delete_state(message.from_user.id, message.chat.id)
 
 
 # -------------------- ВСПОМОГАТЕЛЬНЫЕ ОБРАБОТЧИКИ -----------------------
 
-@bot.message_handler(func=lambda message: message.text == 'Назад к вопросам')
+@bot.message_handler(func=text_in('Назад к вопросам'))
 def back_to_faq_menu(message: Message) -> None:
     """
     Возвращает к меню FAQ
@@ -460,7 +402,7 @@ def help_command(message: Message) -> None:
     bot.send_message(message.chat.id, help_text)
 
 
-@bot.message_handler(func=lambda message: message.text == 'Помощь')
+@bot.message_handler(func=text_in('Помощь'))
 def show_help(message: Message) -> None:
     """
     Показывает справку
@@ -468,6 +410,49 @@ def show_help(message: Message) -> None:
     help_command(message)
 
 
+@bot.message_handler(commands=['reload'], func=lambda message: str(message.chat.id) == str(ADMIN_CHAT_ID))
+def reload_content(message: Message) -> None:
+    """
+    Перечитывает каталог из DB после правки контента (только для администратора)
+    """
+    try:
+        catalog = reload_catalog()
+        bot.send_message(
+            message.chat.id,
+            f"Каталог обновлен (версия {catalog.version}): "
+            f"{len(catalog.menus)} пунктов меню, {len(catalog.programs)} программ"
+        )
+    except Exception as e:
+        logger.error(f"Ошибка при обновлении каталога: {e}")
+        bot.send_message(message.chat.id, "Ошибка при обновлении каталога")
+
+
+@bot.message_handler(commands=['orders'], func=lambda message: str(message.chat.id) == str(ADMIN_CHAT_ID))
+def show_customer_orders(message: Message) -> None:
+    """
+    Заявки клиента по номеру телефона в любом формате: /orders +7 900 123-45-67 (только для администратора)
+    """
+    phone = message.text.partition(' ')[2].strip()
+    if not phone:
+        bot.send_message(message.chat.id, "Укажите номер: /orders +79001234567")
+        return
+
+    try:
+        orders = customer_orders(phone)
+        if not orders:
+            bot.send_message(message.chat.id, f"Заявок с номером {phone} нет")
+            return
+
+        lines = [f"Заявки {orders[0].phone_normalized}:"]
+        for order in orders:
+            lines.append(f"№{order.order_id} от {order.created_date.strftime('%Y-%m-%d %H:%M')} - "
+                         f"{order.name}, {order.service_type or 'Не указана'}")
+        bot.send_message(message.chat.id, "\n".join(lines))
+    except Exception as e:
+        logger.error(f"Ошибка при поиске заявок по номеру: {e}")
+        bot.send_message(message.chat.id, "Ошибка при поиске заявок")
+
+
 def handle_menu_selection(message: Message) -> None:
     """
     Обрабатывает выбор пользователя из меню с учетом многоуровневой навигации
@@ -475,57 +460,38 @@ def handle_menu_selection(message: Message) -> None:
     user_choice = message.text
 
     try:
-        # Проверяем специальные кнопки
-        if user_choice == 'Записаться на занятие':
+        route = resolve_route(user_choice)
+
+        # Специальные кнопки
+        if route.kind == ROUTE_ORDER:
             start_order(message)
             return
 
-        elif user_choice == 'Назад в меню':
+        elif route.kind == ROUTE_MAIN_MENU:
             show_main_menu(message)
             return
 
-        elif user_choice == 'Назад':
+        elif route.kind == ROUTE_BACK:
             handle_back_navigation(message)
             return
 
-        elif user_choice == 'Назад к вопросам':
+        elif route.kind == ROUTE_FAQ:
             display_faq_menu(message)
             return
 
-        # Проверяем, является ли выбор записью на конкретную программу
-        if user_choice.startswith('Записаться на "'):
-            program_title = user_choice.replace('Записаться на "', '').replace('"', '')
-            start_program_order(message, program_title)
+        # Запись на конкретную программу
+        elif route.kind == ROUTE_PROGRAM_ORDER:
+            start_program_order(message, route.target)
             return
 
-        # Проверяем в программах
-        try:
-            program = Programs.get(Programs.program_title == user_choice)
-            show_program_details(message, program.program_title)
+        # Программа (точное или единственное частичное совпадение)
+        elif route.kind == ROUTE_PROGRAM:
+            show_program_details(message, route.target.program_title)
             return
 
-        except DoesNotExist:
-            pass
-
-        # Проверяем в основном меню
-        try:
-            menu_item = Menu.get(Menu.menu_title == user_choice)
-            handle_menu_navigation(message, menu_item)
-            return
-
-        except DoesNotExist:
-            pass
-
-        # Если не нашли точного совпадения, проверяем частичное совпадение в программах
-        programs = Programs.select().where(Programs.program_title.contains(user_choice))
-        if programs.count() == 1:
-            show_program_details(message, programs[0].program_title)
-            return
-
-        # Если не нашли в программах, проверяем частичное совпадение в основном меню
-        menu_items = Menu.select().where(Menu.menu_title.contains(user_choice))
-        if menu_items.count() == 1:
-            handle_menu_navigation(message, menu_items[0])
+        # Пункт меню (точное или единственное частичное совпадение)
+        elif route.kind == ROUTE_MENU:
+            handle_menu_navigation(message, route.target)
             return
 
         # Если ничего не найдено - показываем главное меню
@@ -557,7 +523,7 @@ def handle_all_messages(message: Message) -> None:
 # =======================================================================
 # ============================ НАВИГАЦИЯ ================================
 # =======================================================================
-def handle_no_programs_found(message: Message, menu_item: Menu) -> None:
+def handle_no_programs_found(message: Message, menu_item: MenuRow) -> None:
     """
     Универсальная обработка случая, когда программ не найдено
     Показывает описание раздела и кнопку для общей записи
@@ -567,11 +533,7 @@ def handle_no_programs_found(message: Message, menu_item: Menu) -> None:
         if menu_item.menu_description:
             response += f"\n\n{menu_item.menu_description}"
 
-        markup = ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
-        markup.add(
-            KeyboardButton(f'Записаться на "{menu_item.menu_title}"'),
-            KeyboardButton('Назад в меню')
-        )
+        markup = section_order_keyboard(menu_item.menu_title)
 
         bot.send_message(message.chat.id, response, reply_markup=markup)
 
@@ -588,7 +550,7 @@ def handle_no_programs_found(message: Message, menu_item: Menu) -> None:
         bot.send_message(message.chat.id, "Ошибка при загрузке информации")
 
 
-def show_generic_program_menu(message: Message, menu_item: Menu) -> None:
+def show_generic_program_menu(message: Message, menu_item: MenuRow) -> None:
     """
     Показывает страховочное меню для пунктов без обработчиков: описание и кнопка для общей записи
     """
@@ -605,14 +567,14 @@ def show_general_programs_menu(message: Message) -> None:
     Показывает подменю для 'Общие программы' с форматами занятий - ОПТИМИЗИРОВАТЬ (потом объединить в процедуру)
     """
     try:
+        catalog = get_catalog()
+
         # Получаем описание раздела
-        menu_item = Menu.get(Menu.menu_id == MENU_STRUCTURE['general'])
+        menu_item = catalog.get_menu(MENU_STRUCTURE['general'])
         response = f"{menu_item.menu_title}\n\n{menu_item.menu_description}"
 
         # Показываем форматы занятий
-        format_items = Menu.select().where(
-            Menu.menu_id.in_([4, 5, 20])    # Персональные, Групповые, ТОП-Мастер
-        ).order_by(Menu.menu_id)
+        format_items = catalog.menus_in([4, 5, 20])    # Персональные, Групповые, ТОП-Мастер
 
         button_titles = [item.menu_title for item in format_items]
         markup = create_keyboard(button_titles, back_button_text='Назад в меню')
@@ -637,7 +599,7 @@ def show_program_details(message: Message, program_title: str) -> None:
     Показывает описание программы и кнопку записи
     """
     try:
-        program = Programs.get(Programs.program_title == program_title)
+        program = get_catalog().get_program(program_title)
 
         # Формируем ответ
         response = f"{program.program_title}\n\n{program.program_description}"
@@ -649,11 +611,7 @@ def show_program_details(message: Message, program_title: str) -> None:
             response += f"\nСтоимость: {program.program_price}"
 
         # Создаем кнопки
-        markup = ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
-        markup.add(
-            KeyboardButton(f'Записаться на "{program.program_title}"'),
-            KeyboardButton('Назад')
-        )
+        markup = program_keyboard(program.program_title)
 
         bot.send_message(message.chat.id, response, reply_markup=markup)
 
@@ -677,12 +635,13 @@ def show_programs_by_type(message: Message, menu_id: int, choice_text: str = 'В
     Процедура поиска и отображения программ по типу
     """
     try:
-        menu_item = Menu.get(Menu.menu_id == menu_id)
+        catalog = get_catalog()
+        menu_item = catalog.get_menu(menu_id)
         response = f"{menu_item.menu_title}"
         if menu_item.menu_description:
             response += f"\n\n{menu_item.menu_description}"
 
-        programs = Programs.select().where(Programs.menu == menu_id)
+        programs = catalog.programs_by_menu.get(menu_id, ())
 
         # Логика для групповых программ по длительности
         if menu_id == 5:
@@ -710,10 +669,11 @@ def show_programs_by_type(message: Message, menu_id: int, choice_text: str = 'В
 def show_group_programs_format(message: Message) -> None:
     """Показывает подменю для групповых занятий по длительности"""
     try:
-        menu_item = Menu.get(Menu.menu_id == 5)
+        catalog = get_catalog()
+        menu_item = catalog.get_menu(5)
         response = f"{menu_item.menu_title}\n\n{menu_item.menu_description}"
 
-        duration_items = Menu.select().where(Menu.menu_id.in_([21, 22]))
+        duration_items = catalog.menus_in([21, 22])
 
         button_titles = [item.menu_title for item in duration_items]
         markup = create_keyboard(button_titles, back_button_text='Назад')
@@ -738,28 +698,13 @@ def show_programs_by_menu_id(message: Message, menu_key: str, target_menu_id: in
     Процедура показа программ по menu_id
     """
     try:
-        menu_item = Menu.get(Menu.menu_id == MENU_STRUCTURE[menu_key])
+        catalog = get_catalog()
+        menu_item = catalog.get_menu(MENU_STRUCTURE[menu_key])
 
-        # Ищем программы по target_menu_id
-        found_programs = []
-        all_programs = Programs.select()
+        # Программы раздела по связям ProgramMenu
+        found_programs = catalog.programs_by_section.get(target_menu_id, ())
 
-        for program in all_programs:
-            # Проверяем основную привязку
-            if program.menu_id == target_menu_id:
-                found_programs.append(program)
-                continue
-
-            # Проверяем multiple_menu_ids
-            if program.multiple_menu_ids:
-                multiple_ids = [id_str.strip() for id_str in program.multiple_menu_ids.split(',')]
-                if str(target_menu_id) in multiple_ids:
-                    found_programs.append(program)
-
-        logger.info(f"Найдено программ для {menu_key} (menu_id {target_menu_id}): {len(found_programs)}")
-        for prog in found_programs:
-            logger.info(
-                f"Программа: {prog.program_title}, menu_id: {prog.menu_id}, multiple_ids: {prog.multiple_menu_ids}")
+        logger.debug(f"Найдено программ для {menu_key} (menu_id {target_menu_id}): {len(found_programs)}")
 
         # Если программ не найдено
         if len(found_programs) == 0:
@@ -771,14 +716,8 @@ def show_programs_by_menu_id(message: Message, menu_key: str, target_menu_id: in
         if menu_item.menu_description:
             response += f"\n\n{menu_item.menu_description}"
 
-        markup = ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
-        buttons = []
-
-        for program in found_programs:
-            buttons.append(KeyboardButton(program.program_title))
-
-        buttons.append(KeyboardButton('Назад в меню'))
-        markup.add(*buttons)
+        button_titles = [program.program_title for program in found_programs]
+        markup = create_keyboard(button_titles, back_button_text='Назад в меню')
 
         bot.send_message(message.chat.id, response)
         bot.send_message(
@@ -800,9 +739,9 @@ def show_information_menu(message: Message) -> None:
     """
     try:
         # Получаем информационные пункты меню
-        info_items = Menu.select().where(
-            Menu.menu_id.in_([1, 2, 3, 6, 8, 9, 10, 11, 12, 13, 23])  # Все информационные разделы
-        ).order_by(Menu.menu_id)
+        info_items = get_catalog().menus_in(
+            [1, 2, 3, 6, 8, 9, 10, 11, 12, 13, 23]  # Все информационные разделы
+        )
 
         button_titles = [item.menu_title for item in info_items]
         markup = create_keyboard(button_titles, back_button_text='Назад в меню')
@@ -842,7 +781,7 @@ def handle_back_navigation(message: Message) -> None:
         show_main_menu(message)
 
 
-def handle_menu_navigation(message: Message, menu_item: Menu) -> None:
+def handle_menu_navigation(message: Message, menu_item: MenuRow) -> None:
     """
     Обрабатывает навигацию по меню
     """
@@ -897,7 +836,7 @@ def handle_menu_navigation(message: Message, menu_item: Menu) -> None:
 # =========================== ИНФО-РАЗДЕЛЫ ==============================
 # =======================================================================
 
-def display_info_content(message: Message, menu_item: Menu) -> None:
+def display_info_content(message: Message, menu_item: MenuRow) -> None:
     """
     Отображает контент информационных разделов
     """
@@ -911,6 +850,7 @@ def display_info_content(message: Message, menu_item: Menu) -> None:
         elif menu_id == MENU_STRUCTURE['events']:  # Мероприятия
             display_info_tab(
                 message,
+                menu_id=menu_id,
                 model=Events,
                 title="Мероприятия",
                 fields=["event_title", "event_description", "event_duration", "event_price"],
@@ -921,6 +861,7 @@ def display_info_content(message: Message, menu_item: Menu) -> None:
         elif menu_id == MENU_STRUCTURE['mentors']:  # Наставники
             display_info_tab(
                 message,
+                menu_id=menu_id,
                 model=Mentors,
                 title="Наставники",
                 fields=["mentor_title", "mentor_description"],
@@ -931,6 +872,7 @@ def display_info_content(message: Message, menu_item: Menu) -> None:
         elif menu_id == MENU_STRUCTURE['retreats']:  # Ретриты
             display_info_tab(
                 message,
+                menu_id=menu_id,
                 model=Retreats,
                 title="Ретриты",
                 fields=["retreat_title", "retreat_description"],
@@ -939,26 +881,12 @@ def display_info_content(message: Message, menu_item: Menu) -> None:
             )
 
         elif menu_id == MENU_STRUCTURE['reviews']:  # Отзывы
-            try:
-                reviews = Reviews.select()
-                logger.info(f"Отладка: найдено {reviews.count()} записей")
-                for review in reviews:
-                    logger.info(f"Отзыв: id={review.review_id}, menu_id={review.menu_id}, img_link={review.img_link}")
-            except Exception as e:
-                logger.error(f"Ошибка при отладке отзывов: {e}")
-
-            display_info_tab(
-                message,
-                model=Reviews,
-                title="Отзывы",
-                fields=["img_link"],
-                empty_message="Отзывы временно недоступны",
-                error_prefix="Ошибка при загрузке отзывов"
-            )
+            display_reviews(message)
 
         elif menu_id == MENU_STRUCTURE['contacts']:  # Контакты
             display_info_tab(
                 message,
+                menu_id=menu_id,
                 model=Contacts,
                 title="Контакты",
                 fields=["contacts_title", "contacts_description"],
@@ -984,27 +912,28 @@ def display_info_content(message: Message, menu_item: Menu) -> None:
         bot.send_message(message.chat.id, "Ошибка при загрузке информации")
 
 
-def display_info_m(message: Message, menu_item: Menu) -> None:
+def display_info_m(message: Message, menu_item: MenuRow) -> None:
     """Процедура отображения пунктов инфо-меню из таблицы Menu"""
     try:
-        response = f"{menu_item.menu_title}\n\n{menu_item.menu_description}"
-        bot.send_message(message.chat.id, response)
+        def render(catalog) -> RenderedResponse:
+            return RenderedResponse(f"{menu_item.menu_title}\n\n{menu_item.menu_description}", None)
+
+        rendered = render_cache.get(menu_item.menu_id, render)
+        bot.send_message(message.chat.id, rendered.text)
     except Exception as e:
         logger.error(f"Ошибка при отображении меню '{menu_item.menu_title}': {e}")
         bot.send_message(message.chat.id, "Ошибка при отображении информации")
 
 
-def display_info_tab(message: Message, model, title: str, fields: list[str],
+def display_info_tab(message: Message, menu_id: int, model, title: str, fields: list[str],
                      empty_message: str, error_prefix: str) -> None:
     """Процедура отображения пунктов инфо-меню из индивидуальных таблиц"""
     try:
-        items = model.select()
-
-        logger.info(f"Отладка {title}: найдено {items.count()} записей, модель: {model}")
-        for item in items:
-            logger.info(f"Запись: {item.__dict__}")
+        def render(catalog) -> RenderedResponse:
+            items = catalog.rows(model)
+            if not items:
+                return RenderedResponse(empty_message, None)
 
-        if items.count() > 0:
             response = f"{title}\n\n"
             for item in items:
                 for field in fields:
@@ -1012,42 +941,67 @@ def display_info_tab(message: Message, model, title: str, fields: list[str],
                     if value is not None:
                         response += f"{value}\n"
                 response += "\n"
-            bot.send_message(message.chat.id, response)
-        else:
-            bot.send_message(message.chat.id, empty_message)
+            return RenderedResponse(response, None)
+
+        rendered = render_cache.get(menu_id, render)
+        bot.send_message(message.chat.id, rendered.text)
 
     except Exception as e:
         logger.error(f"{error_prefix}: {e}")
         bot.send_message(message.chat.id, f"{error_prefix}")
 
 
+def display_reviews(message: Message) -> None:
+    """Отображает отзывы изображениями (после первой загрузки - по file_id из кэша)"""
+    try:
+        reviews = get_catalog().rows(Reviews)
+        if not reviews:
+            bot.send_message(message.chat.id, "Отзывы временно недоступны")
+            return
+
+        bot.send_message(message.chat.id, "Отзывы")
+        for review in reviews:
+            if review.img_link:
+                # Если изображение не отправилось - ссылка на него текстом
+                send_cached_photo(message.chat.id, review.img_link, fallback_text=review.img_link)
+
+    except Exception as e:
+        logger.error(f"Ошибка при загрузке отзывов: {e}")
+        bot.send_message(message.chat.id, "Ошибка при загрузке отзывов")
+
+
 # -------------------------- ПРАЙС ----------------------------
 
 def display_pricing(message: Message) -> None:
     """Отображает стоимость занятий"""
     try:
-        prices = Price.select()
-        response = "Стоимость занятий\n\n"
+        rendered = render_cache.get(MENU_STRUCTURE['pricing'], render_pricing)
+        bot.send_message(message.chat.id, rendered.text)
 
-        for price in prices:
-            response += f"{price.price_title}\n"
-            if price.price_description:
-                response += f"{price.price_description}\n"
+    except Exception as e:
+        logger.error(f"Ошибка при загрузке стоимости: {e}")
+        bot.send_message(message.chat.id, "Ошибка при загрузке стоимости")
 
-            # Детали стоимости
-            details = PriceDetail.select().where(PriceDetail.price == price)
-            for detail in details:
-                response += f"- {detail.price_detail_title}: {detail.price_detail_price}\n"
-                if detail.price_detail_duration:
-                    response += f"  ({detail.price_detail_duration})\n"
 
-            response += "\n"
+def render_pricing(catalog) -> RenderedResponse:
+    """Собирает текст раздела 'Стоимость'"""
+    response = "Стоимость занятий\n\n"
 
-        bot.send_message(message.chat.id, response)
+    for price in catalog.rows(Price):
+        response += f"{price.price_title}\n"
+        if price.price_description:
+            response += f"{price.price_description}\n"
 
-    except Exception as e:
-        logger.error(f"Ошибка при загрузке стоимости: {e}")
-        bot.send_message(message.chat.id, "Ошибка при загрузке стоимости")
+        # Детали стоимости
+        details = catalog.price_details_by_price.get(price.price_id, ())
+        for detail in details:
+            response += f"- {detail.price_detail_title}: {detail.price_detail_price}\n"
+            if detail.price_detail_duration:
+                response += f"  ({detail.price_detail_duration})\n"
+
+        response += "\n"
+
+    return RenderedResponse(response, None)
 
 
 # ------------------------- CХЕМА ПРОЕЗДА ---------------------------
@@ -1068,10 +1022,10 @@ def parse_coordinates(coord_string):
     return None, None
 
 
-def display_location(message: Message, menu_item: Menu = None) -> None:
+def display_location(message: Message, menu_item: MenuRow = None) -> None:
     """Отображает схему проезда"""
     try:
-        contacts = Contacts.select().where(Contacts.menu == MENU_STRUCTURE['contacts'])
+        contacts = get_catalog().contacts_by_menu.get(MENU_STRUCTURE['contacts'], ())
 
         address = None
         coordinates_str = None
@@ -1104,13 +1058,12 @@ def display_location(message: Message, menu_item: Menu = None) -> None:
 
         bot.send_message(message.chat.id, response)
 
-        # Отправляет карту
-        try:
-            bot.send_photo(message.chat.id, static_map_url, caption="Расположение студии Yogita")
-        except Exception as photo_error:
-            logger.error(f"Ошибка при отправке карты: {photo_error}")
-            # Если не удалось отправить фото, отправляется дополнительная информация
-            bot.send_message(message.chat.id, "Для построения маршрута используйте ссылки выше")
+        # Отправляет карту (после первой загрузки - по file_id из кэша)
+        # Если не удалось отправить фото, отправляется дополнительная информация
+        send_cached_photo(
+            message.chat.id, static_map_url, caption="Расположение студии Yogita",
+            fallback_text="Для построения маршрута используйте ссылки выше"
+        )
 
     except Exception as e:
         logger.error(f"Ошибка при загрузке схемы проезда: {e}")
@@ -1123,18 +1076,10 @@ def display_faq_menu(message: Message) -> None:
     Показывает меню FAQ с вопросами из базы данных
     """
     try:
-        faqs = FAQ.select()
-        if faqs.count() > 0:
-            # Создаем меню с вопросами
-            markup = ReplyKeyboardMarkup(resize_keyboard=True, row_width=1)
-            buttons = []
-
-            for faq in faqs:
-                # Используем полный текст вопроса из базы
-                buttons.append(KeyboardButton(faq.question))
-
-            buttons.append(KeyboardButton('Назад'))
-            markup.add(*buttons)
+        faqs = get_catalog().rows(FAQ)
+        if faqs:
+            # Меню с вопросами (полный текст вопроса из базы)
+            markup = faq_keyboard()
 
             bot.send_message(
                 message.chat.id,
@@ -1151,7 +1096,7 @@ def display_faq_menu(message: Message) -> None:
         bot.send_message(message.chat.id, "Ошибка при загрузке FAQ")
 
 
-def display_faq_answer(message: Message, faq_item: FAQ) -> None:
+def display_faq_answer(message: Message, faq_item: FAQRow) -> None:
     """
     Показывает ответ на выбранный вопрос FAQ
     """
@@ -1159,13 +1104,7 @@ def display_faq_answer(message: Message, faq_item: FAQ) -> None:
         response = f"ВОПРОС: {faq_item.question}\n\n"
         response += f"ОТВЕТ: {faq_item.answer}\n\n"
 
-        markup = ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
-        markup.add(
-            KeyboardButton('Назад к вопросам'),
-            KeyboardButton('Записаться на занятие')
-        )
-
-        bot.send_message(message.chat.id, response, reply_markup=markup)
+        bot.send_message(message.chat.id, response, reply_markup=FAQ_ANSWER_KEYBOARD)
 
     except Exception as e:
         logger.error(f"Ошибка при загрузке ответа FAQ: {e}")
@@ -1180,81 +1119,82 @@ def display_all_programs(message: Message) -> None:
     Показывает все программы, сгруппированные по типам
     """
     try:
-        logger.info(f"Начинаем вывод всех программ")
-
-        # Группируем программы по menu_id согласно структуре базы
-        personal_programs = Programs.select().where(Programs.menu == 4)  # Персональные
-        group_programs = Programs.select().where(Programs.menu == 5)  # Групповые
-        top_programs = Programs.select().where(Programs.menu == 20)  # ТОП-Мастер
-        massage_programs = Programs.select().where(Programs.menu == 3)  # Массаж
-
-        response = "Все программы студии\n\n"
-
-        # Персональные занятия
-        if personal_programs.count() > 0:
-            logger.info(f"Найдены Персональные занятия")
-            response += "Персональные занятия:\n"
-            for program in personal_programs:
-                response += f"• {program.program_title}\n"
-            response += "\n"
-
-        # Групповые занятия
-        if group_programs.count() > 0:
-            logger.info(f"Найдены Групповые занятия")
-            response += "Групповые занятия:\n"
-            for program in group_programs:
-                duration = program.program_duration if program.program_duration else ""
-                price = program.program_price if program.program_price else ""
-                response += f"• {program.program_title}"
-                if duration:
-                    response += f" - {duration}"
-                if price:
-                    response += f" - {price}"
-                response += "\n"
-            response += "\n"
-
-        # ТОП-Мастер
-        if top_programs.count() > 0:
-            logger.info(f"Найдены занятия с ТОП-Мастером")
-            response += "Занятия с ТОП-Мастером:\n"
-            for program in top_programs:
-                response += f"• {program.program_title}\n"
-            response += "\n"
-
-        # Массаж
-        if massage_programs.count() > 0:
-            logger.info(f"Найден Массаж")
-            response += "Массаж:\n"
-            for program in massage_programs:
-                response += f"• {program.program_title}\n"
-                if program.program_description:
-                    # Берем только первую строку описания
-                    desc_lines = program.program_description.split('\n')
-                    if desc_lines:
-                        response += f"  {desc_lines[0]}\n"
-            response += "\n"
-
-        # Если ничего не найдено
-        if response == "Все программы студии\n\n":
-            response += "На данный момент программы отсутствуют."
-
-        button_titles = ['Записаться на занятие']
-        markup = create_keyboard(button_titles, back_button_text='Назад в меню')
+        rendered = render_cache.get(MENU_STRUCTURE['all_programs'], render_all_programs)
 
         # Отправляем сообщение пользователю
         bot.send_message(
             message.chat.id,
-            response,
-            reply_markup=markup
+            rendered.text,
+            reply_markup=rendered.reply_markup
         )
 
-        logger.info("Все программы успешно отправлены пользователю")
+        logger.debug(f"Все программы отправлены пользователю {message.chat.id}")
 
     except Exception as e:
         logger.error(f"Ошибка при загрузке всех программ: {e}")
         bot.send_message(message.chat.id, "Ошибка при загрузке списка программ")
 
 
+def _program_line(program) -> str:
+    return f"• {program.program_title}\n"
+
+
+def _group_program_line(program) -> str:
+    line = f"• {program.program_title}"
+    if program.program_duration:
+        line += f" - {program.program_duration}"
+    if program.program_price:
+        line += f" - {program.program_price}"
+    return line + "\n"
+
+
+def _massage_program_line(program) -> str:
+    line = f"• {program.program_title}\n"
+    if program.program_description:
+        # Берем только первую строку описания
+        first_line = program.program_description.split('\n')[0]
+        line += f"  {first_line}\n"
+    return line
+
+
+# Разделы 'Все программы' в порядке вывода: menu_id, заголовок, строка программы
+ALL_PROGRAMS_SECTIONS = (
+    (4, "Персональные занятия:", _program_line),
+    (5, "Групповые занятия:", _group_program_line),
+    (20, "Занятия с ТОП-Мастером:", _program_line),
+    (3, "Массаж:", _massage_program_line),
+)
+
+
+def render_all_programs(catalog) -> RenderedResponse:
+    """
+    Собирает текст раздела 'Все программы' с клавиатурой.
+    Программы раскладываются по разделам за один проход по каталогу
+    """
+    sections = {menu_id: (format_line, []) for menu_id, _, format_line in ALL_PROGRAMS_SECTIONS}
+
+    for program in catalog.programs:
+        section = sections.get(program.menu_id)
+        if section:
+            format_line, lines = section
+            lines.append(format_line(program))
+
+    response = "Все программы студии\n\n"
+    for menu_id, title, _ in ALL_PROGRAMS_SECTIONS:
+        lines = sections[menu_id][1]
+        if lines:
+            response += f"{title}\n{''.join(lines)}\n"
+
+    # Если ничего не найдено
+    if response == "Все программы студии\n\n":
+        response += "На данный момент программы отсутствуют."
+
+    button_titles = ['Записаться на занятие']
+    markup = create_keyboard(button_titles, back_button_text='Назад в меню')
+
+    return RenderedResponse(response, markup)
+
+
 # =======================================================================
 # ========================== ПРОЦЕСС ЗАЯВКИ =============================
 # =======================================================================
@@ -1268,32 +1208,16 @@ def start_program_order(message: Message, program_title: str) -> None:
         with bot.retrieve_data(message.from_user.id, message.chat.id) as data:
             data['selected_program'] = program_title
 
-        # Проверяем, есть ли пользователь в базе
-        user_id = message.from_user.id
-        try:
-            user = User.get(User.user_id == user_id)
-        except DoesNotExist:
-            # Если пользователя нет, создаем временную запись
-            user = User.create(
-                user_id=user_id,
-                username=message.from_user.username,
-                first_name=message.from_user.first_name,
-                last_name=message.from_user.last_name
-            )
+        # Сохраняем пользователя в базе (если новый или профиль изменился)
+        user_registry.touch(message.from_user)
 
         # Запрос номера телефона с указанием программы
-        markup = ReplyKeyboardMarkup(resize_keyboard=True, row_width=2)
-        markup.add(
-            KeyboardButton("Отправить контакт", request_contact=True),
-            KeyboardButton("Отмена")
-        )
-
         bot.send_message(
             message.chat.id,
             f"ЗАПИСЬ на программу: {program_title}\n\n"
             "ВНИМАНИЕ! Введя номер телефона, вы соглашаетесь на обработку персональных данных.\n"
             "Введите ваш номер телефона:",
-            reply_markup=markup,
+            reply_markup=PROGRAM_ORDER_PHONE_KEYBOARD,
             parse_mode='Markdown'
         )
 
@@ -1304,40 +1228,44 @@ def start_program_order(message: Message, program_title: str) -> None:
         bot.send_message(message.chat.id, "Ошибка. Попробуйте позже")
 
 
+def order_session_key(chat_id: int, user_id: int, phone_message_id: int) -> str:
+    """
+    Ключ сессии заявки: чат, пользователь и сообщение с телефоном (message_id уникален в чате).
+    Повтор той же сессии дает тот же ключ, новая заявка - новый, даже с теми же телефоном и программой
+    """
+    return hashlib.sha1(f"{chat_id}|{user_id}|{phone_message_id}".encode('utf-8')).hexdigest()
+
+
 def forward_order_to_admin(order):
     """
-    Пересылает информацию о заказе администратору в Telegram
+    Ставит уведомление о заказе администратору в очередь отправки (AdminNotification).
+    Вызывается в транзакции создания заказа
     """
     if not ADMIN_CHAT_ID:
         logger.warning("ADMIN_CHAT_ID не установлен, уведомление не отправлено")
         return
 
-    try:
-        order_info = [
-            f"ВАМ НОВАЯ ЗАЯВКА №{order.order_id}",
-            f"Имя: {order.name}",
-            f"Телефон: {order.phone}",
-            f"Услуга: {order.service_type or 'Не указана'}",
-            f"Дата: {order.created_date.strftime('%Y-%m-%d %H:%M:%S')}",
-        ]
-
-        if order.comment:
-            order_info.append(f"Комментарий: {order.comment}")
+    order_info = [
+        f"ВАМ НОВАЯ ЗАЯВКА №{order.order_id}",
+        f"Имя: {order.name}",
+        f"Телефон: {order.phone}",
+        f"Услуга: {order.service_type or 'Не указана'}",
+        f"Дата: {order.created_date.strftime('%Y-%m-%d %H:%M:%S')}",
+    ]
 
-        # Информация о пользователе
-        user_info = f"ID пользователя: {order.user.user_id}"
-        if order.user.username:
-            user_info += f" (@{order.user.username})"
-        order_info.append(user_info)
+    if order.comment:
+        order_info.append(f"Комментарий: {order.comment}")
 
-        order_text = "\n".join(order_info)
+    # Информация о пользователе
+    user_info = f"ID пользователя: {order.user.user_id}"
+    if order.user.username:
+        user_info += f" (@{order.user.username})"
+    order_info.append(user_info)
 
-        # Отправка сообщение
-        bot.send_message(ADMIN_CHAT_ID, order_text)
-        logger.info(f"Заявка №{order.order_id} переслана администратору")
+    order_text = "\n".join(order_info)
 
-    except Exception as e:
-        logger.error(f"Ошибка при пересылке заявки: {e}")
+    # Ошибка записи отменяет и заявку: заявка без уведомления не сохраняется
+    admin_outbox.enqueue(order, ADMIN_CHAT_ID, order_text)
 
 
 def cancel_order(message: Message) -> None:
@@ -1347,25 +1275,9 @@ def cancel_order(message: Message) -> None:
     bot.send_message(
         message.chat.id,
         "Запись отменена.",
-        reply_markup=ReplyKeyboardRemove()
+        reply_markup=REMOVE_KEYBOARD
     )
     bot.delete_state(message.from_user.id, message.chat.id)
     show_main_menu(message)
 
 # ====================== КОНЕЦ ПРОЦЕССА ЗАЯВКИ ==========================
-
-
-def create_keyboard(button_titles: list[str], row_width: int = 2, add_back_button: bool = True,
-                    back_button_text: str = None) -> ReplyKeyboardMarkup:
-    """Создает клавиатуру с кнопками"""
-    markup = ReplyKeyboardMarkup(resize_keyboard=True, row_width=row_width)
-    buttons = [KeyboardButton(title) for title in button_titles]
-
-    if add_back_button:
-        if back_button_text:
-            buttons.append(KeyboardButton(back_button_text))
-        else:
-            buttons.append(KeyboardButton('Назад' if len(button_titles) <= 4 else 'Назад в меню'))
-
-    markup.add(*buttons)
-    return markup
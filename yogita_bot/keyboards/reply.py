@@ -0,0 +1,127 @@
+from telebot.types import JsonSerializable, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
+
+from config_data.config import MAIN_MENU_ITEMS
+from models import FAQ
+from utils.render_cache import RenderCache
+
+
+"""
+    Реестр reply-клавиатур.
+
+    Каждая клавиатура собирается один раз и сразу сериализуется в JSON:
+    обработчики прикрепляют к сообщению готовый объект, а telebot при отправке
+    берет строку из to_json() без повторной сборки кнопок.
+
+    Статичные клавиатуры (шаги заявки, ответ FAQ) - константы модуля.
+    Клавиатуры из каталога (главное меню, подменю, FAQ, программы) кэшируются
+    по набору кнопок и сбрасываются вместе с версией каталога.
+"""
+
+
+class PrebuiltKeyboard(JsonSerializable):
+    """
+    Клавиатура с заранее сериализованным JSON
+    """
+    __slots__ = ('_json',)
+
+    def __init__(self, markup) -> None:
+        self._json = markup.to_json()
+
+    def to_json(self) -> str:
+        return self._json
+
+
+def build_keyboard(buttons, row_width: int = 2, one_time_keyboard: bool = None) -> PrebuiltKeyboard:
+    """Собирает клавиатуру из названий кнопок или KeyboardButton"""
+    markup = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=one_time_keyboard, row_width=row_width)
+    markup.add(*[button if isinstance(button, KeyboardButton) else KeyboardButton(button) for button in buttons])
+    return PrebuiltKeyboard(markup)
+
+
+# ------------------------ СТАТИЧНЫЕ КЛАВИАТУРЫ -------------------------
+
+REMOVE_KEYBOARD = PrebuiltKeyboard(ReplyKeyboardRemove())
+
+# Запрос телефона (общая запись)
+ORDER_PHONE_KEYBOARD = build_keyboard(
+    [KeyboardButton("Отправить: Я согласн(а) на обработку данных", request_contact=True), "Отмена"],
+    one_time_keyboard=True
+)
+
+# Запрос телефона (запись на программу)
+PROGRAM_ORDER_PHONE_KEYBOARD = build_keyboard(
+    [KeyboardButton("Отправить контакт", request_contact=True), "Отмена"]
+)
+
+CANCEL_KEYBOARD = build_keyboard(["Отмена"])
+
+COMMENT_KEYBOARD = build_keyboard(["Пропустить", "Отмена"])
+
+SERVICE_KEYBOARD = build_keyboard([
+    "Групповое занятие",
+    "Персональное занятие",
+    "Занятие у Топ Мастера",
+    "Мероприятие или Ретрит",
+    "Другое",
+    "Отмена"
+])
+
+FAQ_ANSWER_KEYBOARD = build_keyboard(['Назад к вопросам', 'Записаться на занятие'])
+
+
+# ----------------------- КЛАВИАТУРЫ ИЗ КАТАЛОГА ------------------------
+
+_keyboards = RenderCache()
+
+
+def create_keyboard(button_titles: list[str], row_width: int = 2, add_back_button: bool = True,
+                    back_button_text: str = None) -> PrebuiltKeyboard:
+    """Создает клавиатуру с кнопками (повторные вызовы с теми же кнопками берутся из кэша)"""
+    button_titles = tuple(button_titles)
+
+    def build(catalog) -> PrebuiltKeyboard:
+        buttons = list(button_titles)
+
+        if add_back_button:
+            if back_button_text:
+                buttons.append(back_button_text)
+            else:
+                buttons.append('Назад' if len(button_titles) <= 4 else 'Назад в меню')
+
+        return build_keyboard(buttons, row_width=row_width)
+
+    return _keyboards.get(('keyboard', button_titles, row_width, add_back_button, back_button_text), build)
+
+
+def main_menu_keyboard(order_in_progress: bool) -> PrebuiltKeyboard:
+    """Главное меню: с кнопкой 'Отмена' при активной заявке, иначе с 'Записаться на занятие'"""
+    def build(catalog) -> PrebuiltKeyboard:
+        button_titles = [item.menu_title for item in catalog.menus_in(MAIN_MENU_ITEMS)]
+        button_titles.append('Отмена' if order_in_progress else 'Записаться на занятие')
+        return create_keyboard(button_titles, add_back_button=False)
+
+    return _keyboards.get(('main_menu', order_in_progress), build)
+
+
+def faq_keyboard() -> PrebuiltKeyboard:
+    """Список вопросов FAQ и кнопка 'Назад'"""
+    def build(catalog) -> PrebuiltKeyboard:
+        return build_keyboard([faq.question for faq in catalog.rows(FAQ)] + ['Назад'], row_width=1)
+
+    return _keyboards.get(('faq',), build)
+
+
+def program_keyboard(program_title: str) -> PrebuiltKeyboard:
+    """Запись на программу и кнопка 'Назад'"""
+    return _keyboards.get(
+        ('program', program_title),
+        lambda catalog: build_keyboard([f'Записаться на "{program_title}"', 'Назад'])
+    )
+
+
+def section_order_keyboard(menu_title: str) -> PrebuiltKeyboard:
+    """Запись на раздел без программ и кнопка 'Назад в меню'"""
+    return _keyboards.get(
+        ('section', menu_title),
+        lambda catalog: build_keyboard([f'Записаться на "{menu_title}"', 'Назад в меню'])
+    )
@@ -1,6 +1,8 @@
-from telebot import TeleBot
+from telebot import TeleBot, apihelper
 from telebot.storage import StateMemoryStorage
-from config_data.config import BOT_TOKEN
+from config_data.config import (BOT_TOKEN, RUN_MODE, STATE_STORAGE, STATE_FLUSH_INTERVAL, STATE_FLUSH_BATCH,
+                                STATE_CACHE_SIZE, TELEGRAM_API_URL)
+from utils.state_storage import SQLiteStateStorage
 
 """
     Инициализация хранилища состояний бота и получение списка доступных языков.
@@ -10,11 +12,28 @@ from config_data.config import BOT_TOKEN
     Он используется для хранения информации о текущем состоянии чата или пользователя внутри бота.
     Полезно, когда нужно помнить контекст взаимодействия пользователя с ботом для обработки запросов.
 
+    По умолчанию (STATE_STORAGE=sqlite) используется SQLiteStateStorage - то же хранилище в памяти,
+    но с фоновой записью в таблицу BotState, чтобы недозаполненные заявки переживали перезапуск.
+
     TeleBot(BOT_TOKEN, state_storage=storage) - создание экземпляра класса 
     telebot.TeleBot с передачей токена BOT_TOKEN для инициализации бота.
     Параметр state_storage=storage используется для указания хранилища состояний,
     созданного ранее, для отслеживания состояний пользователей или чатов.
+
+    Собственный пул потоков telebot нужен только при опросе (polling); в режиме webhook
+    обновления обрабатываются потоками webhook-сервера, поэтому threaded=False.
+
+    TELEGRAM_API_URL направляет запросы бота на другой сервер Bot API
+    (локальный telegram-bot-api или tools/fake_api.py для нагрузочных проверок).
 """
 
-storage = StateMemoryStorage()
-bot = TeleBot(token=BOT_TOKEN, state_storage=storage)
+if TELEGRAM_API_URL:
+    apihelper.API_URL = TELEGRAM_API_URL.rstrip('/') + '/bot{0}/{1}'
+    apihelper.FILE_URL = TELEGRAM_API_URL.rstrip('/') + '/file/bot{0}/{1}'
+
+if STATE_STORAGE == 'sqlite':
+    storage = SQLiteStateStorage(flush_interval=STATE_FLUSH_INTERVAL, flush_batch=STATE_FLUSH_BATCH,
+                                 cache_size=STATE_CACHE_SIZE)
+else:
+    storage = StateMemoryStorage()
+bot = TeleBot(token=BOT_TOKEN, state_storage=storage, threaded=RUN_MODE == 'polling')
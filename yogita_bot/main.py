@@ -2,17 +2,38 @@ import telebot
 from telebot import custom_filters
 from handlers.custom_handlers.c_handlers import *
 
-from loader import bot
+from loader import bot, storage
 
 import time
 
 from models import init_database, db
+from utils.catalog import reload_catalog
+from utils.dispatch import dispatcher
+from utils.logs import log_writer
+from utils.media import media_cache
+from utils.metrics import HandlerMetrics, handler_metrics
+from utils.admin_outbox import admin_outbox
+from utils.outbound import OutboundScheduler
+from utils.phone import backfill_orders
+from utils.sharding import ShardSupervisor
+from utils.state_storage import SQLiteStateStorage
+from utils.visits import visit_log
+from utils.webhook import UpdateWorkerPool, WebhookServer
+import asyncio
 import signal
 import sys
 
 import logging
-from logging.handlers import RotatingFileHandler
-from config_data.config import LOG_PATH, MAX_LOG_SIZE, BACKUP_COUNT, DEFAULT_COMMANDS
+from config_data.config import (DEFAULT_COMMANDS, RUN_MODE,
+                                WEBHOOK_URL, WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET,
+                                WEBHOOK_SSL_CERT, WEBHOOK_SSL_KEY, WEBHOOK_WORKERS, WEBHOOK_QUEUE_SIZE,
+                                ASYNC_WORKERS, SHARD_WORKERS, SHARD_QUEUE_SIZE, BOT_TOKEN, ADMIN_CHAT_ID,
+                                OUTBOUND_QUEUE, OUTBOUND_GLOBAL_RATE, OUTBOUND_CHAT_RATE, OUTBOUND_CHAT_BURST,
+                                OUTBOUND_WORKERS, METRICS_LOG_INTERVAL)
+
+
+# Запущенные фоновые сервисы (останавливаются в shutdown в обратном порядке)
+services = []
 
 
 def setup_logging():
@@ -29,34 +50,21 @@ def setup_logging():
         logging.getLogger('c_handlers').setLevel(logging.CRITICAL)
         return
 
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-    )
-
-    # Обработчик с ротацией логов
-    file_handler = RotatingFileHandler(
-        LOG_PATH,
-        maxBytes=MAX_LOG_SIZE,
-        backupCount=BACKUP_COUNT,
-        encoding='utf-8'
-    )
-
-    # Обработчик для консоли
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(formatter)
-
-    # Настройка базового логгера
-    root_logger = logging.getLogger()
-    root_logger.setLevel(logging.INFO)
-    root_logger.addHandler(file_handler)
-    root_logger.addHandler(console_handler)
-    file_handler.setFormatter(formatter)
+    # Запись в файл и консоль - в фоновом потоке (utils/logs.py), уровни модулей из LOG_LEVELS
+    log_writer.start()
 
     logging.info("\n\n>>\n")
 
 
 def shutdown():
     """Завершение работы бота"""
+    while services:
+        service = services.pop()
+        try:
+            service.stop()
+        except Exception as e:
+            logging.error(f"Ошибка при остановке {type(service).__name__}: {e}")
+
     try:
         # Закрываем соединение с базой данных
         if not db.is_closed():
@@ -90,6 +98,143 @@ def setup_database():
                 return False
 
 
+def run_polling():
+    """Получение обновлений опросом getUpdates"""
+    bot.remove_webhook()
+
+    outbound = setup_outbound()
+    if outbound:
+        services.append(outbound)
+
+    print("Бот запущен \nДля остановки бота нажмите Ctrl+C")
+    bot.polling(none_stop=True, interval=0, timeout=60)
+
+
+def require_webhook_secret():
+    """
+    Зарегистрированный webhook (WEBHOOK_URL) принимает обновления только с секретным токеном:
+    без WEBHOOK_SECRET любой, кто знает адрес, может отправить боту поддельные обновления
+    """
+    if WEBHOOK_URL and not WEBHOOK_SECRET:
+        logging.error("Режим webhook с WEBHOOK_URL требует WEBHOOK_SECRET - запуск отменен")
+        exit(1)
+
+
+def run_webhook():
+    """Получение обновлений через webhook: HTTP-сервер и пул потоков обработки"""
+    outbound = setup_outbound()
+    if outbound:
+        services.append(outbound)
+
+    pool = UpdateWorkerPool(bot, workers=WEBHOOK_WORKERS, queue_size=WEBHOOK_QUEUE_SIZE)
+    pool.start()
+    services.append(pool)
+
+    server = WebhookServer(
+        pool.submit, host=WEBHOOK_HOST, port=WEBHOOK_PORT, path=WEBHOOK_PATH,
+        secret=WEBHOOK_SECRET, ssl_cert=WEBHOOK_SSL_CERT, ssl_key=WEBHOOK_SSL_KEY
+    )
+    server.start()
+    services.append(server)
+
+    # Без WEBHOOK_URL webhook не регистрируется: обновления принимаются только по адресу WEBHOOK_HOST
+    # (по умолчанию 127.0.0.1 - локальные запросы, проверка записанными обновлениями)
+    if WEBHOOK_URL:
+        bot.set_webhook(url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET, max_connections=WEBHOOK_WORKERS * 10)
+        logging.info(f"Webhook зарегистрирован: {WEBHOOK_URL}")
+
+    print(f"Бот запущен (webhook, порт {server.port}) \nДля остановки бота нажмите Ctrl+C")
+    server.wait()
+
+
+def run_async():
+    """Получение обновлений и отправка сообщений через AsyncTeleBot (asyncio)"""
+    # Импорт здесь: AsyncTeleBot требует aiohttp, который нужен только в этом режиме
+    from utils.async_engine import AsyncEngine
+
+    bot.remove_webhook()
+
+    engine = AsyncEngine(bot, workers=ASYNC_WORKERS)
+    services.append(engine)
+
+    print("Бот запущен (asyncio) \nДля остановки бота нажмите Ctrl+C")
+    asyncio.run(engine.run())
+
+
+def setup_outbound(global_rate: float = OUTBOUND_GLOBAL_RATE):
+    """Очередь исходящих сообщений с лимитами Telegram; None, если отключена"""
+    if not OUTBOUND_QUEUE:
+        return None
+
+    outbound = OutboundScheduler(global_rate=global_rate, chat_rate=OUTBOUND_CHAT_RATE,
+                                 chat_burst=OUTBOUND_CHAT_BURST, workers=OUTBOUND_WORKERS)
+    outbound.install(bot)
+    outbound.start()
+    return outbound
+
+
+def init_worker():
+    """
+    Подготовка процесса-обработчика режима sharded; возвращает сервисы для остановки.
+    Логирование процесса настраивает супервизор (записи передаются ему, см. utils/sharding.py)
+    """
+    reload_catalog()
+    bot.add_custom_filter(custom_filters.StateFilter(bot))
+    dispatcher.install(bot)
+
+    # Метрики процесса: только сводка в логе (страница /metrics - одна на порт)
+    metrics = HandlerMetrics(log_interval=METRICS_LOG_INTERVAL)
+    metrics.install(bot)
+    metrics.start()
+
+    visit_log.start()
+    media_cache.start()
+    admin_outbox.start()
+    worker_services = [metrics, visit_log, media_cache, admin_outbox]
+    if isinstance(storage, SQLiteStateStorage):
+        storage.start()
+        worker_services.append(storage)
+
+    # Лимит на чат соблюдается в процессе чата; общий лимит делится между процессами
+    outbound = setup_outbound(global_rate=OUTBOUND_GLOBAL_RATE / SHARD_WORKERS)
+    if outbound:
+        worker_services.append(outbound)
+    return worker_services
+
+
+def run_sharded():
+    """Супервизор: получение обновлений и распределение по процессам-обработчикам"""
+    supervisor = ShardSupervisor(BOT_TOKEN, workers=SHARD_WORKERS, queue_size=SHARD_QUEUE_SIZE,
+                                 worker_init=init_worker, admin_chat_id=ADMIN_CHAT_ID)
+    supervisor.start()
+    services.append(supervisor)
+
+    if WEBHOOK_URL:
+        server = WebhookServer(
+            supervisor.submit, host=WEBHOOK_HOST, port=WEBHOOK_PORT, path=WEBHOOK_PATH,
+            secret=WEBHOOK_SECRET, ssl_cert=WEBHOOK_SSL_CERT, ssl_key=WEBHOOK_SSL_KEY
+        )
+        server.start()
+        services.append(server)
+        bot.set_webhook(url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET, max_connections=SHARD_WORKERS * 10)
+
+        print(f"Бот запущен (sharded: {SHARD_WORKERS}, webhook) \nДля остановки бота нажмите Ctrl+C")
+        supervisor.wait()
+    else:
+        bot.remove_webhook()
+
+        print(f"Бот запущен (sharded: {SHARD_WORKERS}) \nДля остановки бота нажмите Ctrl+C")
+        supervisor.poll(timeout=60)
+
+
+RUN_MODES = {
+    'polling': run_polling,
+    'webhook': run_webhook,
+    'async': run_async,
+    'sharded': run_sharded,
+}
+
+
 if __name__ == '__main__':
     """
     config.py - объявление токенов, ключей и прочих констант;
@@ -98,26 +243,66 @@ if __name__ == '__main__':
     """
     try:
         setup_logging()
+        services.append(log_writer)  # Останавливается последним - дописывает лог остальных сервисов
         logging.info("Запуск бота")
 
         # Регистрация обработчиков сигналов
         signal.signal(signal.SIGINT, signal_handler)
         signal.signal(signal.SIGTERM, signal_handler)
 
+        # Режимы с приемом обновлений по HTTP (sharded - при WEBHOOK_URL): проверка до запуска сервисов
+        if RUN_MODE in ('webhook', 'sharded'):
+            require_webhook_secret()
+
         # Инициализация базы данных перед запуском бота
         if not setup_database():
             logging.error("Ошибка: не удалось инициализировать DB")
             exit(1)
 
+        # Номера телефонов старых заявок в формате E.164 (только незаполненные)
+        backfill_orders()
+
+        # Загрузка каталога (меню, программы, FAQ...) в память
+        reload_catalog()
+
+        # Фоновая запись состояний диалогов в DB (останавливается последней, после обработки обновлений)
+        if isinstance(storage, SQLiteStateStorage):
+            storage.start()
+            services.append(storage)
+
+        # Пакетная запись визитов
+        visit_log.start()
+        services.append(visit_log)
+
+        # Фоновая запись file_id изображений (ответы Telegram обрабатываются в потоке отправки)
+        media_cache.start()
+        services.append(media_cache)
+
+        # Фоновая отправка уведомлений администратору (в том числе оставшихся с прошлого запуска)
+        admin_outbox.start()
+        services.append(admin_outbox)
+
         # Фильтр состояний
         bot.add_custom_filter(custom_filters.StateFilter(bot))
 
+        # Выбор обработчиков по индексу (команда, текст кнопки, состояние) вместо перебора фильтров
+        dispatcher.install(bot)
+
+        # Метрики обработчиков (в режиме sharded - в процессах-обработчиках, см. init_worker)
+        if RUN_MODE != 'sharded':
+            handler_metrics.install(bot)
+            handler_metrics.start()
+            services.append(handler_metrics)
+
         bot.set_my_commands([
             telebot.types.BotCommand(command, description) for command, description in DEFAULT_COMMANDS
         ])
 
-        print("Бот запущен \nДля остановки бота нажмите Ctrl+C")
-        bot.polling(none_stop=True, interval=0, timeout=60)
+        if RUN_MODE not in RUN_MODES:
+            logging.error(f"Неизвестный режим запуска RUN_MODE={RUN_MODE}, доступны: {', '.join(RUN_MODES)}")
+            exit(1)
+
+        RUN_MODES[RUN_MODE]()
 
     except Exception as e:
         logging.error(f"Ошибка запуска бота: {e}")
@@ -1,18 +1,27 @@
 from peewee import (
     AutoField,
     CharField,
+    CompositeKey,
     DateTimeField,
     ForeignKeyField,
     IntegerField,
+    IntegrityError,
     Model,
     SqliteDatabase,
     SQL,
     TextField
 )
+from playhouse.migrate import SqliteMigrator, migrate
+from contextlib import contextmanager
+from collections import Counter
 from datetime import datetime
 
-from config_data.config import DATE_FORMAT, DB_PATH
+from config_data.config import (DATE_FORMAT, DB_PATH, DB_JOURNAL_MODE, DB_SYNCHRONOUS, DB_CACHE_SIZE,
+                                DB_MMAP_SIZE, DB_BUSY_TIMEOUT, DB_SLOW_QUERY_MS, DB_REPEAT_LIMIT)
 import os
+import re
+import threading
+import time
 import logging
 
 
@@ -26,7 +35,130 @@ if db_dir and not os.path.exists(db_dir):
     os.makedirs(db_dir)
     logger.info(f"Создана директория для DB: {db_dir}")
 
-db = SqliteDatabase(DB_PATH)
+# Вид запроса: списки параметров IN (?, ?, ...) и строки VALUES (...), (...) разной длины сводятся к одному виду
+PARAM_LIST = re.compile(r'\(\?(?:\s*,\s*\?)+\)')
+ROW_LIST = re.compile(r'\(\?\.\.\.\)(?:\s*,\s*\(\?\.\.\.\))+')
+MAX_SHAPES = 1000  # Видов запросов в статистике (остальные не учитываются)
+
+
+def statement_shape(sql: str) -> str:
+    """Вид запроса: текст SQL без различий в длине списков параметров"""
+    return ROW_LIST.sub('(?...)...', PARAM_LIST.sub('(?...)', sql))
+
+
+class UpdateQueries:
+    """
+    Запросы в рамках одного обновления: количество, время SQL, повторы по видам
+    """
+
+    __slots__ = ('label', 'parent', 'queries', 'seconds', 'shapes', 'repeats')
+
+    def __init__(self, label: str, parent=None) -> None:
+        self.label = label
+        self.parent = parent
+        self.queries = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+        self.repeats = []  # (вид запроса, раз) сверх порога repeat_limit
+
+
+class AccountingSqliteDatabase(SqliteDatabase):
+    """
+    SqliteDatabase с учетом запросов: количество и время SQL на обновление (update_scope),
+    статистика по видам запросов (самые медленные - top_statements) и поиск N+1 -
+    один и тот же вид запроса больше repeat_limit раз за обновление
+    """
+
+    def __init__(self, *args, slow_ms: float = 0, repeat_limit: int = 0, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.slow_ms = slow_ms
+        self.repeat_limit = repeat_limit
+        self._thread_stats = threading.local()
+        self._shapes = {}  # вид запроса -> [раз, секунд всего, секунд максимум]
+        self._shapes_lock = threading.Lock()
+
+    def execute_sql(self, sql, params=None, commit=None):
+        started = time.perf_counter()
+        try:
+            return super().execute_sql(sql, params, commit)
+        finally:
+            self._account(sql, time.perf_counter() - started)
+
+    def _account(self, sql: str, elapsed: float) -> None:
+        shape = statement_shape(sql)
+
+        scope = getattr(self._thread_stats, 'scope', None)
+        while scope is not None:
+            scope.queries += 1
+            scope.seconds += elapsed
+            if self.repeat_limit:
+                scope.shapes[shape] += 1
+            scope = scope.parent
+
+        with self._shapes_lock:
+            stats = self._shapes.get(shape)
+            if stats is None:
+                if len(self._shapes) < MAX_SHAPES:
+                    self._shapes[shape] = [1, elapsed, elapsed]
+            else:
+                stats[0] += 1
+                stats[1] += elapsed
+                if elapsed > stats[2]:
+                    stats[2] = elapsed
+
+        if self.slow_ms and elapsed * 1000 >= self.slow_ms:
+            logger.warning(f"Медленный запрос ({elapsed * 1000:.1f} мс): {shape[:300]}")
+
+    @contextmanager
+    def update_scope(self, label: str):
+        """
+        Учет запросов текущего потока в блоке with (обработка одного обновления).
+        Вложенные блоки учитываются и во внешнем; повторы проверяет только внешний
+        """
+        local = self._thread_stats
+        scope = UpdateQueries(label, getattr(local, 'scope', None))
+        local.scope = scope
+        try:
+            yield scope
+        finally:
+            local.scope = scope.parent
+            if scope.parent is None and self.repeat_limit:
+                self._check_repeats(scope)
+
+    def _check_repeats(self, scope: UpdateQueries) -> None:
+        for shape, count in scope.shapes.items():
+            if count > self.repeat_limit:
+                scope.repeats.append((shape, count))
+                logger.warning(f"Возможен N+1 в {scope.label}: запрос выполнен {count} раз "
+                               f"за обновление: {shape[:300]}")
+
+    def top_statements(self, limit: int = 5) -> list:
+        """Виды запросов с наибольшим общим временем: (вид, раз, секунд всего, секунд максимум)"""
+        with self._shapes_lock:
+            items = [(shape, *stats) for shape, stats in self._shapes.items()]
+        return sorted(items, key=lambda item: item[2], reverse=True)[:limit]
+
+    def log_top_statements(self, limit: int = 5) -> None:
+        """Самые долгие виды запросов в лог"""
+        for shape, count, seconds, longest in self.top_statements(limit):
+            logger.info(f"SQL {seconds * 1000:.1f} мс всего, {count} раз, "
+                        f"среднее {seconds / count * 1000:.2f} мс, максимум {longest * 1000:.1f} мс: {shape[:300]}")
+
+
+db = AccountingSqliteDatabase(
+    DB_PATH,
+    pragmas={
+        'journal_mode': DB_JOURNAL_MODE,
+        'synchronous': DB_SYNCHRONOUS,
+        'cache_size': DB_CACHE_SIZE,
+        'mmap_size': DB_MMAP_SIZE,
+        'temp_store': 'memory',
+    },
+    timeout=DB_BUSY_TIMEOUT,
+    slow_ms=DB_SLOW_QUERY_MS,
+    repeat_limit=DB_REPEAT_LIMIT,
+    thread_safe=True  # Отдельное соединение в каждом потоке (обработчики telebot, фоновые записи)
+)
 
 
 class BaseModel(Model):
@@ -50,6 +182,11 @@ class Date(BaseModel):
     description = CharField()
     due_date = DateTimeField(default=datetime.now().replace(microsecond=0))
 
+    class Meta:
+        indexes = (
+            (('user', 'due_date'), False),  # История визитов пользователя
+        )
+
     def __str__(self):
         return "{date_id}. {title} - {due_date}".format(
             date_id=self.date_id,
@@ -63,19 +200,64 @@ class Orders(BaseModel):
     order_id = AutoField(primary_key=True)
     user = ForeignKeyField(User, backref="orders")
     phone = CharField(max_length=20)
+    phone_normalized = CharField(max_length=16, null=True)  # E.164: +79001234567
     name = CharField(max_length=100)
     service_type = CharField(max_length=100, null=True)  # Услуга
     comment = TextField(null=True)  # Комментарий
     created_date = DateTimeField(default=datetime.now().replace(microsecond=0))
+    session_key = CharField(max_length=40, null=True, unique=True)  # Ключ сессии заявки: повтор не создает строку
+
+    class Meta:
+        indexes = (
+            (('user', 'created_date'), False),  # Заявки пользователя
+            (('phone_normalized', 'created_date'), False),  # История клиента по номеру
+        )
 
     def __str__(self):
         return f"Заявка #{self.order_id} от {self.name}"
 
 
+# Очередь уведомлений администратору о заявках (пишется в одной транзакции с заявкой)
+class AdminNotification(BaseModel):
+    notification_id = AutoField(primary_key=True)
+    order = ForeignKeyField(Orders, backref='notifications', on_delete='CASCADE')
+    chat_id = CharField(max_length=50)
+    text = TextField()
+    attempts = IntegerField(default=0)
+    next_attempt = DateTimeField()  # Не раньше этого времени (повторы с увеличением паузы)
+    last_error = TextField(null=True)
+    sent_date = DateTimeField(null=True)  # NULL - еще не доставлено
+
+    class Meta:
+        indexes = (
+            (('sent_date', 'next_attempt'), False),  # Поиск неотправленных
+        )
+
+
+# Кэш file_id загруженных в Telegram изображений (карта проезда, отзывы)
+class MediaCache(BaseModel):
+    media_key = CharField(max_length=64, primary_key=True)  # url:<sha1 URL> или sha1:<sha1 содержимого>
+    source = TextField()  # URL или имя файла - для отладки
+    file_id = CharField(max_length=200)
+    created_date = DateTimeField()
+
+
+# Состояния диалогов (шаги заявки) - переживают перезапуск бота
+class BotState(BaseModel):
+    chat_id = IntegerField()
+    user_id = IntegerField()
+    state = CharField(null=True)
+    data = TextField(default='{}')  # JSON с данными заявки
+    updated_date = DateTimeField()
+
+    class Meta:
+        primary_key = CompositeKey('chat_id', 'user_id')
+
+
 # Таблицы для студии йоги
 class Menu(BaseModel):
     menu_id = IntegerField(primary_key=True)
-    menu_title = CharField(max_length=50)
+    menu_title = CharField(max_length=50, unique=True)
     menu_description = TextField()
 
 
@@ -83,12 +265,21 @@ class Programs(BaseModel):
     program_id = IntegerField(primary_key=True)
     multiple_menu_ids = CharField(max_length=50, null=True)
     menu = ForeignKeyField(Menu, backref='programs', on_delete='CASCADE')
-    program_title = CharField(max_length=200)
+    program_title = CharField(max_length=200, unique=True)
     program_description = TextField()
-    program_duration = CharField(max_length=100)
+    program_duration = CharField(max_length=100, index=True)
     program_price = CharField(max_length=50)
 
 
+class ProgramMenu(BaseModel):
+    """Привязка программ к разделам меню (многие-ко-многим), заменяет multiple_menu_ids"""
+    menu = ForeignKeyField(Menu, backref='program_links', on_delete='CASCADE')
+    program = ForeignKeyField(Programs, backref='menu_links', on_delete='CASCADE')
+
+    class Meta:
+        primary_key = CompositeKey('menu', 'program')
+
+
 class Price(BaseModel):
     price_id = IntegerField(primary_key=True)
     menu = ForeignKeyField(Menu, backref='prices', on_delete='CASCADE')
@@ -108,7 +299,7 @@ class PriceDetail(BaseModel):
 class Contacts(BaseModel):
     contacts_id = IntegerField(primary_key=True)
     menu = ForeignKeyField(Menu, backref='contacts', on_delete='CASCADE')
-    contacts_title = CharField(max_length=20)
+    contacts_title = CharField(max_length=20, index=True)
     contacts_description = CharField(max_length=200)
 
 
@@ -144,25 +335,158 @@ class Reviews(BaseModel):
 class FAQ(BaseModel):
     faq_id = IntegerField(primary_key=True)
     menu = ForeignKeyField(Menu, backref='faqs', on_delete='CASCADE')
-    question = TextField()
+    question = TextField(unique=True)
     answer = TextField()
 
 
+MODELS = (
+    User, Date, Orders, AdminNotification, BotState, MediaCache, Menu, Price, PriceDetail, Contacts, Events,
+    Mentors, Retreats, Reviews, Programs, ProgramMenu, FAQ
+)
+
+
+def ensure_columns():
+    """
+    Добавляет в существующие таблицы колонки, объявленные в моделях позже создания таблиц.
+    Добавляются только колонки, допускающие NULL (старые строки получают NULL)
+    """
+    try:
+        migrator = SqliteMigrator(db)
+        for model in MODELS:
+            table = model._meta.table_name
+            if not db.table_exists(table):
+                continue
+
+            existing = {column.name for column in db.get_columns(table)}
+            for field in model._meta.sorted_fields:
+                if field.column_name in existing or not field.null:
+                    continue
+
+                with db.atomic():
+                    migrate(migrator.add_column(table, field.column_name, field))
+                logger.info(f"Добавлена колонка {table}.{field.column_name}")
+
+    except Exception as e:
+        logger.error(f"Ошибка при добавлении колонок DB: {e}")
+        raise
+
+
+def ensure_indexes():
+    """
+    Создает недостающие индексы моделей в существующих таблицах.
+    Если уникальный индекс не создается из-за повторов в данных, создается обычный
+    с тем же именем (поиск ускоряется, повторы нужно исправить в каталоге)
+    """
+    try:
+        for model in MODELS:
+            table = model._meta.table_name
+            if not db.table_exists(table):
+                continue
+
+            existing = {index.name for index in db.get_indexes(table)}
+            for index in model._meta.fields_to_index():
+                if index._name in existing:
+                    continue
+
+                try:
+                    with db.atomic():
+                        db.execute(model._schema._create_index(index))
+                    logger.info(f"Создан индекс {index._name}")
+                except IntegrityError:
+                    fallback = index.clone()
+                    fallback._unique = False
+                    db.execute(model._schema._create_index(fallback))
+                    logger.warning(f"Повторяющиеся значения в {table}: индекс {index._name} создан неуникальным")
+
+    except Exception as e:
+        logger.error(f"Ошибка при создании индексов DB: {e}")
+        raise
+
+
 def create_tables():
     """Создает таблицы в базе данных, если они не существуют"""
     try:
         with db:
-            models = [
-                User, Date, Orders, Menu, Price, PriceDetail, Contacts, Events,
-                Mentors, Retreats, Reviews, Programs, FAQ
-            ]
-            db.create_tables(models, safe=True)
+            db.create_tables(MODELS, safe=True)
             logging.info("Таблицы базы данных проверены/созданы")
     except Exception as e:
         logger.error(f"Ошибка при создании таблиц DB: {e}")
         raise
 
 
+def program_menu_links(programs) -> set:
+    """
+    Связи (menu_id, program_id) по строкам Programs (program_id, menu, multiple_menu_ids):
+    основной раздел и разделы из CSV-колонки multiple_menu_ids
+    """
+    links = set()
+    for program_id, menu_id, multiple_menu_ids in programs:
+        if menu_id is not None:
+            links.add((int(menu_id), program_id))
+        if multiple_menu_ids:
+            links.update((int(id_str), program_id) for id_str in str(multiple_menu_ids).split(',')
+                         if id_str.strip().isdigit())
+    return links
+
+
+def sync_program_menus(links: set, existing: set) -> bool:
+    """
+    Приводит ProgramMenu к набору связей links (existing - связи в таблице).
+    Пишет только разницу; True, если таблица изменилась
+    """
+    stale, missing = existing - links, links - existing
+    for menu_id, program_id in stale:
+        ProgramMenu.delete().where((ProgramMenu.menu == menu_id) & (ProgramMenu.program == program_id)).execute()
+    if missing:
+        ProgramMenu.insert_many(
+            [{'menu': menu_id, 'program': program_id} for menu_id, program_id in sorted(missing)]
+        ).on_conflict_ignore().execute()
+
+    if stale or missing:
+        logger.info(f"Связи программ с меню обновлены из Programs: добавлено {len(missing)}, удалено {len(stale)}")
+    return bool(stale or missing)
+
+
+def migrate_program_menus():
+    """
+    Заполняет ProgramMenu из Programs.menu и CSV-колонки Programs.multiple_menu_ids.
+    Контент правится в Programs, поэтому связи сверяются при каждом запуске
+    (и при каждой загрузке каталога - reload_catalog)
+    """
+    try:
+        with db.atomic():
+            links = program_menu_links(
+                Programs.select(Programs.program_id, Programs.menu, Programs.multiple_menu_ids).tuples())
+            existing = set(ProgramMenu.select(ProgramMenu.menu, ProgramMenu.program).tuples())
+            sync_program_menus(links, existing)
+
+    except Exception as e:
+        logger.error(f"Ошибка при переносе multiple_menu_ids в ProgramMenu: {e}")
+        raise
+
+
+def ensure_user_key():
+    """
+    Уникальный индекс user.user_id для upsert профилей.
+    Таблица user могла быть создана без первичного ключа: дубликаты удаляются (остается первая запись)
+    """
+    try:
+        if 'user_id' in db.get_primary_keys('user') or any(
+                index.unique and index.columns == ['user_id'] for index in db.get_indexes('user')):
+            return
+
+        with db.atomic():
+            deleted = db.execute_sql(
+                'DELETE FROM "user" WHERE rowid NOT IN (SELECT MIN(rowid) FROM "user" GROUP BY "user_id")'
+            ).rowcount
+            db.execute_sql('CREATE UNIQUE INDEX IF NOT EXISTS "user_user_id" ON "user" ("user_id")')
+        logger.info(f"Создан уникальный индекс user.user_id, удалено дубликатов: {deleted}")
+
+    except Exception as e:
+        logger.error(f"Ошибка при создании индекса user.user_id: {e}")
+        raise
+
+
 def init_database():
     """Инициализация базы данных - только создание таблиц"""
     logging.info(f"Инициализация DB: {DB_PATH}")
@@ -175,8 +499,13 @@ def init_database():
     else:
         logging.info("Создание новой DB")
 
-    # Только создаем таблицы, не заполняем данными
+    # Только создаем таблицы и индексы, не заполняем данными
+    if db_exists:
+        ensure_columns()
+        ensure_indexes()
     create_tables()
+    migrate_program_menus()
+    ensure_user_key()
 
 
 # При импорте модуля только создаем таблицы
@@ -0,0 +1,22 @@
+import os
+import sys
+import tempfile
+
+
+"""
+    Тесты запускаются из каталога бота:
+        python -m pytest tests
+
+    Настройки бота читаются при импорте config - до импорта модулей бота задается
+    окружение: копия database.db во временном каталоге (рабочая DB не меняется)
+    и тестовый BOT_TOKEN. Сеть не нужна: обращения к Bot API подменяются в тестах.
+"""
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from tools.bench import seed_database  # noqa: E402
+
+os.environ['DB_PATH'] = seed_database(os.path.join(ROOT, 'database.db'), tempfile.mkdtemp(prefix='yogita_tests_'))
+os.environ.setdefault('BOT_TOKEN', '123456:TEST')
@@ -0,0 +1,54 @@
+import asyncio
+import threading
+
+import pytest
+from telebot.types import Update
+
+from loader import bot
+from utils.webhook import update_chat_id
+
+async_engine = pytest.importorskip('utils.async_engine')  # Режим async требует aiohttp
+
+
+"""
+    Режим async: маршрутизация обновлений по чату (общая с webhook и sharded)
+    и остановка опроса отменой задачи.
+"""
+
+CHAT = {'id': 42, 'type': 'private'}
+USER = {'id': 7, 'is_bot': False, 'first_name': 'Test'}
+MESSAGE = {'message_id': 1, 'date': 0, 'chat': CHAT, 'from': USER, 'text': 'Привет'}
+
+
+@pytest.mark.parametrize('update, chat_id', [
+    ({'update_id': 1, 'message': MESSAGE}, 42),
+    ({'update_id': 2, 'callback_query': {'id': 'q', 'from': USER, 'chat_instance': 'c', 'message': MESSAGE}}, 42),
+    ({'update_id': 3, 'callback_query': {'id': 'q', 'from': USER, 'chat_instance': 'c'}}, 7),
+    ({'update_id': 4, 'poll_answer': {'poll_id': 'p', 'user': USER, 'option_ids': [0]}}, 7),
+    ({'update_id': 5}, 5),
+])
+def test_chat_id_same_for_json_and_update(update, chat_id):
+    assert update_chat_id(update) == chat_id
+    assert update_chat_id(Update.de_json(update)) == chat_id
+
+
+def test_stop_cancels_polling(monkeypatch):
+    engine = async_engine.AsyncEngine(bot, workers=1)
+    send_message = bot.send_message
+    polling = threading.Event()
+
+    async def infinity_polling(*args, **kwargs):
+        polling.set()
+        await asyncio.sleep(3600)
+
+    async def close_session():
+        pass
+
+    monkeypatch.setattr(engine.async_bot, 'infinity_polling', infinity_polling)
+    monkeypatch.setattr(engine.async_bot, 'close_session', close_session)
+
+    threading.Thread(target=lambda: polling.wait(5) and engine.stop(), daemon=True).start()
+    asyncio.run(asyncio.wait_for(engine.run(), timeout=5))
+
+    # Методы отправки синхронного бота восстановлены
+    assert bot.send_message == send_message
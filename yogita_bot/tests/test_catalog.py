@@ -0,0 +1,53 @@
+import pytest
+
+from models import Programs, ProgramMenu
+from utils.catalog import reload_catalog
+
+
+"""
+    Разделы программ правятся в Programs (menu и multiple_menu_ids):
+    после reload_catalog() программы разделов соответствуют этим колонкам.
+"""
+
+PROGRAM_ID = 1  # Пилатес на реформере: раздел 4
+WEIGHT_MENU_ID = 16  # Коррекция веса
+PREGNANCY_MENU_ID = 15  # Для беременных / после родов
+
+
+def section_titles(catalog, menu_id: int) -> set:
+    return {program.program_title for program in catalog.programs_by_section.get(menu_id, ())}
+
+
+@pytest.fixture
+def program():
+    """Программа каталога; исходные разделы восстанавливаются после теста"""
+    row = Programs.get_by_id(PROGRAM_ID)
+    yield row
+    Programs.update(menu=row.menu_id, multiple_menu_ids=row.multiple_menu_ids).where(
+        Programs.program_id == PROGRAM_ID).execute()
+    reload_catalog()
+
+
+def test_reload_applies_multiple_menu_ids(program):
+    reload_catalog()
+
+    Programs.update(multiple_menu_ids=f"4, {WEIGHT_MENU_ID}").where(Programs.program_id == PROGRAM_ID).execute()
+    catalog = reload_catalog()
+    assert program.program_title in section_titles(catalog, WEIGHT_MENU_ID)
+
+    Programs.update(multiple_menu_ids=f"4, {PREGNANCY_MENU_ID}").where(Programs.program_id == PROGRAM_ID).execute()
+    catalog = reload_catalog()
+    assert program.program_title not in section_titles(catalog, WEIGHT_MENU_ID)
+    assert program.program_title in section_titles(catalog, PREGNANCY_MENU_ID)
+
+    # Связи в DB совпадают со снимком
+    links = set(ProgramMenu.select(ProgramMenu.menu).where(ProgramMenu.program == PROGRAM_ID).tuples())
+    assert links == {(4,), (PREGNANCY_MENU_ID,)}
+
+
+def test_reload_applies_main_menu(program):
+    Programs.update(menu=WEIGHT_MENU_ID, multiple_menu_ids=None).where(Programs.program_id == PROGRAM_ID).execute()
+    catalog = reload_catalog()
+
+    assert program.program_title in section_titles(catalog, WEIGHT_MENU_ID)
+    assert program.program_title not in section_titles(catalog, 4)
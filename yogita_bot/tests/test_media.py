@@ -0,0 +1,83 @@
+from concurrent.futures import Future
+from types import SimpleNamespace
+
+import pytest
+from telebot.apihelper import ApiTelegramException
+
+from models import db, MediaCache
+from utils import media
+from utils.media import MediaFileCache, media_key, send_cached_photo
+
+
+"""
+    Ответ Telegram на отправку изображения обрабатывается в потоке отправки:
+    кэш file_id меняется в памяти, запись в DB выполняет фоновый поток кэша.
+"""
+
+CHAT_ID = 7_000_000_002
+SOURCE = 'https://example.com/map.png'
+
+
+def photo_message(file_id: str):
+    return SimpleNamespace(photo=[SimpleNamespace(file_id=file_id)])
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = MediaFileCache()
+    monkeypatch.setattr(media, 'media_cache', cache)
+    cache.start()
+    yield cache
+    cache.stop()
+    MediaCache.delete().where(MediaCache.media_key == media_key(SOURCE)).execute()
+
+
+@pytest.fixture
+def sends(monkeypatch):
+    """Заглушка отправки через очередь: send_photo возвращает Future, ответ задает тест"""
+    futures = []
+
+    def send_photo(chat_id, photo, **kwargs):
+        future = Future()
+        futures.append((photo, future))
+        return future
+
+    monkeypatch.setattr(media.bot, 'send_photo', send_photo)
+    return futures
+
+
+def stored_file_id():
+    row = MediaCache.get_or_none(MediaCache.media_key == media_key(SOURCE))
+    return row.file_id if row else None
+
+
+def test_sent_callback_does_not_write_db(cache, sends):
+    send_cached_photo(CHAT_ID, SOURCE)
+    (photo, future), = sends
+    assert photo == SOURCE
+
+    # Ответ Telegram - в потоке отправки: без запросов к DB
+    with db.update_scope('on_done') as scope:
+        future.set_result(photo_message('file-1'))
+    assert scope.queries == 0
+    assert cache.get(media_key(SOURCE)) == 'file-1'
+
+    cache.flush()
+    assert stored_file_id() == 'file-1'
+
+
+def test_rejected_file_id_is_forgotten_and_resent(cache, sends):
+    cache.remember(media_key(SOURCE), SOURCE, 'file-old')
+    cache.flush()
+
+    send_cached_photo(CHAT_ID, SOURCE)
+    error = ApiTelegramException('sendPhoto', None, {'error_code': 400, 'description': 'Bad Request'})
+    with db.update_scope('on_done') as scope:
+        sends[0][1].set_exception(error)
+    assert scope.queries == 0
+
+    # Повторная отправка из источника, file_id из ответа заменяет отклоненный
+    assert sends[1][0] == SOURCE
+    sends[1][1].set_result(photo_message('file-new'))
+    cache.flush()
+    assert stored_file_id() == 'file-new'
@@ -0,0 +1,59 @@
+import pytest
+from telebot.types import Message
+
+from handlers.custom_handlers.c_handlers import bot, get_comment_and_save
+from models import Orders, User, AdminNotification
+
+
+"""
+    Повтор заявки: одна сессия диалога (сообщение с телефоном) - одна заявка,
+    новая сессия с теми же телефоном и программой - новая заявка.
+"""
+
+CHAT_ID = 7_000_000_003
+PROGRAM = 'Йога'
+
+
+def make_message(message_id: int, text: str) -> Message:
+    return Message.de_json({
+        'message_id': message_id, 'date': 1_700_000_000, 'text': text,
+        'chat': {'id': CHAT_ID, 'type': 'private'},
+        'from': {'id': CHAT_ID, 'is_bot': False, 'first_name': 'Test'},
+    })
+
+
+@pytest.fixture(autouse=True)
+def customer(monkeypatch):
+    monkeypatch.setattr(bot, 'send_message', lambda *args, **kwargs: None)
+    User.insert(user_id=CHAT_ID, first_name='Test').on_conflict_ignore().execute()
+    yield
+    order_ids = [order.order_id for order in Orders.select(Orders.order_id).where(Orders.user == CHAT_ID)]
+    if order_ids:
+        AdminNotification.delete().where(AdminNotification.order.in_(order_ids)).execute()
+    Orders.delete().where(Orders.user == CHAT_ID).execute()
+    bot.delete_state(CHAT_ID, CHAT_ID)
+
+
+def submit(phone_message_id: int, comment_message_id: int) -> None:
+    """Шаги заявки до комментария: телефон из сообщения phone_message_id, затем отправка"""
+    bot.set_state(CHAT_ID, 'States:order_comment', CHAT_ID)
+    bot.add_data(CHAT_ID, CHAT_ID, phone='+79001234567', phone_message_id=phone_message_id,
+                 name='Test', selected_program=PROGRAM)
+    get_comment_and_save(make_message(comment_message_id, 'Пропустить'))
+
+
+def orders() -> int:
+    return Orders.select().where(Orders.user == CHAT_ID).count()
+
+
+def test_repeated_submission_is_one_order():
+    submit(phone_message_id=10, comment_message_id=12)
+    submit(phone_message_id=10, comment_message_id=13)
+    assert orders() == 1
+
+
+def test_new_session_is_new_order():
+    """Две заявки подряд (в пределах минуты) с теми же телефоном и программой"""
+    submit(phone_message_id=10, comment_message_id=12)
+    submit(phone_message_id=20, comment_message_id=22)
+    assert orders() == 2
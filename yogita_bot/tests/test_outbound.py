@@ -0,0 +1,68 @@
+import logging
+import threading
+import time
+
+from telebot.apihelper import ApiTelegramException
+
+from utils.outbound import OutboundScheduler
+
+
+"""
+    Очередь исходящих сообщений: 429 приостанавливает отправку во все чаты,
+    ошибки отправки пишет в лог сама очередь.
+"""
+
+RETRY_AFTER = 0.3
+
+
+def flood_error() -> ApiTelegramException:
+    return ApiTelegramException('sendMessage', None, {
+        'error_code': 429, 'description': 'Too Many Requests', 'parameters': {'retry_after': RETRY_AFTER},
+    })
+
+
+def test_flood_limit_pauses_all_chats():
+    sent = []
+    lock = threading.Lock()
+
+    def send(chat_id, text):
+        with lock:
+            first = not sent
+            sent.append((chat_id, time.monotonic()))
+        if first:
+            raise flood_error()
+        return text
+
+    outbound = OutboundScheduler(global_rate=100, chat_rate=100, chat_burst=10, workers=2)
+    outbound.start()
+    try:
+        started = time.monotonic()
+        flooded = outbound.submit(send, 1, 'a')
+        time.sleep(0.05)  # Ответ 429 получен до отправки в другой чат
+        other = outbound.submit(send, 2, 'b')
+
+        assert other.result(timeout=5) == 'b'
+        assert flooded.result(timeout=5) == 'a'
+    finally:
+        outbound.stop()
+
+    other_sent = next(at for chat_id, at in sent if chat_id == 2)
+    assert other_sent - started >= RETRY_AFTER
+
+
+def test_send_failure_is_logged_by_queue(caplog):
+    def send(chat_id, text):
+        raise ApiTelegramException('sendMessage', None, {'error_code': 403, 'description': 'Forbidden'})
+
+    outbound = OutboundScheduler(workers=1)
+    outbound.start()
+    try:
+        with caplog.at_level(logging.ERROR, logger='utils.outbound'):
+            future = outbound.submit(send, 5, 'text')
+            assert isinstance(future.exception(timeout=5), ApiTelegramException)
+            outbound.join(timeout=5)
+    finally:
+        outbound.stop()
+
+    errors = [record for record in caplog.records if record.levelno == logging.ERROR]
+    assert len(errors) == 1 and 'чат 5' in errors[0].getMessage()
@@ -0,0 +1,72 @@
+import pytest
+
+from models import db, Orders, User
+from utils import phone as phone_utils
+from utils.phone import is_valid_phone, normalize_phone
+
+CUSTOMER_ID = 7_000_000_004
+
+
+@pytest.mark.parametrize('phone, expected', [
+    ('+7 (900) 123-45-67', '+79001234567'),
+    ('8 900 123 45 67', '+79001234567'),
+    ('79001234567', '+79001234567'),
+    ('9001234567', '+79001234567'),
+    # Неполные номера в 10 цифр с кодом страны или 8 - не E.164
+    ('8900123456', None),
+    ('7900123456', None),
+    ('', None),
+    ('123', None),
+])
+def test_normalize_phone(phone, expected):
+    assert normalize_phone(phone) == expected
+
+
+@pytest.mark.parametrize('phone, expected', [
+    ('+7 (900) 123-45-67', True),
+    ('89001234567', True),
+    ('9001234567', True),
+    ('8900123456', False),
+    ('7900123456', False),
+    ('+7 900 abc', False),
+])
+def test_is_valid_phone(phone, expected):
+    assert is_valid_phone(phone) is expected
+
+
+def test_valid_phone_normalizes():
+    """Номер, принятый is_valid_phone, всегда приводится к E.164"""
+    for phone in ('89001234567', '+79001234567', '9001234567', '8 (900) 123-45-67'):
+        assert is_valid_phone(phone)
+        assert normalize_phone(phone) == '+79001234567'
+
+
+
+@pytest.fixture
+def legacy_orders():
+    """Заявки до нормализации номеров: обычный номер, нераспознаваемый и записанный из неполного"""
+    User.insert(user_id=CUSTOMER_ID, first_name='Test').on_conflict_ignore().execute()
+    rows = {
+        number: Orders.create(user=CUSTOMER_ID, phone=number, name='Test', phone_normalized=stored).order_id
+        for number, stored in (('89001234567', None), ('12-34', None), ('8900123456', '+78900123456'))
+    }
+    db.user_version = 0  # DB до однократного исправления
+    yield rows
+    Orders.delete().where(Orders.user == CUSTOMER_ID).execute()
+
+
+def test_backfill_marks_orders_once(legacy_orders, monkeypatch):
+    phone_utils.backfill_orders()
+    stored = dict(Orders.select(Orders.order_id, Orders.phone_normalized)
+                  .where(Orders.order_id.in_(list(legacy_orders.values()))).tuples())
+
+    assert stored[legacy_orders['89001234567']] == '+79001234567'
+    assert stored[legacy_orders['12-34']] == phone_utils.NOT_NORMALIZED
+    assert stored[legacy_orders['8900123456']] == phone_utils.NOT_NORMALIZED
+    assert db.user_version == phone_utils.REPAIRED_VERSION
+
+    # Следующий запуск: заполнять нечего, исправление не повторяется
+    repairs = []
+    monkeypatch.setattr(phone_utils, 'repair_orders', lambda: repairs.append(1) or 0)
+    assert phone_utils.backfill_orders() == 0
+    assert not repairs
@@ -0,0 +1,65 @@
+import pytest
+from telebot.types import Message
+
+from handlers.custom_handlers.c_handlers import bot, display_all_programs, display_pricing
+from models import db
+from utils.catalog import CATALOG_MODELS, reload_catalog
+from utils.render_cache import render_cache
+
+
+"""
+    Запросы к DB информационных разделов: ответ собирается из снимка каталога,
+    а не запросами на каждую строку (N+1). Запросы считает db.update_scope.
+"""
+
+CHAT_ID = 7_000_000_001
+
+
+def make_message(text: str) -> Message:
+    return Message.de_json({
+        'message_id': 1, 'date': 0, 'text': text,
+        'chat': {'id': CHAT_ID, 'type': 'private'},
+        'from': {'id': CHAT_ID, 'is_bot': False, 'first_name': 'Test'},
+    })
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    """Заглушка отправки: тексты сообщений вместо запросов к Bot API"""
+    messages = []
+    monkeypatch.setattr(bot, 'send_message', lambda chat_id, text, **kwargs: messages.append(text))
+    return messages
+
+
+@pytest.mark.parametrize('view, title', [
+    (display_pricing, "Стоимость занятий"),
+    (display_all_programs, None),
+])
+def test_view_queries(sent, view, title):
+    """Холодный кэш ответов - не больше одного запроса, повторный показ - без запросов"""
+    reload_catalog()
+    render_cache.clear()
+
+    with db.update_scope(view.__name__) as cold:
+        view(make_message('/test'))
+    with db.update_scope(view.__name__) as warm:
+        view(make_message('/test'))
+
+    assert cold.queries <= 1
+    assert warm.queries == 0
+    assert len(sent) == 2 and sent[0] == sent[1]
+    assert not sent[0].startswith("Ошибка")
+    if title:
+        assert sent[0].startswith(title)
+
+
+def test_catalog_load_is_one_select_per_table(monkeypatch):
+    """Снимок каталога читается одним запросом на таблицу, независимо от числа строк"""
+    monkeypatch.setattr(db, 'repeat_limit', 1_000_000)  # Учет запросов по видам
+
+    with db.update_scope('reload_catalog') as scope:
+        reload_catalog()
+
+    selects = {shape: count for shape, count in scope.shapes.items() if shape.startswith('SELECT')}
+    assert len(selects) == len(CATALOG_MODELS)
+    assert all(count == 1 for count in selects.values())
@@ -0,0 +1,476 @@
+from collections import defaultdict
+from datetime import datetime
+import argparse
+import functools
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+
+"""
+    Замер обработчиков: прогон обновлений (Update) через зарегистрированные обработчики бота.
+
+    Работает без сети: запросы к Bot API перехватываются (apihelper.CUSTOM_REQUEST_SENDER)
+    и записываются, а бот работает с копией database.db во временном каталоге -
+    рабочая DB не меняется. Сценарии (start, browse, faq, order, spam) строятся по
+    каталогу, записанные обновления можно передать файлом (--updates, JSON по строке).
+
+    Для каждого обработчика: количество обновлений, ошибки, задержка p50/p95/p99,
+    запросов к DB, время SQL и вызовов Bot API на обновление, выделено памяти
+    (tracemalloc, отдельный проход - трассировка замедляет обработку), запросы,
+    повторенные больше --repeat-limit раз за обновление (N+1). Результат - JSON,
+    два результата сравниваются через --compare.
+
+        python -m tools.bench --iterations 20 --output bench.json
+        python -m tools.bench --compare bench.json
+"""
+
+SCENARIOS = ('start', 'browse', 'faq', 'order', 'spam')
+
+DEFAULT_DB = os.path.join(os.path.dirname(__file__), '..', 'database.db')
+FIRST_CHAT_ID = 7_000_000_000  # chat_id симулированных пользователей (не пересекаются с настоящими)
+NO_HANDLER = '<none>'
+
+SPAM_TEXTS = ('привет', 'сколько стоит?', 'а есть занятия вечером', '???', 'йога', 'Kids', 'хочу записаться',
+              'ок', 'спасибо', 'где вы находитесь')
+
+
+def seed_database(source: str, target_dir: str) -> str:
+    """Копия DB для замера (через backup API - с учетом незаписанного WAL)"""
+    target = os.path.join(target_dir, 'database.db')
+    with sqlite3.connect(source) as src, sqlite3.connect(target) as dst:
+        src.backup(dst)
+    return target
+
+
+class Transport:
+    """
+    Заглушка Bot API: записывает вызовы и отвечает как Telegram
+    """
+
+    def __init__(self) -> None:
+        self.calls = []
+        self._message_ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def __call__(self, method, url, params=None, files=None, **kwargs):
+        api_method = url.rsplit('/', 1)[-1]
+        params = dict(params or {})
+        with self._lock:
+            self.calls.append((threading.get_ident(), api_method))
+        return FakeResponse(self._result(api_method, params))
+
+    def _result(self, api_method: str, params: dict):
+        if api_method not in ('sendMessage', 'sendPhoto'):
+            return True
+
+        message_id = next(self._message_ids)
+        result = {'message_id': message_id, 'date': int(time.time()),
+                  'chat': {'id': int(params.get('chat_id', 0)), 'type': 'private'}}
+        if api_method == 'sendPhoto':
+            result['photo'] = [{'file_id': f'BENCH{message_id}', 'file_unique_id': f'b{message_id}',
+                                'width': 600, 'height': 400}]
+        else:
+            result['text'] = params.get('text', '')
+        return result
+
+    def count(self, thread_id: int) -> int:
+        """Вызовы из потока (фоновые сервисы не учитываются)"""
+        with self._lock:
+            return sum(1 for ident, _ in self.calls if ident == thread_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.calls.clear()
+
+
+class FakeResponse:
+    """Ответ requests для apihelper"""
+
+    status_code = 200
+    reason = 'OK'
+
+    def __init__(self, result) -> None:
+        self._json = {'ok': True, 'result': result}
+        self.text = json.dumps(self._json)
+
+    def json(self):
+        return self._json
+
+
+def instrument_handlers(bot) -> dict:
+    """Оборачивает обработчики сообщений; возвращает ячейку с именем последнего сработавшего"""
+    fired = {'name': NO_HANDLER}
+
+    def wrap(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            fired['name'] = function.__name__
+            return function(*args, **kwargs)
+        return wrapper
+
+    for handler in bot.message_handlers:
+        handler['function'] = wrap(handler['function'])
+    return fired
+
+
+class UpdateFactory:
+    """
+    Обновления Telegram от симулированных пользователей
+    """
+
+    def __init__(self) -> None:
+        self._ids = itertools.count(1)
+
+    def message(self, chat_id: int, text: str = None, contact: str = None) -> dict:
+        message = {
+            'message_id': next(self._ids),
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private', 'first_name': f'Bench{chat_id}'},
+            'from': {'id': chat_id, 'is_bot': False, 'first_name': f'Bench{chat_id}', 'language_code': 'ru'},
+        }
+        if contact:
+            message['contact'] = {'phone_number': contact, 'first_name': f'Bench{chat_id}', 'user_id': chat_id}
+        else:
+            message['text'] = text
+            if text.startswith('/'):
+                message['entities'] = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}]
+        return {'update_id': next(self._ids), 'message': message}
+
+
+def scenario_steps(name: str, catalog, rnd: random.Random) -> list:
+    """Шаги сценария одного пользователя: текст или ('contact', номер)"""
+    if name == 'start':
+        return ['/start', '/start']
+
+    if name == 'browse':
+        steps = ['/start', '/menu']
+        for menu in sorted(catalog.menus.values(), key=lambda m: m.menu_id):
+            steps += [menu.menu_title, 'Назад']
+        steps += [program.program_title for program in catalog.programs[:5]]
+        return steps
+
+    if name == 'faq':
+        steps = ['/start', 'FAQ']
+        for question in list(catalog.faq_by_question.values())[:10]:
+            steps += [question.question, 'Назад к вопросам']
+        return steps + ['Назад']
+
+    if name == 'order':
+        # Общая заявка (с ошибкой ввода номера) и заявка на программу с отправкой контакта.
+        # Запись начинается из раздела меню - как у пользователей (без состояния диалога данные не сохраняются)
+        from config_data.config import MAIN_MENU_ITEMS
+
+        section = catalog.menus[MAIN_MENU_ITEMS[0]].menu_title
+        phone = f'+7 (9{rnd.randrange(10 ** 2):02d}) {rnd.randrange(10 ** 3):03d}-{rnd.randrange(10 ** 4):04d}'
+        program = rnd.choice(catalog.programs).program_title
+        return ['/start', section, 'Записаться на занятие', '12', phone, 'Бенч', 'Групповое занятие', 'Пропустить',
+                section, program, f'Записаться на "{program}"', ('contact', '7' + phone[4:].replace(' ', '')),
+                'Бенч', 'утром', '/menu']
+
+    if name == 'spam':
+        return ['/start'] + [rnd.choice(SPAM_TEXTS) for _ in range(10)]
+
+    raise ValueError(f"Неизвестный сценарий: {name}")
+
+
+def build_updates(scenarios: list, users: int, catalog, seed: int, chat_ids, recorded: list = None) -> list:
+    """Обновления одного прохода: (сценарий, Update JSON); chat_ids - счетчик новых пользователей"""
+    rnd = random.Random(seed)
+    factory = UpdateFactory()
+
+    updates = []
+    for name in scenarios:
+        for _ in range(users):
+            chat_id = next(chat_ids)
+            for step in scenario_steps(name, catalog, rnd):
+                if isinstance(step, tuple):
+                    updates.append((name, factory.message(chat_id, contact=step[1])))
+                else:
+                    updates.append((name, factory.message(chat_id, step)))
+
+    for update in recorded or ():
+        updates.append(('recorded', update))
+    return updates
+
+
+def load_recorded(path: str) -> list:
+    """Записанные обновления: по одному Update (JSON) в строке"""
+    with open(path, encoding='utf-8') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def percentile(values: list, p: float) -> float:
+    """Перцентиль методом ближайшего ранга"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[rank]
+
+
+class Bench:
+    """
+    Прогон обновлений с замером задержки, запросов к DB, вызовов Bot API и памяти
+    """
+
+    def __init__(self, bot, database, transport: Transport) -> None:
+        from telebot import types
+
+        self.bot = bot
+        self.transport = transport
+        self.database = database
+        self.fired = instrument_handlers(bot)
+        self._update_type = types.Update
+        self._thread_id = threading.get_ident()
+
+    def _process(self, raw: dict):
+        """
+        Одно обновление; возвращает (обработчик, ошибка, секунды, запросы к DB, вызовы API).
+        Запросы учитываются только из потока замера (фоновые сервисы не входят)
+        """
+        update = self._update_type.de_json(raw)
+        self.fired['name'] = NO_HANDLER
+        self.transport.clear()
+
+        error = False
+        with self.database.update_scope(f"обновлении {raw.get('update_id')}") as queries:
+            started = time.perf_counter()
+            try:
+                self.bot.process_new_updates([update])
+            except Exception as e:
+                error = True
+                logger.debug(f"Ошибка обработки обновления {raw.get('update_id')}: {e}")
+            elapsed = time.perf_counter() - started
+
+        return self.fired['name'], error, elapsed, queries, self.transport.count(self._thread_id)
+
+    def measure(self, updates: list) -> dict:
+        """Задержка, запросы (и повторы - N+1) и вызовы API по обработчикам и сценариям"""
+        handlers = defaultdict(empty_stats)
+        scenarios = defaultdict(empty_stats)
+
+        for scenario, raw in updates:
+            name, error, elapsed, queries, api_calls = self._process(raw)
+            for stats in (handlers[name], scenarios[scenario]):
+                stats['latency'].append(elapsed)
+                stats['errors'] += error
+                stats['queries'] += queries.queries
+                stats['sql_seconds'] += queries.seconds
+                stats['api_calls'] += api_calls
+                for shape, count in queries.repeats:
+                    stats['repeats'][shape] = max(stats['repeats'].get(shape, 0), count)
+
+        return {'handlers': dict(handlers), 'scenarios': dict(scenarios)}
+
+    def measure_allocations(self, updates: list) -> dict:
+        """Пиковый прирост памяти на обновление по обработчикам, байт"""
+        allocations = defaultdict(list)
+
+        tracemalloc.start()
+        try:
+            for _, raw in updates:
+                tracemalloc.reset_peak()
+                before, _ = tracemalloc.get_traced_memory()
+                name = self._process(raw)[0]
+                _, peak = tracemalloc.get_traced_memory()
+                allocations[name].append(peak - before)
+        finally:
+            tracemalloc.stop()
+
+        return allocations
+
+
+def empty_stats() -> dict:
+    """Накопитель замеров группы обновлений (обработчик или сценарий)"""
+    return {'latency': [], 'errors': 0, 'queries': 0, 'sql_seconds': 0.0, 'api_calls': 0, 'repeats': {}}
+
+
+def summarize(stats: dict, allocations: dict = None) -> dict:
+    """Сводка по группе обновлений (миллисекунды, средние на обновление)"""
+    summary = {}
+    for name, item in sorted(stats.items()):
+        count = len(item['latency'])
+        latency_ms = [value * 1000 for value in item['latency']]
+        row = {
+            'count': count,
+            'errors': item['errors'],
+            'p50_ms': round(percentile(latency_ms, 50), 3),
+            'p95_ms': round(percentile(latency_ms, 95), 3),
+            'p99_ms': round(percentile(latency_ms, 99), 3),
+            'mean_ms': round(sum(latency_ms) / count, 3) if count else 0.0,
+            'queries_per_update': round(item['queries'] / count, 2) if count else 0.0,
+            'sql_ms_per_update': round(item['sql_seconds'] * 1000 / count, 3) if count else 0.0,
+            'api_calls_per_update': round(item['api_calls'] / count, 2) if count else 0.0,
+        }
+        if allocations is not None and allocations.get(name):
+            row['alloc_kb_per_update'] = round(sum(allocations[name]) / len(allocations[name]) / 1024, 1)
+        if item['repeats']:
+            row['repeated_statements'] = dict(sorted(item['repeats'].items(), key=lambda pair: -pair[1]))
+        summary[name] = row
+    return summary
+
+
+def merge(results: list) -> dict:
+    """Объединяет замеры нескольких проходов"""
+    merged = {'handlers': {}, 'scenarios': {}}
+    for result in results:
+        for group in ('handlers', 'scenarios'):
+            for name, item in result[group].items():
+                target = merged[group].setdefault(name, empty_stats())
+                target['latency'] += item['latency']
+                target['errors'] += item['errors']
+                target['queries'] += item['queries']
+                target['sql_seconds'] += item['sql_seconds']
+                target['api_calls'] += item['api_calls']
+                for shape, count in item['repeats'].items():
+                    target['repeats'][shape] = max(target['repeats'].get(shape, 0), count)
+    return merged
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(__file__), timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+
+def compare(old: dict, new: dict) -> str:
+    """Таблица изменений по обработчикам: p50/p95/p99 и запросы на обновление"""
+    lines = [f"{'обработчик':<32}{'p50 мс':>18}{'p95 мс':>18}{'p99 мс':>18}{'запросов':>14}"]
+    for name in sorted(set(old['handlers']) | set(new['handlers'])):
+        before = old['handlers'].get(name)
+        after = new['handlers'].get(name)
+        if before is None or after is None:
+            lines.append(f"{name:<32}{'только в ' + ('новом' if before is None else 'старом'):>18}")
+            continue
+
+        cells = []
+        for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+            change = (after[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+            cells.append(f"{after[key]:>9.3f} {change:>+6.1f}%")
+        queries = f"{before['queries_per_update']:g}->{after['queries_per_update']:g}"
+        lines.append(f"{name:<32}{cells[0]:>18}{cells[1]:>18}{cells[2]:>18}{queries:>14}")
+    return '\n'.join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m tools.bench', description="Замер обработчиков бота без сети")
+    parser.add_argument('--db', default=DEFAULT_DB, help="исходная DB (копируется, не меняется)")
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                        help="сценарий (можно несколько; по умолчанию все)")
+    parser.add_argument('--updates', help="файл с записанными обновлениями (JSON по строке)")
+    parser.add_argument('--users', type=int, default=5, help="пользователей на сценарий за проход")
+    parser.add_argument('--iterations', type=int, default=10, help="проходов замера")
+    parser.add_argument('--warmup', type=int, default=1, help="проходов прогрева (не учитываются)")
+    parser.add_argument('--seed', type=int, default=1, help="seed генератора сценариев")
+    parser.add_argument('--repeat-limit', type=int, default=3,
+                        help="N+1: один вид запроса больше N раз за обновление (0 - не проверять)")
+    parser.add_argument('--no-alloc', action='store_true', help="без прохода tracemalloc")
+    parser.add_argument('--output', help="файл для результата JSON (по умолчанию stdout)")
+    parser.add_argument('--compare', help="результат прошлого замера для сравнения")
+    parser.add_argument('--verbose', action='store_true', help="вывод ошибок обработчиков")
+    return parser.parse_args(argv)
+
+
+def run(args) -> dict:
+    workdir = tempfile.mkdtemp(prefix='bench_')
+    try:
+        # Настройки бота читаются при импорте config - окружение задается до импорта модулей бота
+        os.environ['DB_PATH'] = seed_database(os.path.abspath(args.db), workdir)
+        os.environ.setdefault('BOT_TOKEN', '123456:BENCH')
+        os.environ['DB_REPEAT_LIMIT'] = str(args.repeat_limit)
+
+        from telebot import apihelper
+        transport = Transport()
+        apihelper.CUSTOM_REQUEST_SENDER = transport
+
+        import main as bot_main
+        from loader import bot, storage
+        from models import db
+        from utils.catalog import get_catalog
+
+        # Те же фоновые сервисы, что и в main.py (их запросы и вызовы API в замер не входят)
+        if not bot_main.setup_database():
+            raise RuntimeError("Не удалось инициализировать копию DB")
+        bot_main.reload_catalog()
+        services = [service for service in (storage, bot_main.visit_log, bot_main.admin_outbox) if hasattr(service, 'start')]
+        for service in services:
+            service.start()
+        bot.add_custom_filter(bot_main.custom_filters.StateFilter(bot))
+        bot_main.dispatcher.install(bot)
+        bot.threaded = False
+
+        bench = Bench(bot, db, transport)
+        recorded = load_recorded(args.updates) if args.updates else None
+        scenarios = args.scenario or list(SCENARIOS)
+        chat_ids = itertools.count(FIRST_CHAT_ID)  # Каждый проход - новые пользователи
+
+        def one_pass(number: int) -> list:
+            return build_updates(scenarios, args.users, get_catalog(), args.seed + number, chat_ids, recorded)
+
+        try:
+            for number in range(args.warmup):
+                bench.measure(one_pass(-1 - number))
+
+            results = [bench.measure(one_pass(number)) for number in range(args.iterations)]
+            allocations = None if args.no_alloc else bench.measure_allocations(one_pass(args.iterations))
+        finally:
+            for service in reversed(services):
+                service.stop()
+            db.close()
+
+        merged = merge(results)
+        return {
+            'meta': {
+                'revision': git_revision(),
+                'date': datetime.now().replace(microsecond=0).isoformat(),
+                'python': platform.python_version(),
+                'scenarios': scenarios,
+                'recorded_updates': len(recorded or ()),
+                'users': args.users,
+                'iterations': args.iterations,
+                'seed': args.seed,
+            },
+            'handlers': summarize(merged['handlers'], allocations),
+            'scenarios': summarize(merged['scenarios']),
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    # Обработчики логируют каждое обновление - без --verbose лог замера только мешает
+    logging.basicConfig(level=logging.WARNING if args.verbose else logging.CRITICAL)
+
+    result = run(args)
+    output = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(output)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            print(compare(json.load(file), result), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
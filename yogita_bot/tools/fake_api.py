@@ -0,0 +1,558 @@
+from collections import Counter, deque
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+from urllib.request import Request, urlopen
+import argparse
+import heapq
+import itertools
+import json
+import random
+import ssl
+import threading
+import time
+import logging
+
+from tools.bench import UpdateFactory, percentile
+
+
+logger = logging.getLogger(__name__)
+
+
+"""
+    Тестовый сервер Bot API для нагрузочных проверок без сети.
+
+    Бот направляется на сервер настройкой TELEGRAM_API_URL (loader.py):
+
+        python -m tools.fake_api --port 8081 --users 2000 --steps 30 --output load.json
+        TELEGRAM_API_URL=http://127.0.0.1:8081 python main.py
+
+    Сервер отвечает на getUpdates (long polling), setWebhook/deleteWebhook (после
+    setWebhook обновления доставляются POST-запросами на адрес webhook), sendMessage,
+    sendPhoto, setMyCommands, getMe; остальные методы возвращают True.
+
+    Симулированные пользователи ходят по меню, нажимая кнопки из последней
+    клавиатуры бота, оставляют заявки (номер текстом или контактом, имя, комментарий)
+    и пишут произвольный текст. Следующее сообщение пользователь отправляет через
+    think-паузу после последнего ответа бота (или после reply_timeout без ответа).
+
+    Отправка сообщений может замедляться (--latency) и отклоняться с 429
+    (случайно - --error-rate, или при превышении лимитов --global-rate/--chat-rate,
+    как у Telegram). Отчет: обновлений в секунду, задержка первого ответа p50/p95/p99,
+    ответы 429, вызовы методов.
+"""
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'FakeBot', 'username': 'fake_bot',
+            'can_join_groups': False, 'can_read_all_group_messages': False, 'supports_inline_queries': False}
+
+SEND_METHODS = ('sendMessage', 'sendPhoto')
+FIRST_CHAT_ID = 8_000_000_000  # chat_id симулированных пользователей
+RETRY_AFTER = 1  # Секунд в ответе 429
+
+FREE_TEXTS = ('привет', 'сколько стоит?', 'есть занятия вечером?', 'йога', 'спасибо', 'где вы находитесь', '???')
+NAMES = ('Анна', 'Мария', 'Ольга', 'Иван', 'Елена')
+
+
+class RateLimiter:
+    """Лимит сообщений в секунду (скользящее окно в 1 секунду)"""
+
+    def __init__(self, rate: float) -> None:
+        self.rate = rate
+        self._sent = {}
+
+    def allow(self, key, now: float) -> bool:
+        if not self.rate:
+            return True
+
+        window = self._sent.setdefault(key, deque())
+        while window and window[0] <= now - 1:
+            window.popleft()
+        if len(window) >= self.rate:
+            return False
+        window.append(now)
+        return True
+
+
+class SimulatedUser:
+    """Пользователь: последняя клавиатура бота, время отправки последнего обновления"""
+
+    __slots__ = ('chat_id', 'steps_left', 'keyboard', 'prompt', 'sent_at', 'generation')
+
+    def __init__(self, chat_id: int, steps: int) -> None:
+        self.chat_id = chat_id
+        self.steps_left = steps
+        self.keyboard = []
+        self.prompt = ''
+        self.sent_at = None
+        self.generation = 0
+
+
+class UserSimulation:
+    """
+    Симулированные пользователи: выбор следующего действия и замер задержки ответа
+    """
+
+    def __init__(self, users: int, steps: int, think: float, reply_timeout: float, ramp_up: float,
+                 seed: int = 1) -> None:
+        self.think = think
+        self.reply_timeout = reply_timeout
+        self.ramp_up = ramp_up
+
+        self.users = {FIRST_CHAT_ID + number: SimulatedUser(FIRST_CHAT_ID + number, steps) for number in range(users)}
+        self.latencies = []
+        self.updates_sent = 0
+        self.timeouts = 0
+        self.finished = threading.Event()
+
+        self._random = random.Random(seed)
+        self._factory = UpdateFactory()
+        self._schedule = []  # (время, порядковый номер, chat_id, generation)
+        self._sequence = itertools.count()
+        self._active = users
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._deliver = None
+
+    # ------------------------------ ДЕЙСТВИЯ ------------------------------
+
+    def _next_message(self, user: SimulatedUser) -> dict:
+        """Следующее сообщение пользователя по последнему ответу бота"""
+        prompt = (user.prompt or '').lower()
+        rnd = self._random
+
+        if user.sent_at is None:
+            return self._factory.message(user.chat_id, '/start')
+
+        if 'телефон' in prompt:
+            phone = f'9{rnd.randrange(10 ** 9):09d}'
+            if rnd.random() < 0.3:
+                return self._factory.message(user.chat_id, contact='7' + phone)
+            return self._factory.message(user.chat_id, f'+7 {phone}')
+
+        if 'имя' in prompt:
+            return self._factory.message(user.chat_id, rnd.choice(NAMES))
+
+        buttons = [text for text in user.keyboard if text.lower() not in ('отмена', 'cancel')]
+        if buttons and rnd.random() < 0.9:
+            orders = [text for text in buttons if text.startswith('Записаться')]
+            if orders and rnd.random() < 0.3:
+                return self._factory.message(user.chat_id, rnd.choice(orders))
+            return self._factory.message(user.chat_id, rnd.choice(buttons))
+
+        if rnd.random() < 0.5:
+            return self._factory.message(user.chat_id, rnd.choice(('/menu', '/start', '/help')))
+        return self._factory.message(user.chat_id, rnd.choice(FREE_TEXTS))
+
+    def _schedule_locked(self, user: SimulatedUser, delay: float) -> None:
+        user.generation += 1
+        heapq.heappush(self._schedule, (time.monotonic() + delay, next(self._sequence), user.chat_id, user.generation))
+        self._wakeup.notify()
+
+    # ------------------------- СОБЫТИЯ СЕРВЕРА -------------------------
+
+    def on_bot_message(self, chat_id: int, text: str, reply_markup) -> None:
+        """Сообщение бота пользователю: замер задержки и планирование следующего шага"""
+        with self._lock:
+            user = self.users.get(chat_id)
+            if user is None:
+                return
+
+            if user.sent_at is not None and user.prompt is None:
+                # Первый ответ на последнее обновление пользователя
+                self.latencies.append(time.monotonic() - user.sent_at)
+            user.prompt = text or ''
+
+            keyboard = _keyboard_texts(reply_markup)
+            if keyboard is not None:
+                user.keyboard = keyboard
+
+            if user.steps_left > 0:
+                self._schedule_locked(user, self.think)
+
+    def _send(self, user: SimulatedUser) -> None:
+        update = self._next_message(user)
+        user.sent_at = time.monotonic()
+        user.prompt = None
+        user.steps_left -= 1
+        self.updates_sent += 1
+
+        if user.steps_left > 0:
+            # Без ответа бота пользователь продолжит после reply_timeout
+            self._schedule_locked(user, self.reply_timeout)
+        else:
+            self._active -= 1
+            if self._active == 0:
+                self.finished.set()
+
+        self._deliver(update)
+
+    def _run(self) -> None:
+        with self._lock:
+            while not self.finished.is_set():
+                if not self._schedule:
+                    self._wakeup.wait(0.5)
+                    continue
+
+                due, _, chat_id, generation = self._schedule[0]
+                delay = due - time.monotonic()
+                if delay > 0:
+                    self._wakeup.wait(delay)
+                    continue
+
+                heapq.heappop(self._schedule)
+                user = self.users[chat_id]
+                if generation != user.generation or user.steps_left <= 0:
+                    continue
+                if user.sent_at is not None and user.prompt is None:
+                    self.timeouts += 1
+                self._send(user)
+
+    def start(self, deliver) -> None:
+        """Запускает пользователей (равномерно за ramp_up секунд); deliver(update) - отправка боту"""
+        self._deliver = deliver
+        with self._lock:
+            for user in self.users.values():
+                self._schedule_locked(user, self._random.uniform(0, self.ramp_up))
+        threading.Thread(target=self._run, name="UserSimulation", daemon=True).start()
+
+
+def _keyboard_texts(reply_markup):
+    """Тексты кнопок reply-клавиатуры; [] - клавиатура убрана, None - не менялась"""
+    if not reply_markup:
+        return None
+    if isinstance(reply_markup, str):
+        try:
+            reply_markup = json.loads(reply_markup)
+        except ValueError:
+            return None
+
+    if reply_markup.get('remove_keyboard'):
+        return []
+    rows = reply_markup.get('keyboard')
+    if rows is None:
+        return None
+    return [button['text'] if isinstance(button, dict) else button for row in rows for button in row]
+
+
+class FakeBotAPI:
+    """
+    Состояние тестового сервера: очередь обновлений, webhook, счетчики и инъекция ошибок
+    """
+
+    def __init__(self, simulation: UserSimulation = None, latency: float = 0.0, error_rate: float = 0.0,
+                 global_rate: float = 0.0, chat_rate: float = 0.0, webhook_workers: int = 8, seed: int = 1) -> None:
+        self.simulation = simulation
+        self.latency = latency
+        self.error_rate = error_rate
+
+        self.calls = Counter()
+        self.rejected = 0
+
+        self._random = random.Random(seed)
+        self._global_limit = RateLimiter(global_rate)
+        self._chat_limit = RateLimiter(chat_rate)
+        self._limit_lock = threading.Lock()
+
+        self._updates = deque()
+        self._update_ids = itertools.count(1)
+        self._updates_ready = threading.Condition()
+
+        self._webhook = None  # (url, secret)
+        self._webhook_workers = webhook_workers
+        self._webhook_threads = []
+        self._message_ids = itertools.count(1)
+
+    # ---------------------------- ОБНОВЛЕНИЯ ----------------------------
+
+    def push_update(self, update: dict) -> None:
+        """Новое обновление для бота (getUpdates или webhook)"""
+        update['update_id'] = next(self._update_ids)
+        with self._updates_ready:
+            self._updates.append(update)
+            self._updates_ready.notify_all()
+
+    def get_updates(self, offset: int = 0, limit: int = 100, timeout: float = 0) -> list:
+        deadline = time.monotonic() + timeout
+        with self._updates_ready:
+            while True:
+                # offset подтверждает получение предыдущих обновлений
+                while self._updates and self._updates[0]['update_id'] < offset:
+                    self._updates.popleft()
+                if self._updates or self._webhook:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._updates_ready.wait(remaining)
+
+            if self._webhook:
+                return []
+            return list(itertools.islice(self._updates, 0, limit))
+
+    def set_webhook(self, url: str, secret: str = None) -> None:
+        with self._updates_ready:
+            self._webhook = (url, secret) if url else None
+            self._updates_ready.notify_all()
+
+        if self._webhook and not self._webhook_threads:
+            for number in range(self._webhook_workers):
+                thread = threading.Thread(target=self._deliver_webhook, name=f"FakeWebhook-{number}", daemon=True)
+                thread.start()
+                self._webhook_threads.append(thread)
+
+    def _deliver_webhook(self) -> None:
+        context = ssl._create_unverified_context()  # Самоподписанный сертификат тестового webhook
+        while True:
+            with self._updates_ready:
+                while not (self._webhook and self._updates):
+                    self._updates_ready.wait()
+                url, secret = self._webhook
+                update = self._updates.popleft()
+
+            headers = {'Content-Type': 'application/json'}
+            if secret:
+                headers['X-Telegram-Bot-Api-Secret-Token'] = secret
+            request = Request(url, data=json.dumps(update).encode('utf-8'), headers=headers)
+            try:
+                with urlopen(request, timeout=30, context=context) as response:
+                    response.read()
+            except Exception as e:
+                # Как Telegram: недоставленное обновление повторяется
+                logger.warning(f"Webhook не принял обновление {update['update_id']}: {e}")
+                time.sleep(0.5)
+                with self._updates_ready:
+                    self._updates.appendleft(update)
+
+    # ----------------------------- ОТПРАВКА -----------------------------
+
+    def _reject(self, chat_id) -> bool:
+        """429: случайная ошибка или превышение лимитов Telegram"""
+        if self.error_rate and self._random.random() < self.error_rate:
+            return True
+        now = time.monotonic()
+        with self._limit_lock:
+            return not (self._global_limit.allow(None, now) and self._chat_limit.allow(chat_id, now))
+
+    def send(self, method: str, params: dict):
+        """sendMessage / sendPhoto: (HTTP статус, ответ)"""
+        if self.latency:
+            time.sleep(self._random.uniform(0.5, 1.5) * self.latency)
+
+        chat_id = int(params.get('chat_id', 0))
+        if self._reject(chat_id):
+            self.rejected += 1
+            return 429, {'ok': False, 'error_code': 429,
+                         'description': f'Too Many Requests: retry after {RETRY_AFTER}',
+                         'parameters': {'retry_after': RETRY_AFTER}}
+
+        message_id = next(self._message_ids)
+        result = {'message_id': message_id, 'date': int(time.time()), 'from': BOT_USER,
+                  'chat': {'id': chat_id, 'type': 'private'}}
+        if method == 'sendPhoto':
+            result['photo'] = [{'file_id': f'FAKE{message_id}', 'file_unique_id': f'f{message_id}',
+                                'width': 600, 'height': 400}]
+            if params.get('caption'):
+                result['caption'] = params['caption']
+        else:
+            result['text'] = params.get('text', '')
+
+        if self.simulation:
+            self.simulation.on_bot_message(chat_id, params.get('text') or params.get('caption'),
+                                           params.get('reply_markup'))
+        return 200, {'ok': True, 'result': result}
+
+    def call(self, method: str, params: dict):
+        """Метод Bot API: (HTTP статус, ответ)"""
+        self.calls[method] += 1
+
+        if method == 'getUpdates':
+            updates = self.get_updates(int(params.get('offset') or 0), int(params.get('limit') or 100),
+                                       float(params.get('timeout') or 0))
+            return 200, {'ok': True, 'result': updates}
+        if method in SEND_METHODS:
+            return self.send(method, params)
+        if method == 'getMe':
+            return 200, {'ok': True, 'result': BOT_USER}
+        if method == 'setWebhook':
+            self.set_webhook(params.get('url'), params.get('secret_token'))
+            return 200, {'ok': True, 'result': True, 'description': 'Webhook was set'}
+        if method == 'deleteWebhook':
+            self.set_webhook(None)
+            return 200, {'ok': True, 'result': True, 'description': 'Webhook was deleted'}
+        if method == 'getWebhookInfo':
+            url = self._webhook[0] if self._webhook else ''
+            return 200, {'ok': True, 'result': {'url': url, 'has_custom_certificate': False,
+                                                'pending_update_count': len(self._updates)}}
+        return 200, {'ok': True, 'result': True}
+
+    def report(self, started: float) -> dict:
+        elapsed = time.monotonic() - started
+        latencies_ms = [value * 1000 for value in self.simulation.latencies] if self.simulation else []
+        updates = self.simulation.updates_sent if self.simulation else 0
+        return {
+            'duration_s': round(elapsed, 2),
+            'updates': updates,
+            'updates_per_s': round(updates / elapsed, 1) if elapsed else 0.0,
+            'replies': len(latencies_ms),
+            'reply_timeouts': self.simulation.timeouts if self.simulation else 0,
+            'reply_p50_ms': round(percentile(latencies_ms, 50), 1),
+            'reply_p95_ms': round(percentile(latencies_ms, 95), 1),
+            'reply_p99_ms': round(percentile(latencies_ms, 99), 1),
+            'rejected_429': self.rejected,
+            'calls': dict(self.calls),
+        }
+
+
+def _parse_body(content_type: str, body: bytes) -> dict:
+    """Параметры из тела запроса: form-urlencoded, multipart (файлы пропускаются) или JSON"""
+    if not body:
+        return {}
+    if content_type.startswith('application/json'):
+        return json.loads(body)
+    if content_type.startswith('application/x-www-form-urlencoded'):
+        return dict(parse_qsl(body.decode('utf-8')))
+    if content_type.startswith('multipart/form-data'):
+        message = BytesParser(policy=HTTP).parsebytes(f'Content-Type: {content_type}\r\n\r\n'.encode() + body)
+        params = {}
+        for part in message.iter_parts():
+            name = part.get_param('name', header='content-disposition')
+            if name and part.get_filename() is None:
+                params[name] = part.get_content()
+        return params
+    return {}
+
+
+class FakeAPIRequestHandler(BaseHTTPRequestHandler):
+    """Запросы бота: /bot<token>/<метод>"""
+
+    server_version = 'FakeBotAPI'
+
+    def _handle(self) -> None:
+        url = urlsplit(self.path)
+        parts = url.path.strip('/').split('/')
+        if len(parts) != 2 or not parts[0].startswith('bot'):
+            self._reply(404, {'ok': False, 'error_code': 404, 'description': 'Not Found'})
+            return
+
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        params = dict(parse_qsl(url.query))
+        try:
+            params.update(_parse_body(self.headers.get('Content-Type', ''), body))
+        except ValueError:
+            self._reply(400, {'ok': False, 'error_code': 400, 'description': 'Bad Request: invalid body'})
+            return
+
+        try:
+            status, payload = self.server.api.call(parts[1], params)
+        except Exception as e:
+            logger.exception(f"Ошибка метода {parts[1]}: {e}")
+            status, payload = 500, {'ok': False, 'error_code': 500, 'description': f'Internal Server Error: {e}'}
+        self._reply(status, payload)
+
+    do_GET = _handle
+    do_POST = _handle
+
+    def _reply(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        logger.debug(f"{self.client_address[0]} - {format % args}")
+
+
+class _HTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128  # Очередь подключений при тысячах отправок в секунду
+
+
+class FakeAPIServer:
+    """
+    HTTP-сервер тестового Bot API
+    """
+
+    def __init__(self, api: FakeBotAPI, host: str = '127.0.0.1', port: int = 8081) -> None:
+        self.api = api
+        self._httpd = _HTTPServer((host, port), FakeAPIRequestHandler)
+        self._httpd.api = api
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="FakeAPIServer", daemon=True)
+        self._thread.start()
+        logger.info(f"Тестовый Bot API: {self.url}")
+
+    def stop(self) -> None:
+        if self._thread:
+            self._httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._httpd.server_close()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m tools.fake_api', description="Тестовый сервер Bot API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8081)
+    parser.add_argument('--users', type=int, default=100, help="симулированных пользователей (0 - без нагрузки)")
+    parser.add_argument('--steps', type=int, default=20, help="сообщений от каждого пользователя")
+    parser.add_argument('--think', type=float, default=0.5, help="пауза пользователя после ответа бота, сек.")
+    parser.add_argument('--reply-timeout', type=float, default=10.0, help="ожидание ответа бота, сек.")
+    parser.add_argument('--ramp-up', type=float, default=5.0, help="время подключения всех пользователей, сек.")
+    parser.add_argument('--latency', type=float, default=0.0, help="средняя задержка отправки сообщений, сек.")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="доля отправок, отклоняемых с 429")
+    parser.add_argument('--global-rate', type=float, default=0.0, help="лимит сообщений/сек. на бота (0 - нет)")
+    parser.add_argument('--chat-rate', type=float, default=0.0, help="лимит сообщений/сек. в чат (0 - нет)")
+    parser.add_argument('--duration', type=float, default=0.0, help="остановка через N сек. (0 - после всех шагов)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="файл для отчета JSON (по умолчанию stdout)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> None:
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    simulation = None
+    if args.users:
+        simulation = UserSimulation(args.users, args.steps, args.think, args.reply_timeout, args.ramp_up, args.seed)
+
+    api = FakeBotAPI(simulation, latency=args.latency, error_rate=args.error_rate,
+                     global_rate=args.global_rate, chat_rate=args.chat_rate, seed=args.seed)
+    server = FakeAPIServer(api, args.host, args.port)
+    server.start()
+
+    started = time.monotonic()
+    try:
+        if simulation:
+            simulation.start(api.push_update)
+            simulation.finished.wait(args.duration or None)
+            # Ответы на последние сообщения пользователей
+            time.sleep(min(args.reply_timeout, 2.0))
+        else:
+            threading.Event().wait(args.duration or None)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+    output = json.dumps(api.report(started), ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,4 @@
+from . import catalog
+from . import routes
+from . import render_cache
+from . import webhook
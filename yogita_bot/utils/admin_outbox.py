@@ -0,0 +1,156 @@
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from datetime import datetime, timedelta
+import threading
+import logging
+
+from config_data.config import ADMIN_OUTBOX_INTERVAL, ADMIN_OUTBOX_MAX_BACKOFF
+from loader import bot
+from models import AdminNotification
+
+
+logger = logging.getLogger(__name__)
+
+
+"""
+    Уведомления администратору о новых заявках (outbox).
+
+    Обработчик записывает уведомление в таблицу AdminNotification в той же транзакции,
+    что и заявку (Orders), и не ждет Telegram. Фоновый поток отправляет неотправленные
+    уведомления; при ошибке повторяет попытку с паузой 5, 10, 20 ... секунд
+    (не больше ADMIN_OUTBOX_MAX_BACKOFF), пока уведомление не будет доставлено.
+    Уведомления, не отправленные до остановки бота, отправляются после запуска.
+
+    Перед отправкой уведомление "занимается" условным UPDATE, поэтому несколько
+    процессов (режим sharded) не отправляют одно уведомление дважды.
+
+    Пока фоновый поток не запущен (скрипты, проверки), уведомления отправляются сразу.
+"""
+
+BASE_BACKOFF = 5  # Секунд до первого повтора
+CLAIM_TIMEOUT = 60  # Секунд, на которые уведомление занимается отправителем
+SEND_TIMEOUT = 30  # Секунд ожидания отправки через очередь исходящих сообщений
+BATCH_SIZE = 20
+
+
+class AdminOutbox:
+    """
+    Фоновая отправка уведомлений из таблицы AdminNotification
+    """
+
+    def __init__(self, interval: float = 5.0, max_backoff: int = 3600) -> None:
+        self.interval = interval
+        self.max_backoff = max_backoff
+
+        self._wakeup = threading.Event()
+        self._drain_lock = threading.Lock()
+        self._stopping = False
+        self._thread = None
+
+    @staticmethod
+    def enqueue(order, chat_id, text: str) -> AdminNotification:
+        """Записывает уведомление (вызывать внутри транзакции заявки)"""
+        return AdminNotification.create(
+            order=order,
+            chat_id=str(chat_id),
+            text=text,
+            next_attempt=datetime.now().replace(microsecond=0)
+        )
+
+    def notify(self) -> None:
+        """Сообщает о новом уведомлении (вызывать после фиксации транзакции)"""
+        if self._thread is None:
+            self.drain()
+        else:
+            self._wakeup.set()
+
+    def _backoff(self, attempts: int) -> int:
+        return min(BASE_BACKOFF * 2 ** (attempts - 1), self.max_backoff)
+
+    def _claim(self, notification: AdminNotification, now: datetime) -> bool:
+        """Занимает уведомление; False - его уже взял другой отправитель"""
+        return AdminNotification.update(next_attempt=now + timedelta(seconds=CLAIM_TIMEOUT)).where(
+            (AdminNotification.notification_id == notification.notification_id)
+            & (AdminNotification.sent_date.is_null())
+            & (AdminNotification.next_attempt == notification.next_attempt)
+        ).execute() == 1
+
+    @staticmethod
+    def _deliver(notification: AdminNotification) -> None:
+        result = bot.send_message(notification.chat_id, notification.text)
+        if isinstance(result, Future):
+            # Отправка через очередь исходящих сообщений - дожидаемся результата
+            try:
+                result.result(timeout=SEND_TIMEOUT)
+            except FutureTimeout:
+                # Сообщение еще в очереди: отменяем, и уведомление повторяется по расписанию.
+                # Если отправка уже идет, отменить нельзя - ждем ее, иначе администратор получит копию
+                if result.cancel():
+                    raise TimeoutError(f"сообщение не отправлено за {SEND_TIMEOUT} сек., отменено")
+                result.result()
+
+    def drain(self) -> int:
+        """Отправляет уведомления, время которых пришло; возвращает количество отправленных"""
+        sent = 0
+        with self._drain_lock:
+            while not self._stopping or self._thread is None:
+                now = datetime.now().replace(microsecond=0)
+                pending = list(AdminNotification.select().where(
+                    AdminNotification.sent_date.is_null() & (AdminNotification.next_attempt <= now)
+                ).order_by(AdminNotification.notification_id).limit(BATCH_SIZE))
+
+                if not pending:
+                    break
+
+                for notification in pending:
+                    if not self._claim(notification, now):
+                        continue
+
+                    try:
+                        self._deliver(notification)
+                    except Exception as e:
+                        attempts = notification.attempts + 1
+                        delay = self._backoff(attempts)
+                        AdminNotification.update(
+                            attempts=attempts, last_error=str(e)[:500],
+                            next_attempt=datetime.now().replace(microsecond=0) + timedelta(seconds=delay)
+                        ).where(AdminNotification.notification_id == notification.notification_id).execute()
+                        logger.error(f"Уведомление о заявке №{notification.order_id} не отправлено "
+                                     f"(попытка {attempts}, повтор через {delay} сек.): {e}")
+                        continue
+
+                    AdminNotification.update(
+                        attempts=notification.attempts + 1, sent_date=datetime.now().replace(microsecond=0)
+                    ).where(AdminNotification.notification_id == notification.notification_id).execute()
+                    logger.info(f"Заявка №{notification.order_id} переслана администратору")
+                    sent += 1
+
+                if len(pending) < BATCH_SIZE:
+                    break
+
+        return sent
+
+    def _run(self) -> None:
+        while not self._stopping:
+            try:
+                self.drain()
+            except Exception as e:
+                logger.error(f"Ошибка отправки уведомлений администратору: {e}")
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+    def start(self) -> None:
+        """Запускает фоновую отправку"""
+        self._thread = threading.Thread(target=self._run, name="AdminOutbox", daemon=True)
+        self._thread.start()
+        logger.info("Отправка уведомлений администратору запущена")
+
+    def stop(self) -> None:
+        """Останавливает фоновую отправку (неотправленные уведомления остаются в DB)"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+
+admin_outbox = AdminOutbox(interval=ADMIN_OUTBOX_INTERVAL, max_backoff=ADMIN_OUTBOX_MAX_BACKOFF)
@@ -0,0 +1,149 @@
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import logging
+
+from telebot import asyncio_helper
+from telebot.async_telebot import AsyncTeleBot
+
+from config_data.config import TELEGRAM_API_URL
+from utils.webhook import update_chat_id
+
+
+logger = logging.getLogger(__name__)
+
+
+"""
+    Режим asyncio (RUN_MODE=async): обновления получает и сообщения отправляет AsyncTeleBot.
+
+    Обработчики из c_handlers остаются синхронными и выполняются в небольшом пуле
+    потоков (вместе с запросами к DB), но не ждут ответа Telegram: вызовы
+    bot.send_message / bot.send_photo ставят отправку в цикл asyncio и сразу
+    возвращают concurrent.futures.Future. Отправки в разные чаты идут параллельно,
+    внутри одного чата - по порядку, как и обработка обновлений чата.
+
+    Поток занят только на время работы обработчика, поэтому один процесс
+    ведет тысячи диалогов без отдельного потока на каждое обновление.
+
+    Остановка - отмена задачи опроса (asyncio), без внутренних атрибутов AsyncTeleBot.
+"""
+
+# Методы синхронного бота, которые в этом режиме отправляются через AsyncTeleBot
+OUTBOUND_METHODS = ('send_message', 'send_photo')
+
+if TELEGRAM_API_URL:
+    asyncio_helper.API_URL = TELEGRAM_API_URL.rstrip('/') + '/bot{0}/{1}'
+    asyncio_helper.FILE_URL = TELEGRAM_API_URL.rstrip('/') + '/file/bot{0}/{1}'
+
+
+class _BridgeTeleBot(AsyncTeleBot):
+    """AsyncTeleBot, передающий полученные обновления в AsyncEngine"""
+
+    def __init__(self, token: str, engine) -> None:
+        super().__init__(token)
+        self.engine = engine
+
+    async def process_new_updates(self, updates) -> None:
+        for update in updates:
+            self.engine.dispatch(update)
+
+
+class _ChatSequencer:
+    """Выполняет корутины одного чата строго по очереди, разных чатов - параллельно"""
+
+    def __init__(self) -> None:
+        self._tails = {}
+
+    async def run(self, chat_id, coro):
+        loop = asyncio.get_running_loop()
+        previous = self._tails.get(chat_id)
+        current = loop.create_future()
+        self._tails[chat_id] = current
+
+        try:
+            if previous is not None:
+                await previous
+            return await coro
+        finally:
+            current.set_result(None)
+            if self._tails.get(chat_id) is current:
+                del self._tails[chat_id]
+
+
+class AsyncEngine:
+    """
+    Цикл asyncio для синхронных обработчиков bot
+    """
+
+    def __init__(self, bot, workers: int) -> None:
+        self.bot = bot
+        self.async_bot = _BridgeTeleBot(bot.token, self)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='HandlerWorker')
+        self._updates = _ChatSequencer()
+        self._sends = _ChatSequencer()
+        self._loop = None
+        self._polling = None
+        self._stopping = False
+        self._original_methods = {}
+
+    # ---------------------------- ОБНОВЛЕНИЯ ---------------------------
+
+    def dispatch(self, update) -> None:
+        """Планирует обработку обновления (вызывается в цикле asyncio)"""
+        task = self._loop.create_task(self._updates.run(update_chat_id(update), self._process(update)))
+        task.add_done_callback(self._log_failure)
+
+    async def _process(self, update) -> None:
+        await self._loop.run_in_executor(self.executor, self.bot.process_new_updates, [update])
+
+    # ----------------------------- ОТПРАВКА ----------------------------
+
+    def _install_outbound(self) -> None:
+        """Подменяет методы отправки синхронного бота на неблокирующие"""
+        for method_name in OUTBOUND_METHODS:
+            self._original_methods[method_name] = getattr(self.bot, method_name)
+            setattr(self.bot, method_name, self._make_sender(method_name))
+
+    def _restore_outbound(self) -> None:
+        for method_name, method in self._original_methods.items():
+            setattr(self.bot, method_name, method)
+        self._original_methods = {}
+
+    def _make_sender(self, method_name: str):
+        async_method = getattr(self.async_bot, method_name)
+
+        def send(chat_id, *args, **kwargs):
+            future = asyncio.run_coroutine_threadsafe(
+                self._sends.run(chat_id, async_method(chat_id, *args, **kwargs)), self._loop
+            )
+            future.add_done_callback(self._log_failure)
+            return future
+
+        return send
+
+    @staticmethod
+    def _log_failure(future) -> None:
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Ошибка в асинхронной задаче: {future.exception()}")
+
+    # ------------------------------ ЗАПУСК -----------------------------
+
+    async def run(self) -> None:
+        """Запускает опрос обновлений до вызова stop()"""
+        self._loop = asyncio.get_running_loop()
+        self._install_outbound()
+        self._polling = self._loop.create_task(self.async_bot.infinity_polling(timeout=60))
+        try:
+            await self._polling
+        except asyncio.CancelledError:
+            if not self._stopping:
+                raise
+        finally:
+            self._restore_outbound()
+            await self.async_bot.close_session()
+
+    def stop(self) -> None:
+        """Отменяет опрос обновлений (можно вызывать из любого потока и обработчика сигнала)"""
+        self._stopping = True
+        if self._polling is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._polling.cancel)
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,161 @@
+from collections import namedtuple
+from types import MappingProxyType
+import threading
+import logging
+
+from models import (db, Menu, Programs, ProgramMenu, Price, PriceDetail, Contacts,
+                    Events, Mentors, Retreats, Reviews, FAQ, program_menu_links, sync_program_menus)
+
+
+logger = logging.getLogger(__name__)
+
+
+"""
+    Каталог - снимок справочных таблиц (меню, программы, цены, FAQ и т.д.) в памяти.
+
+    Контент студии меняется несколько раз в месяц, поэтому обработчики навигации
+    не ходят в DB, а читают неизменяемый снимок, загруженный при старте бота.
+    После правки таблиц снимок перечитывается вызовом reload_catalog().
+
+    Разделы программ правятся в Programs (menu и CSV-колонка multiple_menu_ids):
+    при загрузке снимка связи ProgramMenu сверяются с ними в той же транзакции.
+
+    Строки таблиц хранятся как namedtuple с теми же именами полей, что и колонки
+    (для внешних ключей - menu_id, price_id), поэтому обращение к атрибутам
+    в обработчиках не отличается от работы с моделями peewee.
+"""
+
+# Справочные таблицы, которые загружаются в каталог
+CATALOG_MODELS = (Menu, Programs, ProgramMenu, Price, PriceDetail, Contacts, Events, Mentors, Retreats, Reviews, FAQ)
+
+
+def _row_type(model):
+    """Создает тип строки каталога для модели"""
+    columns = [field.column_name for field in model._meta.sorted_fields]
+    return namedtuple(f"{model.__name__}Row", columns)
+
+
+ROW_TYPES = {model: _row_type(model) for model in CATALOG_MODELS}
+
+MenuRow = ROW_TYPES[Menu]
+ProgramRow = ROW_TYPES[Programs]
+FAQRow = ROW_TYPES[FAQ]
+
+
+def _group_by(rows, attr: str) -> MappingProxyType:
+    """Группирует строки по значению поля с сохранением порядка"""
+    groups = {}
+    for row in rows:
+        groups.setdefault(getattr(row, attr), []).append(row)
+    return MappingProxyType({key: tuple(items) for key, items in groups.items()})
+
+
+def _index_by(rows, attr: str) -> MappingProxyType:
+    """Индекс по значению поля (при дублях побеждает первая запись, как в Model.get)"""
+    index = {}
+    for row in rows:
+        index.setdefault(getattr(row, attr), row)
+    return MappingProxyType(index)
+
+
+class CatalogSnapshot:
+    """
+    Неизменяемый снимок справочных таблиц с индексами для обработчиков
+    """
+
+    def __init__(self, tables: dict, version: int) -> None:
+        self.version = version
+        self._tables = MappingProxyType({model: tuple(rows) for model, rows in tables.items()})
+
+        self.menus = _index_by(self._tables[Menu], 'menu_id')
+        self.menus_by_title = _index_by(self._tables[Menu], 'menu_title')
+
+        self.programs = self._tables[Programs]
+        self.programs_by_title = _index_by(self.programs, 'program_title')
+        self.programs_by_menu = _group_by(self.programs, 'menu_id')
+
+        # Программы разделов по связям ProgramMenu (основной menu_id и дополнительные)
+        section_ids = {}
+        for link in self._tables[ProgramMenu]:
+            section_ids.setdefault(link.menu_id, set()).add(link.program_id)
+        self.programs_by_section = MappingProxyType({
+            menu_id: tuple(p for p in self.programs if p.program_id in program_ids)
+            for menu_id, program_ids in section_ids.items()
+        })
+
+        self.price_details_by_price = _group_by(self._tables[PriceDetail], 'price_id')
+        self.contacts_by_menu = _group_by(self._tables[Contacts], 'menu_id')
+        self.faq_by_question = _index_by(self._tables[FAQ], 'question')
+
+    def rows(self, model) -> tuple:
+        """Все строки таблицы в порядке хранения в DB"""
+        return self._tables[model]
+
+    def get_menu(self, menu_id: int):
+        """Пункт меню по id (DoesNotExist, если нет - как Menu.get)"""
+        try:
+            return self.menus[menu_id]
+        except KeyError:
+            raise Menu.DoesNotExist(f"Пункт меню не найден: {menu_id}")
+
+    def get_program(self, program_title: str):
+        """Программа по названию (DoesNotExist, если нет - как Programs.get)"""
+        try:
+            return self.programs_by_title[program_title]
+        except KeyError:
+            raise Programs.DoesNotExist(f"Программа не найдена: {program_title}")
+
+    def menus_in(self, menu_ids) -> list:
+        """Пункты меню из списка id, упорядоченные по menu_id"""
+        return [self.menus[menu_id] for menu_id in sorted(menu_ids) if menu_id in self.menus]
+
+
+_snapshot = None
+_lock = threading.RLock()
+
+
+def _load_tables() -> dict:
+    """
+    Читает все справочные таблицы в одной транзакции.
+    Связи ProgramMenu приводятся к Programs.menu и multiple_menu_ids (транзакция с блокировкой
+    на запись сразу - процессы режима sharded загружают каталог одновременно)
+    """
+    tables = {}
+    with db.atomic('IMMEDIATE'):
+        for model in CATALOG_MODELS:
+            row_type = ROW_TYPES[model]
+            fields = model._meta.sorted_fields
+            tables[model] = [row_type(*row) for row in model.select(*fields).tuples()]
+
+        links = program_menu_links((p.program_id, p.menu_id, p.multiple_menu_ids) for p in tables[Programs])
+        existing = {(link.menu_id, link.program_id) for link in tables[ProgramMenu]}
+        if sync_program_menus(links, existing):
+            link_row = ROW_TYPES[ProgramMenu]
+            tables[ProgramMenu] = [link_row(menu_id=menu_id, program_id=program_id)
+                                   for menu_id, program_id in sorted(links)]
+    return tables
+
+
+def reload_catalog() -> CatalogSnapshot:
+    """
+    Перечитывает справочные таблицы из DB и атомарно подменяет снимок
+    """
+    global _snapshot
+
+    with _lock:
+        version = _snapshot.version + 1 if _snapshot else 1
+        snapshot = CatalogSnapshot(_load_tables(), version)
+        _snapshot = snapshot
+
+    logger.info(f"Каталог загружен (версия {snapshot.version}): "
+                f"{len(snapshot.menus)} пунктов меню, {len(snapshot.programs)} программ")
+    return snapshot
+
+
+def get_catalog() -> CatalogSnapshot:
+    """Текущий снимок каталога (загружается при первом обращении)"""
+    snapshot = _snapshot
+    if snapshot is None:
+        with _lock:
+            snapshot = _snapshot or reload_catalog()
+    return snapshot
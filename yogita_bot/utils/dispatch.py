@@ -0,0 +1,186 @@
+from collections import defaultdict
+import functools
+import logging
+
+from telebot import util
+from telebot.handler_backends import State
+
+
+logger = logging.getLogger(__name__)
+
+
+"""
+    Выбор обработчиков сообщений по индексу.
+
+    telebot проверяет фильтры всех зарегистрированных message_handler по порядку
+    (func-лямбды, команды, состояние - запрос к хранилищу состояний для каждого
+    обработчика с state=...), пока не найдет подходящий. Здесь обработчики
+    индексируются в словарях по:
+        - команде (commands=['start']);
+        - тексту кнопки (func=text_in('Помощь'), text_in(*CANCEL, ignore_case=True));
+        - состоянию (state=States.order_phone; '*' и без state - любое);
+        - типу содержимого (content_types).
+
+    Для каждого сообщения из индекса выбираются обработчики, которые могут подойти,
+    в исходном порядке, и передаются telebot - он проверяет их фильтры как обычно
+    (func-лямбды без индекса, например проверка ADMIN_CHAT_ID). Первый подходящий
+    обработчик тот же, что и без индекса; состояние запрашивается один раз и только
+    если среди кандидатов есть обработчики состояний.
+
+    Индекс перестраивается, если список обработчиков изменился (новый обработчик).
+"""
+
+# Типы обновлений, обработчики которых выбираются по индексу (у остальных - перебор telebot)
+INDEXED_UPDATES = ('message', 'edited_message')
+
+EMPTY = frozenset()
+
+
+class TextMatch:
+    """
+    Условие func для message_handler: текст сообщения из набора.
+    Работает как обычный func; по нему строится индекс текста кнопок
+    """
+
+    __slots__ = ('texts', 'ignore_case')
+
+    def __init__(self, texts, ignore_case: bool = False) -> None:
+        self.ignore_case = ignore_case
+        self.texts = frozenset(text.lower() for text in texts) if ignore_case else frozenset(texts)
+
+    def __call__(self, message) -> bool:
+        text = message.text
+        if text is None:
+            return False
+        return (text.lower() if self.ignore_case else text) in self.texts
+
+
+def text_in(*texts: str, ignore_case: bool = False) -> TextMatch:
+    """func для message_handler: текст сообщения - один из texts"""
+    return TextMatch(texts, ignore_case)
+
+
+def state_names(value) -> list:
+    """Имена состояний фильтра state (как сравнивает StateFilter)"""
+    values = value if isinstance(value, list) else [value]
+    return [item.name if isinstance(item, State) else item for item in values]
+
+
+class HandlerIndex:
+    """
+    Индекс одного списка обработчиков: позиции обработчиков по команде, тексту, состоянию и типу
+    """
+
+    def __init__(self, handlers: list) -> None:
+        self.handlers = handlers
+        self.size = len(handlers)
+
+        by_content_type, by_command = defaultdict(set), defaultdict(set)
+        by_text, by_text_lower, by_state = defaultdict(set), defaultdict(set), defaultdict(set)
+        any_content, any_text, any_state = set(), set(), set()
+
+        for position, handler in enumerate(handlers):
+            filters = handler['filters']
+
+            content_types = filters.get('content_types')
+            if content_types is None:
+                any_content.add(position)
+            else:
+                for content_type in content_types:
+                    by_content_type[content_type].add(position)
+
+            # Одного обязательного условия достаточно: остальные фильтры проверит telebot
+            commands, func = filters.get('commands'), filters.get('func')
+            if commands is not None:
+                for command in commands:
+                    by_command[command].add(position)
+            elif isinstance(func, TextMatch):
+                for text in func.texts:
+                    (by_text_lower if func.ignore_case else by_text)[text].add(position)
+            else:
+                any_text.add(position)
+
+            state = filters.get('state')
+            if state is None or state == '*':
+                any_state.add(position)
+            else:
+                for name in state_names(state):
+                    by_state[name].add(position)
+
+        freeze = lambda groups: {key: frozenset(positions) for key, positions in groups.items()}
+        self.by_content_type = freeze(by_content_type)
+        self.by_command = freeze(by_command)
+        self.by_text = freeze(by_text)
+        self.by_text_lower = freeze(by_text_lower)
+        self.by_state = freeze(by_state)
+        self.any_content = frozenset(any_content)
+        self.any_text = frozenset(any_text)
+        self.any_state = frozenset(any_state)
+
+    def candidates(self, message, get_state) -> list:
+        """Обработчики, которые могут подойти сообщению, в порядке регистрации"""
+        positions = self.by_content_type.get(message.content_type, EMPTY) | self.any_content
+
+        text = message.text
+        matched = self.any_text
+        if text is not None:
+            if message.content_type == 'text' and self.by_command:
+                matched = matched | self.by_command.get(util.extract_command(text), EMPTY)
+            matched = matched | self.by_text.get(text, EMPTY)
+            if self.by_text_lower:
+                matched = matched | self.by_text_lower.get(text.lower(), EMPTY)
+        positions &= matched
+
+        # Состояние запрашивается, только если подходящие обработчики от него зависят
+        stateful = positions - self.any_state
+        if stateful:
+            positions = (positions & self.any_state) | (stateful & self.by_state.get(get_state(message), EMPTY))
+
+        return [self.handlers[position] for position in sorted(positions)]
+
+
+class IndexedDispatcher:
+    """
+    Выбор обработчиков сообщений bot по индексу вместо перебора всех фильтров
+    """
+
+    def __init__(self) -> None:
+        self.bot = None
+        self._indexes = {}
+
+    def install(self, bot) -> None:
+        """Подменяет выбор обработчиков bot (после регистрации обработчиков и фильтра состояний)"""
+        notify = bot._notify_command_handlers
+        if getattr(notify, '_indexed', False):
+            return
+
+        self.bot = bot
+
+        @functools.wraps(notify)
+        def indexed_notify(handlers, new_messages, update_type):
+            if update_type not in INDEXED_UPDATES or not handlers:
+                return notify(handlers, new_messages, update_type)
+
+            index = self._index(update_type, handlers)
+            for message in new_messages:
+                candidates = index.candidates(message, self._get_state)
+                if candidates or bot.use_class_middlewares:
+                    notify(candidates, [message], update_type)
+
+        indexed_notify._indexed = True
+        bot._notify_command_handlers = indexed_notify
+
+    def _index(self, update_type: str, handlers: list) -> HandlerIndex:
+        index = self._indexes.get(update_type)
+        if index is None or index.handlers is not handlers or index.size != len(handlers):
+            index = self._indexes[update_type] = HandlerIndex(handlers)
+            logger.debug(f"Индекс обработчиков {update_type}: {index.size}")
+        return index
+
+    def _get_state(self, message):
+        if message.from_user is None:
+            return None
+        return self.bot.current_states.get_state(message.chat.id, message.from_user.id)
+
+
+dispatcher = IndexedDispatcher()
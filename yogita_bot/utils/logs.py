@@ -0,0 +1,185 @@
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import queue
+import threading
+import logging
+
+from config_data.config import (LOG_PATH, MAX_LOG_SIZE, BACKUP_COUNT, LOG_LEVEL, LOG_LEVELS, LOG_QUEUE_SIZE,
+                                LOG_DEBUG_RATE, LOG_DEBUG_SAMPLE)
+
+
+logger = logging.getLogger(__name__)
+
+
+"""
+    Запись лога в фоновом потоке.
+
+    На корневом логгере - только QueueHandler: обработчик бота кладет запись в очередь
+    и не ждет записи в файл. QueueListener в отдельном потоке пишет записи в bot.log
+    (с ротацией) и в консоль. Если очередь переполнена, новые записи отбрасываются
+    (количество - в лог при остановке), обработчик не блокируется.
+
+    Уровни: LOG_LEVEL - корневой логгер, LOG_LEVELS - отдельные модули
+    ('models=WARNING,handlers=DEBUG').
+
+    DEBUG-записи с одного места в коде ограничены: не больше LOG_DEBUG_RATE в секунду,
+    сверх - каждая LOG_DEBUG_SAMPLE-я; число пропущенных дописывается к следующей записи.
+
+    После остановки записи идут в файл и консоль напрямую (сообщения завершения работы).
+
+    В режиме sharded процессы-обработчики не открывают bot.log: их записи передаются
+    супервизору (forward), и в файл пишет один поток записи.
+"""
+
+FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+
+class DebugSampler(logging.Filter):
+    """
+    Ограничение DEBUG-записей с одного места в коде (файл и строка): rate в секунду, сверх - каждая sample-я
+    """
+
+    def __init__(self, rate: int, sample: int) -> None:
+        super().__init__()
+        self.rate = rate
+        self.sample = sample
+        self._sites = {}  # (файл, строка) -> [начало окна, записей в окне, пропущено]
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG:
+            return True
+
+        key = (record.pathname, record.lineno)
+        with self._lock:
+            site = self._sites.get(key)
+            if site is None or record.created - site[0] >= 1.0:
+                skipped = site[2] if site else 0
+                site = self._sites[key] = [record.created, 0, skipped]
+
+            site[1] += 1
+            over = site[1] - self.rate
+            if over > 0 and not (self.sample and over % self.sample == 0):
+                site[2] += 1
+                return False
+
+            skipped, site[2] = site[2], 0
+
+        if skipped:
+            record.msg = f"{record.msg} (пропущено похожих: {skipped})"
+        return True
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler, который при заполненной очереди отбрасывает запись вместо ожидания"""
+
+    def __init__(self, log_queue: queue.Queue) -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def apply_levels(levels: str) -> None:
+    """Уровни модулей из строки 'имя=УРОВЕНЬ,имя=УРОВЕНЬ'"""
+    for item in filter(None, (part.strip() for part in levels.split(','))):
+        name, _, level = item.partition('=')
+        try:
+            logging.getLogger(name.strip()).setLevel(level.strip().upper())
+        except ValueError:
+            logger.warning(f"Неизвестный уровень логирования в LOG_LEVELS: {item}")
+
+
+class LogWriter:
+    """
+    Фоновая запись лога: QueueHandler на корневом логгере, QueueListener пишет в файл и консоль
+    """
+
+    def __init__(self, path: str, max_bytes: int, backup_count: int, level: str = 'INFO', levels: str = '',
+                 queue_size: int = 10000, debug_rate: int = 10, debug_sample: int = 100) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.level = level
+        self.levels = levels
+        self.queue_size = queue_size
+        self.debug_rate = debug_rate
+        self.debug_sample = debug_sample
+        self._handlers = []
+        self._queue_handler = None
+        self._listener = None
+
+    def start(self) -> None:
+        """Подключает очередь к корневому логгеру и запускает поток записи"""
+        if self._listener is not None:
+            return
+
+        formatter = logging.Formatter(FORMAT)
+
+        # Обработчик с ротацией логов
+        file_handler = RotatingFileHandler(
+            self.path,
+            maxBytes=self.max_bytes,
+            backupCount=self.backup_count,
+            encoding='utf-8'
+        )
+        # Обработчик для консоли
+        console_handler = logging.StreamHandler()
+        self._handlers = [file_handler, console_handler]
+        for handler in self._handlers:
+            handler.setFormatter(formatter)
+
+        self._queue_handler = DroppingQueueHandler(queue.Queue(self.queue_size))
+        self._queue_handler.addFilter(DebugSampler(self.debug_rate, self.debug_sample))
+
+        # Обработчики, добавленные до запуска (logging.basicConfig при первой записи во время импорта),
+        # пишут синхронно и дублируют консоль - их заменяет очередь
+        root_logger = logging.getLogger()
+        for handler in list(root_logger.handlers):
+            root_logger.removeHandler(handler)
+        root_logger.setLevel(self.level.upper())
+        root_logger.addHandler(self._queue_handler)
+        apply_levels(self.levels)
+
+        self._listener = QueueListener(self._queue_handler.queue, *self._handlers, respect_handler_level=True)
+        self._listener.start()
+
+    def forward(self, log_queue) -> None:
+        """
+        Процесс-обработчик режима sharded: записи уходят в очередь супервизора
+        (multiprocessing.Queue), bot.log пишет только он - ротация из нескольких процессов небезопасна
+        """
+        handler = QueueHandler(log_queue)
+        handler.addFilter(DebugSampler(self.debug_rate, self.debug_sample))
+
+        root_logger = logging.getLogger()
+        for existing in list(root_logger.handlers):
+            root_logger.removeHandler(existing)
+        root_logger.setLevel(self.level.upper())
+        root_logger.addHandler(handler)
+        apply_levels(self.levels)
+
+    def stop(self) -> None:
+        """Дописывает очередь и переключает корневой логгер на запись напрямую"""
+        if self._listener is None:
+            return
+
+        root_logger = logging.getLogger()
+        root_logger.removeHandler(self._queue_handler)
+        self._listener.stop()
+        self._listener = None
+
+        for handler in self._handlers:
+            root_logger.addHandler(handler)
+
+        if self._queue_handler.dropped:
+            logger.warning(f"Отброшено записей лога (очередь заполнена): {self._queue_handler.dropped}")
+
+
+log_writer = LogWriter(
+    LOG_PATH, MAX_LOG_SIZE, BACKUP_COUNT, level=LOG_LEVEL, levels=LOG_LEVELS, queue_size=LOG_QUEUE_SIZE,
+    debug_rate=LOG_DEBUG_RATE, debug_sample=LOG_DEBUG_SAMPLE
+)
@@ -0,0 +1,194 @@
+from concurrent.futures import Future
+from datetime import datetime
+import hashlib
+import threading
+import logging
+
+from telebot.apihelper import ApiTelegramException
+
+from loader import bot
+from models import db, MediaCache
+
+
+logger = logging.getLogger(__name__)
+
+
+"""
+    Кэш file_id изображений (таблица MediaCache).
+
+    Первая отправка изображения по URL (карта проезда, отзывы) загружает его
+    в Telegram; file_id из ответа сохраняется по ключу URL (или хэшу содержимого
+    для файлов). Следующие отправки идут по file_id - Telegram не скачивает
+    изображение заново, и внешний сервис карт больше не нужен.
+
+    Если Telegram не принимает сохраненный file_id, запись удаляется и
+    изображение загружается из источника повторно.
+
+    С очередью исходящих сообщений (и в режиме async) ответ Telegram обрабатывается
+    в потоке отправки или в цикле asyncio. Там меняется только кэш в памяти, а запись
+    в DB выполняет фоновый поток (как пакетная запись визитов), поэтому медленная
+    запись в SQLite не задерживает отправку в другие чаты.
+    Пока фоновый поток не запущен (скрипты, проверки), изменения сохраняются сразу.
+"""
+
+RETRY_INTERVAL = 5.0  # Повтор записи в DB после ошибки, сек.
+
+
+def media_key(source) -> str:
+    """Ключ кэша: для URL - хэш адреса, для содержимого (bytes) - хэш данных"""
+    if isinstance(source, bytes):
+        return 'sha1:' + hashlib.sha1(source).hexdigest()
+    return 'url:' + hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+
+class MediaFileCache:
+    """
+    file_id по ключу источника: в памяти и в SQLite (запись в DB - в фоновом потоке)
+    """
+
+    def __init__(self) -> None:
+        self._file_ids = None
+        self._lock = threading.Lock()
+        self._pending = {}  # ключ -> (source, file_id) для сохранения или None для удаления
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+    def _entries(self) -> dict:
+        if self._file_ids is None:
+            with self._lock:
+                if self._file_ids is None:
+                    self._file_ids = dict(MediaCache.select(MediaCache.media_key, MediaCache.file_id).tuples())
+        return self._file_ids
+
+    def get(self, key: str):
+        return self._entries().get(key)
+
+    def remember(self, key: str, source, file_id: str) -> None:
+        if self._entries().get(key) == file_id:
+            return
+
+        self._entries()[key] = file_id
+        self._write(key, (source if isinstance(source, str) else key, file_id))
+
+    def forget(self, key: str) -> None:
+        self._entries().pop(key, None)
+        self._write(key, None)
+
+    def clear(self) -> None:
+        """Сброс кэша в памяти (записи в DB сохраняются)"""
+        with self._lock:
+            self._file_ids = None
+
+    def _write(self, key: str, entry) -> None:
+        """Ставит изменение в очередь записи в DB (последнее изменение ключа заменяет предыдущее)"""
+        with self._pending_lock:
+            self._pending[key] = entry
+
+        if self._thread is None:
+            self.flush()
+        else:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """Сохраняет изменения в DB одной транзакцией; возвращает их количество"""
+        with self._flush_lock:
+            with self._pending_lock:
+                pending, self._pending = self._pending, {}
+
+            if not pending:
+                return 0
+
+            try:
+                with db.atomic():
+                    for key, entry in pending.items():
+                        if entry is None:
+                            MediaCache.delete().where(MediaCache.media_key == key).execute()
+                            continue
+
+                        source, file_id = entry
+                        MediaCache.insert(
+                            media_key=key,
+                            source=source,
+                            file_id=file_id,
+                            created_date=datetime.now().replace(microsecond=0)
+                        ).on_conflict_replace().execute()
+            except Exception as e:
+                logger.error(f"Ошибка сохранения file_id в DB ({len(pending)}): {e}")
+                with self._pending_lock:
+                    # Повторим позже; более новые изменения тех же ключей не затираются
+                    self._pending = {**pending, **self._pending}
+                return 0
+
+            return len(pending)
+
+    def _run(self) -> None:
+        while not self._stopping:
+            self._wakeup.wait(RETRY_INTERVAL)
+            self._wakeup.clear()
+            self.flush()
+
+    def start(self) -> None:
+        """Запускает фоновую запись file_id в DB"""
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="MediaCacheWriter", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Останавливает фоновую запись и сохраняет оставшиеся изменения"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+
+media_cache = MediaFileCache()
+
+
+def send_cached_photo(chat_id, source, fallback_text: str = None, **kwargs) -> None:
+    """
+    Отправляет изображение по file_id из кэша, а при его отсутствии - из источника
+    (URL или bytes) с сохранением file_id. Если отправить не удалось - fallback_text
+    """
+    key = media_key(source)
+    file_id = media_cache.get(key)
+
+    def on_sent(message) -> None:
+        if file_id is None and message is not None and message.photo:
+            media_cache.remember(key, source, message.photo[-1].file_id)
+
+    def on_error(error: Exception) -> None:
+        if file_id is not None and isinstance(error, ApiTelegramException) and error.error_code == 400:
+            logger.warning(f"file_id для {key} не принят Telegram, повторная загрузка")
+            media_cache.forget(key)
+            send_cached_photo(chat_id, source, fallback_text, **kwargs)
+            return
+
+        logger.error(f"Ошибка при отправке изображения: {error}")
+        if fallback_text:
+            bot.send_message(chat_id, fallback_text)
+
+    def on_done(future: Future) -> None:
+        error = future.exception()
+        if error is None:
+            on_sent(future.result())
+        else:
+            on_error(error)
+
+    try:
+        result = bot.send_photo(chat_id, file_id or source, **kwargs)
+    except Exception as e:
+        on_error(e)
+        return
+
+    if isinstance(result, Future):
+        # Отправка через очередь исходящих сообщений - file_id сохраняется после ответа Telegram.
+        # on_done выполняется в потоке отправки: DB пишет фоновый поток кэша, повторная
+        # отправка и fallback_text только ставятся в очередь
+        result.add_done_callback(on_done)
+    else:
+        on_sent(result)
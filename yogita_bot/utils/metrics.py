@@ -0,0 +1,339 @@
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import functools
+import threading
+import time
+import logging
+
+from config_data.config import METRICS_HOST, METRICS_PORT, METRICS_LOG_INTERVAL
+from models import db, UpdateQueries
+
+
+logger = logging.getLogger(__name__)
+
+
+"""
+    Метрики обработчиков бота.
+
+    Каждый обработчик, зарегистрированный на bot (message_handler и др.), оборачивается:
+    считаются вызовы, ошибки (исключение или запись ERROR в лог во время обработчика -
+    обработчики c_handlers перехватывают исключения сами), время выполнения (гистограмма),
+    запросы к DB и их время (models.db.update_scope - там же проверка N+1)
+    и вызовы Bot API (send_message, send_photo...).
+
+    Метрики отдаются HTTP-страницей /metrics в текстовом формате Prometheus
+    (METRICS_PORT) и раз в METRICS_LOG_INTERVAL секунд пишутся в лог сводкой за интервал:
+    вызовы, ошибки, p50/p99 по гистограмме и самые долгие виды SQL-запросов.
+
+    Вызовы Bot API считаются в потоке обработчика. Очередь исходящих сообщений и режим
+    async подменяют методы отправки bot своими; счетчик переустанавливается поверх
+    них при следующем вызове обработчика, поэтому отправка из очереди не считается дважды.
+
+    В режиме sharded у каждого процесса-обработчика свои метрики (только сводка в логе).
+"""
+
+# Границы корзин гистограммы времени обработчика, секунд
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Списки обработчиков bot, которые оборачиваются
+HANDLER_LISTS = ('message_handlers', 'edited_message_handlers', 'callback_query_handlers')
+
+# Методы bot, вызов которых - запрос к Bot API (reply_to вызывает send_message и не считается отдельно)
+API_METHODS = ('send_message', 'send_photo', 'send_document', 'edit_message_text', 'delete_message',
+               'answer_callback_query', 'send_chat_action')
+
+# Логгеры кода, выполняемого в обработчиках: их записи ERROR - ошибки обработчика
+ERROR_LOGGERS = ('handlers', 'utils')
+
+PREFIX = 'yogita_handler'
+
+
+class HandlerStats:
+    """Счетчики одного обработчика"""
+
+    __slots__ = ('calls', 'errors', 'buckets', 'seconds', 'queries', 'db_seconds', 'api_calls')
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.errors = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # Последняя - больше максимальной границы
+        self.seconds = 0.0
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.api_calls = 0
+
+    def copy(self) -> 'HandlerStats':
+        stats = HandlerStats()
+        stats.calls, stats.errors, stats.seconds = self.calls, self.errors, self.seconds
+        stats.queries, stats.db_seconds, stats.api_calls = self.queries, self.db_seconds, self.api_calls
+        stats.buckets = list(self.buckets)
+        return stats
+
+    def since(self, previous: 'HandlerStats') -> 'HandlerStats':
+        """Прирост с прошлого снимка"""
+        stats = HandlerStats()
+        stats.calls = self.calls - previous.calls
+        stats.errors = self.errors - previous.errors
+        stats.seconds = self.seconds - previous.seconds
+        stats.queries = self.queries - previous.queries
+        stats.db_seconds = self.db_seconds - previous.db_seconds
+        stats.api_calls = self.api_calls - previous.api_calls
+        stats.buckets = [now - before for now, before in zip(self.buckets, previous.buckets)]
+        return stats
+
+    def quantile(self, q: float) -> float:
+        """Оценка квантиля по гистограмме (линейно внутри корзины), секунд"""
+        if not self.calls:
+            return 0.0
+
+        rank = q * self.calls
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            if count and seen + count >= rank:
+                lower = LATENCY_BUCKETS[index - 1] if index else 0.0
+                if index == len(LATENCY_BUCKETS):
+                    return lower
+                upper = LATENCY_BUCKETS[index]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return LATENCY_BUCKETS[-1]
+
+
+class _ErrorLogCounter(logging.Handler):
+    """Записи ERROR в лог во время обработчика считаются его ошибками"""
+
+    def __init__(self, metrics: 'HandlerMetrics') -> None:
+        super().__init__(level=logging.ERROR)
+        self.metrics = metrics
+
+    def emit(self, record) -> None:
+        call = getattr(self.metrics._local, 'call', None)
+        if call is not None:
+            call['errors'] += 1
+
+
+class HandlerMetrics:
+    """
+    Метрики обработчиков: обертки, HTTP-страница /metrics и периодическая сводка в логе
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, log_interval: float = 300) -> None:
+        self.host = host
+        self.port = port
+        self.log_interval = log_interval
+
+        self.bot = None
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._api_wrappers = {}
+        self._error_counter = _ErrorLogCounter(self)
+
+        self._httpd = None
+        self._threads = []
+        self._stopping = threading.Event()
+        self._last_summary = {}
+
+    # ----------------------------- ОБЕРТКИ -----------------------------
+
+    def install(self, bot) -> None:
+        """Оборачивает зарегистрированные обработчики и методы Bot API"""
+        self.bot = bot
+        for list_name in HANDLER_LISTS:
+            for handler in getattr(bot, list_name, ()):
+                function = handler['function']
+                if not getattr(function, '_metrics_wrapped', False):
+                    handler['function'] = self._wrap_handler(function)
+
+        self._install_api_counters()
+        for logger_name in ERROR_LOGGERS:
+            logging.getLogger(logger_name).addHandler(self._error_counter)
+
+    def _install_api_counters(self) -> None:
+        """Счетчик вызовов API поверх текущих методов bot (в том числе подмененных очередью отправки)"""
+        for method_name in API_METHODS:
+            method = getattr(self.bot, method_name, None)
+            if method is None or method is self._api_wrappers.get(method_name):
+                continue
+            wrapper = self._wrap_api(method)
+            self._api_wrappers[method_name] = wrapper
+            setattr(self.bot, method_name, wrapper)
+
+    def _wrap_api(self, method):
+        local = self._local
+
+        @functools.wraps(method)
+        def counted(*args, **kwargs):
+            call = getattr(local, 'call', None)
+            if call is not None:
+                call['api_calls'] += 1
+            return method(*args, **kwargs)
+
+        return counted
+
+    def _wrap_handler(self, function):
+        name = function.__name__
+
+        @functools.wraps(function)
+        def measured(*args, **kwargs):
+            self._install_api_counters()
+
+            call = {'errors': 0, 'api_calls': 0}
+            self._local.call = call
+            with db.update_scope(name) as queries:
+                started = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                except Exception:
+                    call['errors'] += 1
+                    raise
+                finally:
+                    elapsed = time.perf_counter() - started
+                    self._local.call = None
+                    self._record(name, elapsed, call['errors'], queries, call['api_calls'])
+
+        measured._metrics_wrapped = True
+        return measured
+
+    def _record(self, name: str, elapsed: float, errors: int, queries: UpdateQueries, api_calls: int) -> None:
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats is None:
+                stats = self._stats[name] = HandlerStats()
+            stats.calls += 1
+            stats.errors += errors > 0
+            stats.seconds += elapsed
+            stats.buckets[bisect_left(LATENCY_BUCKETS, elapsed)] += 1
+            stats.queries += queries.queries
+            stats.db_seconds += queries.seconds
+            stats.api_calls += api_calls
+
+    def snapshot(self) -> dict:
+        """Копия счетчиков по обработчикам"""
+        with self._lock:
+            return {name: stats.copy() for name, stats in self._stats.items()}
+
+    # ----------------------------- ЭКСПОРТ -----------------------------
+
+    def exposition(self) -> str:
+        """Метрики в текстовом формате Prometheus"""
+        snapshot = self.snapshot()
+        lines = [
+            f'# HELP {PREFIX}_calls_total Вызовы обработчика',
+            f'# TYPE {PREFIX}_calls_total counter',
+        ]
+        lines += [f'{PREFIX}_calls_total{{handler="{name}"}} {stats.calls}' for name, stats in sorted(snapshot.items())]
+
+        lines += [f'# HELP {PREFIX}_errors_total Вызовы обработчика с ошибкой',
+                  f'# TYPE {PREFIX}_errors_total counter']
+        lines += [f'{PREFIX}_errors_total{{handler="{name}"}} {stats.errors}' for name, stats in sorted(snapshot.items())]
+
+        lines += [f'# HELP {PREFIX}_latency_seconds Время выполнения обработчика',
+                  f'# TYPE {PREFIX}_latency_seconds histogram']
+        for name, stats in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, stats.buckets):
+                cumulative += count
+                lines.append(f'{PREFIX}_latency_seconds_bucket{{handler="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'{PREFIX}_latency_seconds_bucket{{handler="{name}",le="+Inf"}} {stats.calls}')
+            lines.append(f'{PREFIX}_latency_seconds_sum{{handler="{name}"}} {stats.seconds:.6f}')
+            lines.append(f'{PREFIX}_latency_seconds_count{{handler="{name}"}} {stats.calls}')
+
+        lines += [f'# HELP {PREFIX}_db_queries_total Запросы к DB из обработчика',
+                  f'# TYPE {PREFIX}_db_queries_total counter']
+        lines += [f'{PREFIX}_db_queries_total{{handler="{name}"}} {stats.queries}'
+                  for name, stats in sorted(snapshot.items())]
+
+        lines += [f'# HELP {PREFIX}_db_seconds_total Время запросов к DB из обработчика',
+                  f'# TYPE {PREFIX}_db_seconds_total counter']
+        lines += [f'{PREFIX}_db_seconds_total{{handler="{name}"}} {stats.db_seconds:.6f}'
+                  for name, stats in sorted(snapshot.items())]
+
+        lines += [f'# HELP {PREFIX}_api_calls_total Вызовы Bot API из обработчика',
+                  f'# TYPE {PREFIX}_api_calls_total counter']
+        lines += [f'{PREFIX}_api_calls_total{{handler="{name}"}} {stats.api_calls}'
+                  for name, stats in sorted(snapshot.items())]
+        return '\n'.join(lines) + '\n'
+
+    def log_summary(self) -> None:
+        """Сводка в лог за время с прошлой сводки"""
+        snapshot = self.snapshot()
+        active = False
+        for name, stats in sorted(snapshot.items()):
+            window = stats.since(self._last_summary.get(name, HandlerStats()))
+            if not window.calls:
+                continue
+            active = True
+            logger.info(f"{name}: вызовов {window.calls}, ошибок {window.errors}, "
+                        f"p50 {window.quantile(0.5) * 1000:.1f} мс, p99 {window.quantile(0.99) * 1000:.1f} мс, "
+                        f"запросов DB {window.queries / window.calls:.1f} "
+                        f"({window.db_seconds / window.calls * 1000:.1f} мс), "
+                        f"вызовов API {window.api_calls / window.calls:.1f} на вызов")
+        self._last_summary = snapshot
+        if active:
+            db.log_top_statements()
+
+    def _run_summary(self) -> None:
+        while not self._stopping.wait(self.log_interval):
+            try:
+                self.log_summary()
+            except Exception as e:
+                logger.error(f"Ошибка сводки метрик: {e}")
+
+    def start(self) -> None:
+        """Запускает страницу /metrics (если задан порт) и периодическую сводку"""
+        if self.port:
+            self._httpd = ThreadingHTTPServer((self.host, self.port), MetricsRequestHandler)
+            self._httpd.daemon_threads = True
+            self._httpd.metrics = self
+            thread = threading.Thread(target=self._httpd.serve_forever, name="MetricsServer", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+            logger.info(f"Метрики обработчиков: http://{self.host}:{self._httpd.server_address[1]}/metrics")
+
+        if self.log_interval:
+            thread = threading.Thread(target=self._run_summary, name="MetricsSummary", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self) -> None:
+        """Останавливает страницу метрик и пишет итоговую сводку"""
+        self._stopping.set()
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+            self._httpd = None
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+        if self.log_interval:
+            self.log_summary()
+        for logger_name in ERROR_LOGGERS:
+            logging.getLogger(logger_name).removeHandler(self._error_counter)
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """GET /metrics"""
+
+    server_version = 'YogitaBotMetrics'
+
+    def do_GET(self) -> None:
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        body = self.server.metrics.exposition().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        logger.debug(f"{self.client_address[0]} - {format % args}")
+
+
+handler_metrics = HandlerMetrics(host=METRICS_HOST, port=METRICS_PORT, log_interval=METRICS_LOG_INTERVAL)
@@ -0,0 +1,297 @@
+from concurrent.futures import Future
+from collections import deque
+import functools
+import heapq
+import itertools
+import threading
+import time
+import logging
+
+from telebot.apihelper import ApiTelegramException
+
+
+logger = logging.getLogger(__name__)
+
+
+"""
+    Очередь исходящих сообщений с учетом лимитов Telegram.
+
+    После install(bot) вызовы bot.send_message / bot.send_photo (и bot.reply_to)
+    не отправляют запрос сразу, а ставят его в очередь чата и возвращают Future.
+    Потоки отправки берут сообщения так, чтобы соблюдались лимиты:
+      - общий - token bucket OUTBOUND_GLOBAL_RATE сообщений в секунду;
+      - на чат - token bucket OUTBOUND_CHAT_RATE в секунду с запасом OUTBOUND_CHAT_BURST
+        (ответ из 2-3 сообщений уходит сразу, дальше - не чаще лимита).
+    В одном чате одновременно отправляется одно сообщение, порядок сохраняется.
+    Ответ 429 не доходит до обработчика: сообщение возвращается в начало очереди
+    чата и повторяется через retry_after секунд. Лимит 429 действует на весь бот,
+    поэтому на retry_after приостанавливается и отправка в остальные чаты.
+
+    Обработчик получает Future сразу, и его try/except ошибку отправки уже не видит:
+    ошибки всех отправок пишет в лог сама очередь (_log_failure). Исключения
+    обработчиков остаются для ошибок до отправки (каталог, DB) и для отправки
+    без очереди (OUTBOUND_QUEUE=0).
+
+    Сообщения с меньшим priority (PRIORITY_INTERACTIVE - ответы пользователям)
+    отправляются раньше фоновых (PRIORITY_BULK), если оба готовы к отправке.
+"""
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+# Методы бота, которые отправляются через очередь
+OUTBOUND_METHODS = ('send_message', 'send_photo')
+
+MAX_RETRIES = 5  # Повторов после ответа 429
+IDLE_CHAT_TTL = 60  # Секунд хранения лимита чата без сообщений
+
+
+class TokenBucket:
+    """
+    Token bucket: rate токенов в секунду, не больше capacity
+    """
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Секунд до появления токена (0 - токен есть)"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return max(self.updated - now, 0.0) + (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, now: float, seconds: float) -> None:
+        """Запрет отправки на seconds секунд (retry_after); более долгий запрет не сокращается"""
+        self._refill(now)
+        self.tokens = 0
+        self.updated = max(self.updated, now + seconds)
+
+
+class _Job:
+    __slots__ = ('method', 'args', 'kwargs', 'priority', 'future', 'retries')
+
+    def __init__(self, method, args, kwargs, priority) -> None:
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.priority = priority
+        self.future = Future()
+        self.retries = 0
+
+
+class _ChatQueue:
+    __slots__ = ('jobs', 'bucket', 'busy', 'idle_since')
+
+    def __init__(self, bucket: TokenBucket) -> None:
+        self.jobs = deque()
+        self.bucket = bucket
+        self.busy = False  # Сообщение чата отправляется прямо сейчас
+        self.idle_since = None
+
+
+class OutboundScheduler:
+    """
+    Планировщик отправки сообщений бота
+    """
+
+    def __init__(self, global_rate: float = 30, chat_rate: float = 1, chat_burst: int = 3, workers: int = 4) -> None:
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.workers = workers
+
+        self._chats = {}    # chat_id -> _ChatQueue
+        self._waiting = []  # Куча (время готовности, порядок, chat_id) - чаты, ждущие лимита
+        self._ready = []    # Куча (приоритет, порядок, chat_id) - чаты, готовые к отправке
+        self._order = itertools.count()
+        self._pending = 0
+        self._swept = time.monotonic()
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._threads = []
+        self._original_methods = {}
+        self.bot = None
+
+    # ------------------------------ ПОДКЛЮЧЕНИЕ ------------------------------
+
+    def install(self, bot) -> None:
+        """Отправка сообщений bot через очередь"""
+        self.bot = bot
+        for method_name in OUTBOUND_METHODS:
+            method = getattr(bot, method_name)
+            self._original_methods[method_name] = method
+            setattr(bot, method_name, self._make_sender(method))
+
+    def _make_sender(self, method):
+        def send(chat_id, *args, **kwargs):
+            return self.submit(method, chat_id, *args, **kwargs)
+
+        return send
+
+    def start(self) -> None:
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"OutboundSender-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Очередь исходящих сообщений запущена: {self.workers} потоков")
+
+    # -------------------------------- ОЧЕРЕДЬ --------------------------------
+
+    def submit(self, method, chat_id, *args, priority: int = PRIORITY_INTERACTIVE, **kwargs) -> Future:
+        """Ставит вызов method(chat_id, ...) в очередь чата; результат - в Future"""
+        job = _Job(method, (chat_id,) + args, kwargs, priority)
+
+        with self._condition:
+            chat = self._chats.get(chat_id)
+            if chat is None:
+                chat = self._chats[chat_id] = _ChatQueue(TokenBucket(self.chat_rate, self.chat_burst))
+
+            chat.jobs.append(job)
+            chat.idle_since = None
+            self._pending += 1
+            if len(chat.jobs) == 1 and not chat.busy:
+                self._schedule(chat_id, chat, time.monotonic())
+            self._condition.notify()
+
+        job.future.add_done_callback(functools.partial(self._log_failure, chat_id))
+        return job.future
+
+    @staticmethod
+    def _log_failure(chat_id, future: Future) -> None:
+        """Ошибки отправки - в лог в одном месте (обработчики их не получают)"""
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Ошибка отправки в чат {chat_id}: {future.exception()}")
+
+    def _schedule(self, chat_id, chat: _ChatQueue, now: float) -> None:
+        """Ставит чат с сообщениями в кучу готовых или ожидающих (под блокировкой)"""
+        delay = chat.bucket.delay(now)
+        if delay > 0:
+            heapq.heappush(self._waiting, (now + delay, next(self._order), chat_id))
+        else:
+            heapq.heappush(self._ready, (chat.jobs[0].priority, next(self._order), chat_id))
+
+    def _next_job(self):
+        """Ждет сообщение, которое можно отправить с учетом лимитов (под блокировкой)"""
+        while True:
+            if self._stopping and not self._pending:
+                return None, None
+
+            now = time.monotonic()
+            while self._waiting and self._waiting[0][0] <= now:
+                _, _, chat_id = heapq.heappop(self._waiting)
+                chat = self._chats[chat_id]
+                heapq.heappush(self._ready, (chat.jobs[0].priority, next(self._order), chat_id))
+
+            timeout = self._waiting[0][0] - now if self._waiting else None
+            if self._ready:
+                delay = self.global_bucket.delay(now)
+                if delay <= 0:
+                    _, _, chat_id = heapq.heappop(self._ready)
+                    chat = self._chats[chat_id]
+                    self.global_bucket.take(now)
+                    chat.bucket.take(now)
+                    chat.busy = True
+                    return chat_id, chat.jobs.popleft()
+                timeout = delay if timeout is None else min(timeout, delay)
+
+            self._condition.wait(timeout)
+
+    def _finish(self, chat_id, chat: _ChatQueue, job: _Job, retry_after: float = None) -> None:
+        """Освобождает чат после отправки (под блокировкой)"""
+        now = time.monotonic()
+        chat.busy = False
+
+        if retry_after is not None:
+            chat.jobs.appendleft(job)
+            chat.bucket.pause(now, retry_after)
+            self.global_bucket.pause(now, retry_after)
+        else:
+            self._pending -= 1
+
+        if chat.jobs:
+            self._schedule(chat_id, chat, now)
+        else:
+            chat.idle_since = now
+            self._forget_idle(now)
+        self._condition.notify_all()
+
+    def _forget_idle(self, now: float) -> None:
+        """Удаляет лимиты давно молчащих чатов, чтобы словарь не рос"""
+        if now - self._swept < IDLE_CHAT_TTL:
+            return
+        self._swept = now
+        for chat_id in [chat_id for chat_id, chat in self._chats.items()
+                        if chat.idle_since is not None and now - chat.idle_since > IDLE_CHAT_TTL]:
+            del self._chats[chat_id]
+
+    # -------------------------------- ОТПРАВКА -------------------------------
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                chat_id, job = self._next_job()
+                if job is None:
+                    return
+                chat = self._chats[chat_id]
+
+            # Отмененное до отправки (ожидавший отказался от результата) не отправляется.
+            # После повтора по 429 задача уже в работе - отменить ее нельзя
+            if not job.future.running() and not job.future.set_running_or_notify_cancel():
+                with self._condition:
+                    self._finish(chat_id, chat, job)
+                continue
+
+            retry_after = None
+            try:
+                job.future.set_result(job.method(*job.args, **job.kwargs))
+            except ApiTelegramException as e:
+                if e.error_code == 429 and job.retries < MAX_RETRIES:
+                    job.retries += 1
+                    retry_after = (e.result_json.get('parameters') or {}).get('retry_after', 1)
+                    logger.warning(f"Лимит Telegram (чат {chat_id}): отправка приостановлена на {retry_after} сек.")
+                else:
+                    job.future.set_exception(e)
+            except Exception as e:
+                job.future.set_exception(e)
+
+            with self._condition:
+                self._finish(chat_id, chat, job, retry_after)
+
+    def join(self, timeout: float = None) -> bool:
+        """Ждет отправки всех поставленных сообщений; False - не дождались"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+        return True
+
+    def stop(self) -> None:
+        """Отправляет оставшиеся сообщения и останавливает потоки"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+        if self.bot is not None:
+            for method_name, method in self._original_methods.items():
+                setattr(self.bot, method_name, method)
+        logger.info("Очередь исходящих сообщений остановлена")
@@ -0,0 +1,142 @@
+import re
+import logging
+
+from models import db, Orders
+
+
+logger = logging.getLogger(__name__)
+
+
+"""
+    Номера телефонов: проверка ввода и приведение к E.164 (+79001234567).
+
+    "+7 (900) 123-45-67", "8 900 123 45 67" и контакт Telegram "79001234567"
+    дают один и тот же номер, который хранится в индексированной колонке
+    Orders.phone_normalized - история заявок клиента ищется одним запросом по индексу.
+
+    Запуск как скрипта заполняет phone_normalized у старых заявок (и исправляет
+    записанные из неполных номеров в 10 цифр):
+        python -m utils.phone
+
+    Номера, которые не приводятся к E.164, отмечаются пустой строкой (NOT_NORMALIZED) -
+    такие заявки не перечитываются при каждом запуске. Исправление неполных номеров
+    выполняется один раз: после него в DB записывается PRAGMA user_version.
+"""
+
+# Допустимые символы в номере, введенном текстом
+PHONE_CHARS = re.compile(r'^[\d\s()+.-]+$')
+NON_DIGITS = re.compile(r'\D')
+
+COUNTRY_CODE = '7'
+MOBILE_PREFIX = '9'  # Мобильные номера без кода страны (10 цифр)
+BACKFILL_BATCH = 500
+NOT_NORMALIZED = ''  # phone_normalized заявки, номер которой не приводится к E.164 (уже проверен)
+REPAIRED_VERSION = 1  # user_version DB после исправления номеров из 10 цифр (repair_orders)
+
+
+def is_valid_phone(phone: str) -> bool:
+    """Номер, введенный текстом: +7900... или 8900... (11 цифр) либо 900... без кода страны (10 цифр)"""
+    if not PHONE_CHARS.match(phone):
+        return False
+
+    digits = NON_DIGITS.sub('', phone)
+    if len(digits) == 11:
+        return digits.startswith(('7', '8'))
+    return len(digits) == 10 and digits.startswith(MOBILE_PREFIX)
+
+
+def normalize_phone(phone: str):
+    """
+    Номер в формате E.164 ('+79001234567'); None, если цифр слишком мало или много.
+    Российские номера: 8XXXXXXXXXX -> +7XXXXXXXXXX, мобильный без кода страны 9XXXXXXXXX -> +79XXXXXXXXX.
+    Другие номера из 10 цифр (неполные 7900.../8900...) - None
+    """
+    if not phone:
+        return None
+
+    digits = NON_DIGITS.sub('', phone)
+    if len(digits) == 11 and digits.startswith('8'):
+        digits = COUNTRY_CODE + digits[1:]
+    elif len(digits) == 10:
+        if not digits.startswith(MOBILE_PREFIX):
+            return None
+        digits = COUNTRY_CODE + digits
+
+    if not 8 <= len(digits) <= 15:
+        return None
+    return '+' + digits
+
+
+def customer_orders(phone: str, limit: int = 10) -> list:
+    """Последние заявки клиента по номеру в любом формате"""
+    normalized = normalize_phone(phone)
+    if normalized is None:
+        return []
+
+    return list(Orders.select()
+                .where(Orders.phone_normalized == normalized)
+                .order_by(Orders.created_date.desc())
+                .limit(limit))
+
+
+def backfill_orders() -> int:
+    """
+    Заполняет Orders.phone_normalized у заявок, сохраненных до появления колонки
+    (и у заявок с номером, который не распознан при сохранении)
+    """
+    filled = 0
+    last_id = 0
+    while True:
+        batch = list(Orders.select(Orders.order_id, Orders.phone)
+                     .where(Orders.phone_normalized.is_null() & (Orders.order_id > last_id))
+                     .order_by(Orders.order_id)
+                     .limit(BACKFILL_BATCH)
+                     .tuples())
+        if not batch:
+            break
+
+        with db.atomic():
+            for order_id, phone in batch:
+                normalized = normalize_phone(phone)
+                Orders.update(phone_normalized=normalized or NOT_NORMALIZED).where(
+                    Orders.order_id == order_id).execute()
+                if normalized:
+                    filled += 1
+
+        last_id = batch[-1][0]
+
+    if filled:
+        logger.info(f"Нормализованы номера телефонов в заявках: {filled}")
+
+    # Однократная миграция: исправление номеров, записанных до проверки неполных номеров
+    if db.user_version < REPAIRED_VERSION:
+        filled += repair_orders()
+        db.user_version = REPAIRED_VERSION
+    return filled
+
+
+def repair_orders() -> int:
+    """
+    Исправляет Orders.phone_normalized, записанные из неполных номеров в 10 цифр
+    (7900... и 8900... сохранялись как +77900... и +78900...)
+    """
+    repaired = 0
+    suspects = list(Orders.select(Orders.order_id, Orders.phone, Orders.phone_normalized)
+                    .where(Orders.phone_normalized.startswith('+77') | Orders.phone_normalized.startswith('+78'))
+                    .tuples())
+
+    with db.atomic():
+        for order_id, phone, stored in suspects:
+            normalized = normalize_phone(phone) or NOT_NORMALIZED
+            if normalized != stored:
+                Orders.update(phone_normalized=normalized).where(Orders.order_id == order_id).execute()
+                repaired += 1
+
+    if repaired:
+        logger.info(f"Исправлены номера телефонов в заявках: {repaired}")
+    return repaired
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    print(f"Заполнено заявок: {backfill_orders()}")
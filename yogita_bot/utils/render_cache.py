@@ -0,0 +1,57 @@
+from collections import namedtuple
+import threading
+
+from utils.catalog import get_catalog
+
+
+"""
+    Кэш готовых ответов информационных разделов.
+
+    Текст (и клавиатура) раздела собираются один раз для версии каталога
+    и хранятся по menu_id. reload_catalog() увеличивает версию контента,
+    после чего кэш сбрасывается при первом обращении.
+"""
+
+RenderedResponse = namedtuple('RenderedResponse', ['text', 'reply_markup'])
+
+
+class RenderCache:
+    """
+    Кэш отрисованных ответов по ключу (menu_id) с инвалидацией по версии контента
+    """
+
+    def __init__(self) -> None:
+        self._entries = {}
+        self._version = None
+        self._lock = threading.Lock()
+
+    def get(self, key, render) -> RenderedResponse:
+        """
+        Готовый ответ по ключу; render(catalog) вызывается только при промахе
+        """
+        catalog = get_catalog()
+        version = catalog.version
+
+        with self._lock:
+            if version != self._version:
+                self._entries = {}
+                self._version = version
+
+            response = self._entries.get(key)
+
+        if response is None:
+            response = render(catalog)
+            with self._lock:
+                if version == self._version:
+                    self._entries[key] = response
+
+        return response
+
+    def clear(self) -> None:
+        """Полный сброс кэша"""
+        with self._lock:
+            self._entries = {}
+            self._version = None
+
+
+render_cache = RenderCache()
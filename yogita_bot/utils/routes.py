@@ -0,0 +1,151 @@
+from bisect import bisect_left
+from collections import namedtuple
+import string
+import threading
+
+from models import Menu
+from utils.catalog import get_catalog
+
+
+"""
+    Индекс маршрутов - разрешение текста кнопки в действие бота за один поиск в памяти.
+
+    Порядок проверки повторяет прежний handle_menu_selection:
+    служебные кнопки -> 'Записаться на "..."' -> точное название программы ->
+    точное название пункта меню -> единственное частичное совпадение в программах ->
+    единственное частичное совпадение в меню.
+
+    Точные совпадения (служебные кнопки и названия) собраны в один словарь,
+    частичные ищутся по суффиксному массиву названий.
+"""
+
+# Виды маршрутов
+ROUTE_ORDER = 'order'                  # Записаться на занятие
+ROUTE_MAIN_MENU = 'main_menu'          # Назад в меню
+ROUTE_BACK = 'back'                    # Назад
+ROUTE_FAQ = 'faq'                      # Назад к вопросам
+ROUTE_PROGRAM_ORDER = 'program_order'  # Записаться на "<программа>"
+ROUTE_PROGRAM = 'program'              # Описание программы
+ROUTE_MENU = 'menu'                    # Пункт меню
+ROUTE_NOT_FOUND = 'not_found'
+
+SPECIAL_BUTTONS = {
+    'Записаться на занятие': ROUTE_ORDER,
+    'Назад в меню': ROUTE_MAIN_MENU,
+    'Назад': ROUTE_BACK,
+    'Назад к вопросам': ROUTE_FAQ,
+}
+
+PROGRAM_ORDER_PREFIX = 'Записаться на "'
+
+# Приведение к нижнему регистру только латиницы (так сравнивает LIKE в SQLite)
+ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+Route = namedtuple('Route', ['kind', 'target'])
+
+NOT_FOUND = Route(ROUTE_NOT_FOUND, None)
+
+
+class SubstringIndex:
+    """
+    Суффиксный массив по названиям: поиск записей, название которых содержит строку
+    """
+
+    def __init__(self, items) -> None:
+        """items - пары (название, значение)"""
+        suffixes = []
+        for owner, (title, _) in enumerate(items):
+            title = title.translate(ASCII_LOWER)
+            suffixes.extend((title[start:], owner) for start in range(len(title)))
+
+        suffixes.sort()
+        self._suffixes = [suffix for suffix, _ in suffixes]
+        self._owners = [owner for _, owner in suffixes]
+        self._values = [value for _, value in items]
+        self._max_length = max((len(title) for title, _ in items), default=0)
+
+    def find_unique(self, text: str):
+        """
+        Значение единственной записи, содержащей text, иначе None
+        """
+        if not self._values or len(text) > self._max_length:
+            return None
+
+        if not text:
+            # Пустая строка содержится в любом названии
+            return self._values[0] if len(self._values) == 1 else None
+
+        pattern = text.translate(ASCII_LOWER)
+        position = bisect_left(self._suffixes, pattern)
+
+        found = None
+        while position < len(self._suffixes) and self._suffixes[position].startswith(pattern):
+            owner = self._owners[position]
+            if found is not None and owner != found:
+                return None
+            found = owner
+            position += 1
+
+        return None if found is None else self._values[found]
+
+
+class RouteIndex:
+    """
+    Индекс маршрутов для одной версии каталога
+    """
+
+    def __init__(self, catalog) -> None:
+        self.version = catalog.version
+
+        # Приоритет: служебные кнопки > программы > пункты меню
+        exact = {}
+        for menu_item in catalog.rows(Menu):
+            exact.setdefault(menu_item.menu_title, Route(ROUTE_MENU, menu_item))
+
+        programs = {}
+        for program in catalog.programs:
+            programs.setdefault(program.program_title, Route(ROUTE_PROGRAM, program))
+        exact.update(programs)
+
+        # Названия с префиксом записи обрабатываются как запись на программу
+        self._exact = {text: route for text, route in exact.items() if not text.startswith(PROGRAM_ORDER_PREFIX)}
+        self._exact.update((text, Route(kind, None)) for text, kind in SPECIAL_BUTTONS.items())
+
+        self._programs = SubstringIndex([(p.program_title, Route(ROUTE_PROGRAM, p)) for p in catalog.programs])
+        self._menus = SubstringIndex([(m.menu_title, Route(ROUTE_MENU, m)) for m in catalog.rows(Menu)])
+
+    def resolve(self, text: str) -> Route:
+        """Разрешает текст сообщения в маршрут"""
+        route = self._exact.get(text)
+        if route:
+            return route
+
+        if text.startswith(PROGRAM_ORDER_PREFIX):
+            program_title = text.replace(PROGRAM_ORDER_PREFIX, '').replace('"', '')
+            return Route(ROUTE_PROGRAM_ORDER, program_title)
+
+        return self._programs.find_unique(text) or self._menus.find_unique(text) or NOT_FOUND
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def get_route_index() -> RouteIndex:
+    """Индекс для текущей версии каталога (перестраивается после reload_catalog)"""
+    global _index
+
+    catalog = get_catalog()
+    index = _index
+    if index is None or index.version != catalog.version:
+        with _lock:
+            index = _index
+            if index is None or index.version != catalog.version:
+                index = RouteIndex(catalog)
+                _index = index
+    return index
+
+
+def resolve_route(text: str) -> Route:
+    """Маршрут для текста сообщения"""
+    return get_route_index().resolve(text)
@@ -0,0 +1,199 @@
+from logging.handlers import QueueListener
+import multiprocessing
+import queue
+import signal
+import threading
+import time
+import logging
+
+from telebot import apihelper
+from telebot.types import Update
+
+from utils.logs import log_writer
+from utils.webhook import update_chat_id
+
+
+logger = logging.getLogger(__name__)
+
+
+"""
+    Режим sharded: процесс-супервизор получает обновления (getUpdates или webhook)
+    и раздает их N процессам-обработчикам по hash(chat_id).
+
+    Все обновления одного чата попадают в один процесс и обрабатываются в нем
+    по очереди, поэтому шаги заявки (order_phone -> order_name -> ...) не перемешиваются,
+    а состояние чата живет в горячем слое одного процесса. Каталог и состояния
+    (таблица BotState) общие - одна SQLite DB.
+
+    Процессы запускаются через spawn: каждый сам открывает соединение с DB и
+    загружает каталог. Упавший процесс перезапускается, его очередь сохраняется.
+
+    Записи лога процессов передаются супервизору через multiprocessing.Queue -
+    bot.log пишет только супервизор.
+"""
+
+# Сообщение процессу: перечитать каталог (рассылается всем после /reload админа)
+RELOAD_CATALOG = 'reload_catalog'
+
+RESTART_DELAY = 1.0  # Секунд между проверками процессов
+STOP_TIMEOUT = 5.0  # Секунд ожидания места в очереди процесса для сигнала остановки
+
+
+class _LogForwarder(logging.Handler):
+    """Записи процессов-обработчиков - в логирование супервизора (его поток записи)"""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        logging.getLogger().handle(record)
+
+
+def _worker_main(number: int, updates, worker_init, log_queue) -> None:
+    """Точка входа процесса-обработчика"""
+    # Ctrl+C получает вся группа процессов, останавливает обработчики супервизор
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    log_writer.forward(log_queue)
+
+    from loader import bot
+    from utils.catalog import reload_catalog
+
+    services = worker_init() if worker_init else []
+    logger.info(f"Процесс-обработчик {number} запущен")
+
+    while True:
+        update = updates.get()
+        if update is None:
+            break
+
+        if update == RELOAD_CATALOG:
+            reload_catalog()
+            continue
+
+        try:
+            bot.process_new_updates([Update.de_json(update)])
+        except Exception as e:
+            logger.error(f"Ошибка при обработке обновления {update.get('update_id')}: {e}")
+
+    for service in reversed(services):
+        service.stop()
+    logger.info(f"Процесс-обработчик {number} остановлен")
+
+
+class ShardSupervisor:
+    """
+    Раздает обновления процессам-обработчикам по hash(chat_id)
+    """
+
+    def __init__(self, token: str, workers: int, queue_size: int, worker_init=None, admin_chat_id=None) -> None:
+        """
+        worker_init() - подготовка процесса-обработчика (каталог, фильтры, сервисы);
+        возвращает список сервисов, которые нужно остановить при завершении процесса
+        """
+        self.token = token
+        self.worker_init = worker_init
+        self.admin_chat_id = str(admin_chat_id) if admin_chat_id else None
+
+        self._context = multiprocessing.get_context('spawn')
+        self._queues = [self._context.Queue(maxsize=max(1, queue_size // workers)) for _ in range(workers)]
+        self._processes = [None] * workers
+        self._log_queue = self._context.Queue()
+        self._log_listener = QueueListener(self._log_queue, _LogForwarder())
+        self._stopped = threading.Event()
+        self._monitor = None
+
+    # ---------------------------- ПРОЦЕССЫ -----------------------------
+
+    def _spawn(self, number: int) -> None:
+        process = self._context.Process(
+            target=_worker_main, args=(number, self._queues[number], self.worker_init, self._log_queue),
+            name=f"ShardWorker-{number}", daemon=True
+        )
+        process.start()
+        self._processes[number] = process
+
+    def start(self) -> None:
+        self._log_listener.start()
+        for number in range(len(self._queues)):
+            self._spawn(number)
+
+        self._monitor = threading.Thread(target=self._watch, name="ShardMonitor", daemon=True)
+        self._monitor.start()
+        logger.info(f"Запущено процессов-обработчиков: {len(self._queues)}")
+
+    def _watch(self) -> None:
+        """Перезапускает завершившиеся процессы-обработчики"""
+        while not self._stopped.wait(RESTART_DELAY):
+            for number, process in enumerate(self._processes):
+                if not process.is_alive():
+                    logger.error(f"Процесс-обработчик {number} завершился (код {process.exitcode}), перезапуск")
+                    self._spawn(number)
+
+    # ----------------------------- ОБНОВЛЕНИЯ --------------------------
+
+    def _is_reload(self, update: dict) -> bool:
+        message = update.get('message') or {}
+        return (self.admin_chat_id is not None and message.get('text') == '/reload'
+                and str(message.get('chat', {}).get('id')) == self.admin_chat_id)
+
+    def submit(self, update: dict, block: bool = False) -> bool:
+        """Передает обновление процессу его чата; False, если очередь процесса переполнена"""
+        number = hash(update_chat_id(update)) % len(self._queues)
+        try:
+            self._queues[number].put(update, block=block)
+        except queue.Full:
+            logger.warning(f"Очередь процесса {number} переполнена, update_id={update.get('update_id')}")
+            return False
+
+        if self._is_reload(update):
+            for other, updates in enumerate(self._queues):
+                if other == number:
+                    continue
+                try:
+                    updates.put_nowait(RELOAD_CATALOG)
+                except queue.Full:
+                    logger.warning(f"Очередь процесса {other} переполнена, каталог в нем не перечитан "
+                                   f"(повторите /reload)")
+        return True
+
+    def poll(self, timeout: int = 60) -> None:
+        """Получает обновления через getUpdates до вызова stop()"""
+        offset = None
+        while not self._stopped.is_set():
+            try:
+                updates = apihelper.get_updates(self.token, offset=offset, timeout=timeout,
+                                                long_polling_timeout=timeout)
+            except Exception as e:
+                logger.error(f"Ошибка получения обновлений: {e}")
+                time.sleep(RESTART_DELAY)
+                continue
+
+            for update in updates:
+                # Ожидание места в очереди - естественное торможение опроса при перегрузке
+                self.submit(update, block=True)
+                offset = update['update_id'] + 1
+
+    def wait(self) -> None:
+        """Блокирует вызывающий поток до остановки"""
+        self._stopped.wait()
+
+    def stop(self) -> None:
+        """Дожидается обработки принятых обновлений и останавливает процессы"""
+        self._stopped.set()
+        if self._monitor:
+            self._monitor.join()
+            self._monitor = None
+
+        for number, updates in enumerate(self._queues):
+            try:
+                updates.put(None, timeout=STOP_TIMEOUT)
+            except queue.Full:
+                # Процесс не разбирает очередь (завис или завершился) - останавливается принудительно
+                logger.error(f"Очередь процесса {number} переполнена, процесс остановлен принудительно")
+                if self._processes[number] is not None:
+                    self._processes[number].terminate()
+        for process in self._processes:
+            if process is None:
+                continue
+            process.join(timeout=30)
+            if process.is_alive():
+                process.terminate()
+        logger.info("Процессы-обработчики остановлены")
+        self._log_listener.stop()
@@ -0,0 +1,222 @@
+from collections import OrderedDict
+from datetime import datetime
+import json
+import threading
+import logging
+
+from telebot.storage import StateStorageBase, StateContext
+
+from models import db, BotState
+
+
+logger = logging.getLogger(__name__)
+
+
+"""
+    Хранилище состояний диалогов в SQLite (таблица BotState).
+
+    Чтение и запись идут в памяти (горячий слой), как в StateMemoryStorage.
+    Измененные записи копятся и сохраняются в DB фоновым потоком одной транзакцией:
+    раз в STATE_FLUSH_INTERVAL секунд или сразу после STATE_FLUSH_BATCH изменений.
+    Шаг заявки не ждет записи в DB, а недозаполненная заявка переживает перезапуск
+    (теряются только изменения последнего интервала при аварийном завершении).
+
+    В памяти держится не больше cache_size записей: давно не использованные
+    и уже сохраненные вытесняются и при следующем обращении читаются из DB.
+"""
+
+# Запись состояния в горячем слое: {'state': str, 'data': dict} или None (состояния нет)
+_ABSENT = None
+
+
+class SQLiteStateStorage(StateStorageBase):
+    """
+    Хранилище состояний telebot с записью в SQLite в фоне
+    """
+
+    def __init__(self, flush_interval: float = 1.0, flush_batch: int = 200, cache_size: int = 10000) -> None:
+        super().__init__()
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self.cache_size = cache_size
+
+        self._entries = OrderedDict()  # (chat_id, user_id) -> запись
+        self._dirty = set()            # Ключи, ожидающие записи в DB
+        self._lock = threading.RLock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+    # ----------------------------- ГОРЯЧИЙ СЛОЙ ------------------------------
+
+    def _get(self, chat_id, user_id):
+        """Запись из памяти; при промахе - из DB"""
+        key = (chat_id, user_id)
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+        entry = self._load(chat_id, user_id)
+        self._entries[key] = entry
+        self._evict()
+        return entry
+
+    def _put(self, chat_id, user_id, entry) -> None:
+        key = (chat_id, user_id)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        self._dirty.add(key)
+
+        if len(self._dirty) >= self.flush_batch:
+            self._wakeup.set()
+        self._evict()
+
+    def _evict(self) -> None:
+        """Вытесняет давно не использованные записи, уже сохраненные в DB"""
+        if len(self._entries) <= self.cache_size:
+            return
+
+        for key in list(self._entries):
+            if len(self._entries) <= self.cache_size:
+                break
+            if key not in self._dirty:
+                del self._entries[key]
+
+    @staticmethod
+    def _load(chat_id, user_id):
+        try:
+            row = BotState.get_or_none((BotState.chat_id == chat_id) & (BotState.user_id == user_id))
+        except Exception as e:
+            logger.error(f"Ошибка чтения состояния {chat_id}/{user_id} из DB: {e}")
+            return _ABSENT
+
+        if row is None:
+            return _ABSENT
+        return {'state': row.state, 'data': json.loads(row.data or '{}')}
+
+    # --------------------------- ИНТЕРФЕЙС TELEBOT ---------------------------
+
+    def set_state(self, chat_id, user_id, state):
+        if hasattr(state, 'name'):
+            state = state.name
+
+        with self._lock:
+            entry = self._get(chat_id, user_id)
+            if entry is _ABSENT:
+                entry = {'state': state, 'data': {}}
+            else:
+                entry['state'] = state
+            self._put(chat_id, user_id, entry)
+        return True
+
+    def delete_state(self, chat_id, user_id):
+        with self._lock:
+            if self._get(chat_id, user_id) is _ABSENT:
+                return False
+            self._put(chat_id, user_id, _ABSENT)
+        return True
+
+    def get_state(self, chat_id, user_id):
+        with self._lock:
+            entry = self._get(chat_id, user_id)
+            return None if entry is _ABSENT else entry['state']
+
+    def get_data(self, chat_id, user_id):
+        with self._lock:
+            entry = self._get(chat_id, user_id)
+            return None if entry is _ABSENT else entry['data']
+
+    def reset_data(self, chat_id, user_id):
+        with self._lock:
+            entry = self._get(chat_id, user_id)
+            if entry is _ABSENT:
+                return False
+            entry['data'] = {}
+            self._put(chat_id, user_id, entry)
+        return True
+
+    def set_data(self, chat_id, user_id, key, value):
+        with self._lock:
+            entry = self._get(chat_id, user_id)
+            if entry is _ABSENT:
+                raise RuntimeError('chat_id {} and user_id {} does not exist'.format(chat_id, user_id))
+            entry['data'][key] = value
+            self._put(chat_id, user_id, entry)
+        return True
+
+    def get_interactive_data(self, chat_id, user_id):
+        return StateContext(self, chat_id, user_id)
+
+    def save(self, chat_id, user_id, data):
+        with self._lock:
+            entry = self._get(chat_id, user_id)
+            if entry is _ABSENT:
+                # Как в StateMemoryStorage: сохранять данные можно только при наличии состояния
+                raise KeyError(chat_id)
+            entry['data'] = data
+            self._put(chat_id, user_id, entry)
+
+    # ------------------------------ ЗАПИСЬ В DB ------------------------------
+
+    def flush(self) -> int:
+        """Сохраняет накопленные изменения одной транзакцией; возвращает их количество"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._dirty:
+                    return 0
+
+                keys = self._dirty
+                self._dirty = set()
+
+                now = datetime.now().replace(microsecond=0)
+                rows, deleted = [], []
+                for key in keys:
+                    entry = self._entries.get(key)
+                    if entry is _ABSENT:
+                        deleted.append(key)
+                    else:
+                        rows.append({
+                            'chat_id': key[0], 'user_id': key[1], 'state': entry['state'],
+                            'data': json.dumps(entry['data'], ensure_ascii=False, default=str),
+                            'updated_date': now
+                        })
+
+            try:
+                with db.atomic():
+                    if rows:
+                        BotState.insert_many(rows).on_conflict_replace().execute()
+                    for chat_id, user_id in deleted:
+                        BotState.delete().where(
+                            (BotState.chat_id == chat_id) & (BotState.user_id == user_id)
+                        ).execute()
+            except Exception as e:
+                logger.error(f"Ошибка записи состояний в DB ({len(keys)}): {e}")
+                with self._lock:
+                    # Повторим при следующей записи
+                    self._dirty.update(keys)
+                return 0
+
+            return len(keys)
+
+    def _run(self) -> None:
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def start(self) -> None:
+        """Запускает фоновую запись в DB"""
+        self._thread = threading.Thread(target=self._run, name="StateFlusher", daemon=True)
+        self._thread.start()
+        logger.info(f"Хранилище состояний SQLite: запись в DB каждые {self.flush_interval} сек.")
+
+    def stop(self) -> None:
+        """Останавливает фоновую запись и сохраняет оставшиеся изменения"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        saved = self.flush()
+        logger.info(f"Состояния сохранены в DB при остановке: {saved}")
@@ -0,0 +1,97 @@
+from collections import OrderedDict, namedtuple
+import threading
+import logging
+
+from peewee import EXCLUDED, Expression, OP
+
+from config_data.config import USER_CACHE_SIZE
+from models import User
+
+
+logger = logging.getLogger(__name__)
+
+
+"""
+    Реестр пользователей: запись профиля (username, first_name, last_name) в таблицу user
+    только при его изменении.
+
+    Недавно встреченные профили хранятся в LRU-кэше: повторный /start с тем же
+    профилем не обращается к DB. При промахе профиль читается одним SELECT.
+    Новый или изменившийся профиль сохраняется одним запросом
+    INSERT ... ON CONFLICT (user_id) DO UPDATE ... WHERE <поля отличаются>.
+"""
+
+UserProfile = namedtuple('UserProfile', ['username', 'first_name', 'last_name'])
+
+PROFILE_FIELDS = (User.username, User.first_name, User.last_name)
+
+
+class UserRegistry:
+    """
+    Профили пользователей с LRU-кэшем и upsert при изменении
+    """
+
+    def __init__(self, cache_size: int = 10000) -> None:
+        self.cache_size = cache_size
+        self._profiles = OrderedDict()  # user_id -> UserProfile
+        self._lock = threading.Lock()
+
+    def touch(self, telegram_user) -> bool:
+        """
+        Сохраняет профиль пользователя Telegram, если он новый или изменился.
+        Возвращает True, если пользователя еще не было в DB
+        """
+        user_id = telegram_user.id
+        profile = UserProfile(telegram_user.username, telegram_user.first_name, telegram_user.last_name)
+
+        with self._lock:
+            known = self._profiles.get(user_id)
+            if known is not None:
+                self._profiles.move_to_end(user_id)
+
+        if known == profile:
+            return False
+
+        created = False
+        if known is None:
+            row = User.select(*PROFILE_FIELDS).where(User.user_id == user_id).tuples().first()
+            created = row is None
+            known = UserProfile(*row) if row else None
+
+        if known != profile:
+            self._upsert(user_id, profile)
+
+        self._remember(user_id, profile)
+        return created
+
+    @staticmethod
+    def _upsert(user_id: int, profile: UserProfile) -> None:
+        """Один запрос: вставка нового пользователя или обновление отличающихся полей"""
+        changed = None
+        for field in PROFILE_FIELDS:
+            differs = Expression(field, OP.IS_NOT, getattr(EXCLUDED, field.column_name))
+            changed = differs if changed is None else changed | differs
+
+        User.insert(user_id=user_id, **profile._asdict()).on_conflict(
+            conflict_target=[User.user_id],
+            update={field: getattr(EXCLUDED, field.column_name) for field in PROFILE_FIELDS},
+            where=changed
+        ).execute()
+
+    def _remember(self, user_id: int, profile: UserProfile) -> None:
+        with self._lock:
+            self._profiles[user_id] = profile
+            self._profiles.move_to_end(user_id)
+            while len(self._profiles) > self.cache_size:
+                self._profiles.popitem(last=False)
+
+    def forget(self, user_id: int = None) -> None:
+        """Сброс кэша (одного пользователя или всего)"""
+        with self._lock:
+            if user_id is None:
+                self._profiles.clear()
+            else:
+                self._profiles.pop(user_id, None)
+
+
+user_registry = UserRegistry(cache_size=USER_CACHE_SIZE)
@@ -0,0 +1,101 @@
+from datetime import datetime
+import threading
+import logging
+
+from config_data.config import VISIT_FLUSH_INTERVAL, VISIT_FLUSH_BATCH
+from models import db, Date
+
+
+logger = logging.getLogger(__name__)
+
+
+"""
+    Журнал визитов (таблица Date) с пакетной записью.
+
+    /start только добавляет запись в буфер в памяти. Фоновый поток сохраняет
+    буфер одним insert_many (одна транзакция) раз в VISIT_FLUSH_INTERVAL секунд
+    или сразу после VISIT_FLUSH_BATCH записей; остаток сохраняется при остановке бота.
+
+    Пока фоновый поток не запущен (скрипты, проверки), записи сохраняются сразу.
+"""
+
+
+class VisitLog:
+    """
+    Буфер визитов пользователей с фоновой записью в DB
+    """
+
+    def __init__(self, flush_interval: float = 5.0, flush_batch: int = 500) -> None:
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+    def record(self, user_id: int, title: str, description: str, due_date: datetime = None) -> None:
+        """Добавляет визит в буфер"""
+        row = {
+            'user': user_id,
+            'title': title,
+            'description': description,
+            'due_date': due_date or datetime.now().replace(microsecond=0)
+        }
+
+        with self._lock:
+            self._buffer.append(row)
+            pending = len(self._buffer)
+
+        if self._thread is None:
+            self.flush()
+        elif pending >= self.flush_batch:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """Сохраняет буфер одной транзакцией; возвращает количество записей"""
+        with self._flush_lock:
+            with self._lock:
+                rows, self._buffer = self._buffer, []
+
+            if not rows:
+                return 0
+
+            try:
+                with db.atomic():
+                    Date.insert_many(rows).execute()
+            except Exception as e:
+                logger.error(f"Ошибка записи визитов в DB ({len(rows)}): {e}")
+                with self._lock:
+                    # Повторим при следующей записи
+                    self._buffer[:0] = rows
+                return 0
+
+            return len(rows)
+
+    def _run(self) -> None:
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def start(self) -> None:
+        """Запускает фоновую запись в DB"""
+        self._thread = threading.Thread(target=self._run, name="VisitFlusher", daemon=True)
+        self._thread.start()
+        logger.info(f"Журнал визитов: запись в DB каждые {self.flush_interval} сек.")
+
+    def stop(self) -> None:
+        """Останавливает фоновую запись и сохраняет оставшиеся визиты"""
+        self._stopping = True
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        saved = self.flush()
+        logger.info(f"Визиты сохранены в DB при остановке: {saved}")
+
+
+visit_log = VisitLog(flush_interval=VISIT_FLUSH_INTERVAL, flush_batch=VISIT_FLUSH_BATCH)
@@ -0,0 +1,206 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import hmac
+import json
+import queue
+import ssl
+import threading
+import logging
+
+from telebot.types import Update
+
+
+logger = logging.getLogger(__name__)
+
+
+"""
+    Режим webhook: встроенный HTTP-сервер принимает POST-запросы Telegram с обновлениями,
+    проверяет секретный токен и передает обновления в ограниченный пул потоков.
+
+    Обновления одного чата всегда попадают в одну очередь, поэтому шаги заявки
+    (order_phone -> order_name -> ...) обрабатываются по порядку.
+
+    Локальная проверка - отправить сохраненное обновление:
+        curl -X POST http://127.0.0.1:8443/webhook \\
+             -H 'X-Telegram-Bot-Api-Secret-Token: <WEBHOOK_SECRET>' \\
+             -H 'Content-Type: application/json' -d @update.json
+"""
+
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+MAX_BODY_SIZE = 1024 * 1024  # 1 MB
+
+# Поля обновления, из которых берется чат (или пользователь) для маршрутизации
+_CHAT_SOURCES = (
+    ('message', 'chat'), ('edited_message', 'chat'), ('channel_post', 'chat'),
+    ('edited_channel_post', 'chat'), ('my_chat_member', 'chat'), ('chat_member', 'chat'),
+    ('chat_join_request', 'chat'), ('message_reaction', 'chat'), ('message_reaction_count', 'chat'),
+    ('callback_query', 'from'), ('inline_query', 'from'), ('chosen_inline_result', 'from'),
+    ('shipping_query', 'from'), ('pre_checkout_query', 'from'), ('poll_answer', 'user'),
+)
+
+
+def _field(payload, key: str):
+    """Поле JSON обновления (dict) или объекта telebot ('from' - атрибут from_user)"""
+    if isinstance(payload, dict):
+        return payload.get(key)
+    return getattr(payload, 'from_user' if key == 'from' else key, None)
+
+
+def update_chat_id(update) -> int:
+    """
+    ID чата обновления (для callback_query - чат исходного сообщения); иначе update_id.
+    update - JSON обновления (webhook, sharded) или telebot Update (async)
+    """
+    callback_message = _field(_field(update, 'callback_query'), 'message')
+    if callback_message:
+        return _field(_field(callback_message, 'chat'), 'id')
+
+    for update_type, key in _CHAT_SOURCES:
+        payload = _field(update, update_type)
+        if payload:
+            source = _field(payload, key)
+            if source:
+                return _field(source, 'id')
+
+    return _field(update, 'update_id') or 0
+
+
+class UpdateWorkerPool:
+    """
+    Пул потоков обработки обновлений с ограниченными очередями.
+    Очередь выбирается по chat_id, что сохраняет порядок обновлений внутри чата
+    """
+
+    def __init__(self, bot, workers: int, queue_size: int) -> None:
+        self.bot = bot
+        self._queues = [queue.Queue(maxsize=max(1, queue_size // workers)) for _ in range(workers)]
+        self._threads = []
+
+    def start(self) -> None:
+        for number, updates in enumerate(self._queues):
+            thread = threading.Thread(target=self._run, args=(updates,), name=f"UpdateWorker-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Запущен пул обработки обновлений: {len(self._queues)} потоков")
+
+    def submit(self, update: dict) -> bool:
+        """Ставит обновление в очередь; False, если очередь чата переполнена"""
+        updates = self._queues[hash(update_chat_id(update)) % len(self._queues)]
+        try:
+            updates.put_nowait(update)
+            return True
+        except queue.Full:
+            logger.warning(f"Очередь обновлений переполнена, update_id={update.get('update_id')}")
+            return False
+
+    def _run(self, updates: queue.Queue) -> None:
+        while True:
+            update = updates.get()
+            if update is None:
+                break
+
+            try:
+                self.bot.process_new_updates([Update.de_json(update)])
+            except Exception as e:
+                logger.error(f"Ошибка при обработке обновления {update.get('update_id')}: {e}")
+
+    def stop(self) -> None:
+        """Дожидается обработки уже принятых обновлений и останавливает потоки"""
+        for updates in self._queues:
+            updates.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+
+class WebhookRequestHandler(BaseHTTPRequestHandler):
+    """Обработчик POST-запросов Telegram"""
+
+    server_version = 'YogitaBotWebhook'
+
+    def do_POST(self) -> None:
+        if self.path.split('?', 1)[0] != self.server.webhook_path:
+            self._reply(404)
+            return
+
+        secret = self.server.secret
+        if secret and not hmac.compare_digest(self.headers.get(SECRET_HEADER, ''), secret):
+            logger.warning(f"Отклонен запрос webhook с неверным токеном от {self.client_address[0]}")
+            self._reply(403)
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = 0
+
+        if length <= 0 or length > MAX_BODY_SIZE:
+            self._reply(413 if length > 0 else 400)
+            return
+
+        try:
+            update = json.loads(self.rfile.read(length))
+        except ValueError:
+            self._reply(400)
+            return
+
+        if not isinstance(update, dict) or 'update_id' not in update:
+            self._reply(400)
+            return
+
+        # 503 - Telegram повторит доставку позже
+        self._reply(200 if self.server.dispatch(update) else 503)
+
+    def do_GET(self) -> None:
+        self._reply(405)
+
+    def _reply(self, status: int) -> None:
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args) -> None:
+        logger.debug(f"{self.client_address[0]} - {format % args}")
+
+
+class WebhookServer:
+    """
+    HTTP-сервер webhook: принимает обновления и передает их в dispatch(update) -> bool
+    """
+
+    def __init__(self, dispatch, host: str, port: int, path: str, secret: str = None,
+                 ssl_cert: str = None, ssl_key: str = None) -> None:
+        self._httpd = ThreadingHTTPServer((host, port), WebhookRequestHandler)
+        self._httpd.daemon_threads = True
+        self._httpd.dispatch = dispatch
+        self._httpd.webhook_path = path
+        self._httpd.secret = secret
+
+        if ssl_cert:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(ssl_cert, ssl_key)
+            self._httpd.socket = context.wrap_socket(self._httpd.socket, server_side=True)
+
+        self._thread = None
+        self._stopped = threading.Event()
+
+    @property
+    def port(self) -> int:
+        return self._httpd.server_address[1]
+
+    def start(self) -> None:
+        """Запускает сервер в фоновом потоке"""
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="WebhookServer", daemon=True)
+        self._thread.start()
+        logger.info(f"Webhook-сервер слушает порт {self.port}, путь {self._httpd.webhook_path}")
+
+    def wait(self) -> None:
+        """Блокирует вызывающий поток до остановки сервера"""
+        self._stopped.wait()
+
+    def stop(self) -> None:
+        if self._thread:
+            self._httpd.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._httpd.server_close()
+        self._stopped.set()